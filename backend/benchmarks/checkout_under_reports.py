@@ -0,0 +1,163 @@
+"""
+Checkout latency while reports run.
+
+Seeds order history (BENCH_ORDERS, default 50,000 completed orders) into a
+scratch database, then places orders continuously while report workers
+hammer the item, heatmap, branch performance and dashboard reports and
+stream CSV exports. Checkout p50/p95/p99 is reported for three cases:
+
+  idle     no report traffic
+  shared   reports read through the main client (the old behaviour)
+  split    reports read through the analytics client
+
+The main pool is capped at BENCH_MAIN_POOL (default 20) connections so pool
+contention shows up at modest concurrency. Against the local replica set in
+benchmarks/replica-set.compose.yml the split case also moves report reads
+to the secondaries.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/checkout_under_reports.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_checkout_reports")
+os.environ["MONGO_MAX_POOL_SIZE"] = os.environ.get("BENCH_MAIN_POOL", "20")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+ORDERS = int(os.environ.get("BENCH_ORDERS", 50000))
+DURATION = float(os.environ.get("BENCH_DURATION", 20))
+CHECKOUT_WORKERS = int(os.environ.get("BENCH_CHECKOUT_WORKERS", 10))
+REPORT_WORKERS = int(os.environ.get("BENCH_REPORT_WORKERS", 30))
+
+
+def percentile(sorted_values, pct):
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def seed(http):
+    suffix = uuid.uuid4().hex[:8]
+    response = await http.post("/api/auth/register", json={
+        "email": f"bench.admin.{suffix}@altaj.com", "password": "bench123", "name": "BENCH Admin", "role": "admin"
+    })
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await http.post("/api/branches", headers=admin_headers, json={
+        "name": f"BENCH Branch {suffix}", "address": "Old Hubli, Hubballi",
+        "phone": "+91-836-0000000", "email": f"bench.{suffix}@altaj.com"
+    })
+    branch_id = response.json()["id"]
+    response = await http.post("/api/menu/categories", headers=admin_headers, json={"name": "BENCH Category"})
+    category_id = response.json()["id"]
+    menu_items = []
+    for i in range(40):
+        response = await http.post("/api/menu/items", headers=admin_headers, json={
+            "name": f"BENCH Dish {i}", "description": "Benchmark dish", "category_id": category_id, "base_price": 100 + 5 * i
+        })
+        menu_items.append(response.json())
+
+    random.seed(11)
+    now = datetime.now(timezone.utc)
+    history = []
+    for n in range(ORDERS):
+        created = (now - timedelta(minutes=random.randint(0, 90 * 24 * 60))).isoformat()
+        picks = random.sample(menu_items, 3)
+        history.append({
+            "id": str(uuid.uuid4()), "order_number": f"BENCH{n:07d}", "branch_id": branch_id,
+            "customer_name": "BENCH Customer", "customer_phone": "+91-9876500000", "order_type": "takeaway",
+            "status": "completed", "payment_method": "cod", "payment_status": "paid",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]} for item in picks],
+            "subtotal": 300.0, "tax": 15.0, "total": 315.0, "created_at": created, "updated_at": created
+        })
+    for start in range(0, len(history), 5000):
+        await server.db.orders.insert_many(history[start:start + 5000])
+    await server.rebuild_sales_rollup()
+    return admin_headers, branch_id, menu_items
+
+
+async def checkout_worker(http, branch_id, menu_items, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        picks = random.sample(menu_items, 3)
+        start = time.perf_counter()
+        response = await http.post("/api/orders", json={
+            "customer_name": "BENCH Customer", "customer_phone": "+91-9876500000", "branch_id": branch_id,
+            "order_type": "takeaway", "payment_method": "cod",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]} for item in picks]
+        })
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(response.status_code)
+
+
+async def report_worker(http, headers, branch_id, deadline):
+    while time.perf_counter() < deadline:
+        # A fresh date range each time so the report caches don't absorb the load
+        start_date = (datetime.now(timezone.utc).date() - timedelta(days=random.randint(30, 90))).isoformat()
+        path = random.choice([
+            f"/api/reports/items?branch_id={branch_id}&start_date={start_date}",
+            f"/api/reports/heatmap?branch_id={branch_id}&start_date={start_date}",
+            "/api/reports/branch-performance",
+            f"/api/dashboard/stats?branch_id={branch_id}",
+            f"/api/exports/orders?branch_id={branch_id}&from={start_date}",
+        ])
+        async with http.stream("GET", path, headers=headers) as response:
+            async for _ in response.aiter_raw():
+                pass
+
+
+async def measure(http, admin_headers, branch_id, menu_items, report_workers):
+    deadline = time.perf_counter() + DURATION
+    latencies, errors = [], []
+    await asyncio.gather(
+        *(checkout_worker(http, branch_id, menu_items, deadline, latencies, errors) for _ in range(CHECKOUT_WORKERS)),
+        *(report_worker(http, admin_headers, branch_id, deadline) for _ in range(report_workers)),
+    )
+    latencies.sort()
+    return {
+        "orders": len(latencies),
+        "errors": len(errors),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    analytics_db = server.analytics_db
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+            admin_headers, branch_id, menu_items = await seed(http)
+            results["idle"] = await measure(http, admin_headers, branch_id, menu_items, 0)
+            server.analytics_db = server.db
+            try:
+                results["shared"] = await measure(http, admin_headers, branch_id, menu_items, REPORT_WORKERS)
+            finally:
+                server.analytics_db = analytics_db
+            results["split"] = await measure(http, admin_headers, branch_id, menu_items, REPORT_WORKERS)
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    print(f"{CHECKOUT_WORKERS} checkout and {REPORT_WORKERS} report workers for {DURATION:.0f}s, "
+          f"main pool {os.environ['MONGO_MAX_POOL_SIZE']}, analytics pool {server.analytics_client.options.pool_options.max_pool_size}\n")
+    print(f"{'case':<10}{'orders':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results.items():
+        print(f"{name:<10}{row['orders']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,132 @@
+"""
+Cold start: how long a fresh worker takes to serve its first requests.
+
+Seeds a menu (300 items across 3 branches) into a scratch database on a local
+mongod, then repeatedly starts uvicorn in a new process, with and without
+STARTUP_WARMUP. For each start it reports the time to import server.py, the
+time from spawning the process to the first successful response, and the
+latency of the first and a warm request to the landing page endpoints.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/cold_start.py
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("BENCH_DB_NAME", "altaj_bench_cold_start")
+RUNS = int(os.environ.get("BENCH_RUNS", 5))
+PORT = int(os.environ.get("BENCH_PORT", 8765))
+READY_TIMEOUT = 60
+CREATED_AT = "2024-01-01T00:00:00+00:00"
+
+
+async def seed(db):
+    branch_ids = [str(uuid.uuid4()) for _ in range(3)]
+    await db.branches.insert_many([{
+        "id": branch_id, "name": f"Bench Branch {n}", "address": "Old Hubli, Hubballi",
+        "phone": "+91-836-0000000", "email": f"bench{n}@altaj.com", "is_active": True, "created_at": CREATED_AT
+    } for n, branch_id in enumerate(branch_ids)])
+    categories = [{
+        "id": str(uuid.uuid4()), "name": f"Category {c}", "display_order": c, "is_active": True,
+        "created_at": CREATED_AT
+    } for c in range(12)]
+    await db.menu_categories.insert_many(categories)
+    await db.menu_items.insert_many([{
+        "id": str(uuid.uuid4()), "name": f"Chicken Dum Biryani {i}", "description": "Basmati rice and saffron",
+        "category_id": categories[i % len(categories)]["id"], "base_price": 180 + i % 200,
+        "is_vegetarian": i % 3 == 0, "is_available": True,
+        "branch_ids": None if i % 2 else [branch_ids[i % len(branch_ids)]], "created_at": CREATED_AT
+    } for i in range(300)])
+    return branch_ids[0]
+
+
+def import_seconds(env):
+    code = "import time; start = time.perf_counter(); import server; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def timed_get(http, url):
+    start = time.perf_counter()
+    response = await http.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    return (time.perf_counter() - start) * 1000
+
+
+async def cold_start(env, branch_id):
+    """Spawn a worker and time it up to a served landing page"""
+    paths = {
+        "bootstrap": f"/api/bootstrap?branch_id={branch_id}",
+        "menu items": f"/api/menu/items?branch_id={branch_id}",
+    }
+    spawned = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=30) as http:
+            while True:
+                if time.perf_counter() - spawned > READY_TIMEOUT or process.poll() is not None:
+                    raise RuntimeError("server did not come up")
+                try:
+                    if (await http.get("/api/")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.01)
+            row = {"ready_s": time.perf_counter() - spawned}
+            for name, path in paths.items():
+                row[f"{name} first ms"] = await timed_get(http, path)
+                row[f"{name} warm ms"] = await timed_get(http, path)
+            start = time.perf_counter()
+            response = await http.post("/api/auth/register", json={
+                "email": f"bench.{uuid.uuid4().hex[:8]}@altaj.com", "password": "bench123",
+                "name": "Bench Customer", "role": "customer"
+            })
+            assert response.status_code == 200, response.text
+            row["first register ms"] = (time.perf_counter() - start) * 1000
+            return row
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main():
+    mongo = AsyncIOMotorClient(MONGO_URL)
+    results = {}
+    try:
+        branch_id = await seed(mongo[DB_NAME])
+        for warmup in ("true", "false"):
+            env = {**os.environ, "MONGO_URL": MONGO_URL, "DB_NAME": DB_NAME, "STARTUP_WARMUP": warmup}
+            rows = []
+            for _ in range(RUNS):
+                row = {"import_s": import_seconds(env)}
+                row.update(await cold_start(env, branch_id))
+                rows.append(row)
+            results[f"warmup={warmup}"] = {key: statistics.median(row[key] for row in rows) for key in rows[0]}
+    finally:
+        await mongo.drop_database(DB_NAME)
+        mongo.close()
+
+    print(f"median of {RUNS} cold starts\n")
+    columns = list(next(iter(results.values())))
+    print(f"{'metric':<22}" + "".join(f"{name:>16}" for name in results))
+    for column in columns:
+        print(f"{column:<22}" + "".join(f"{row[column]:>16.3f}" for row in results.values()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
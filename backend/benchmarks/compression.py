@@ -0,0 +1,136 @@
+"""
+Response compression: bytes on the wire and CPU per request.
+
+Seeds a realistic menu (300 items in 12 categories), published reviews and
+100 orders into a scratch database on a local mongod. For each endpoint and
+Accept-Encoding it reports the bytes sent and the process CPU time per
+request. Cached payloads (menu, categories, public reviews) are measured
+twice: precompressed as served, and compressed per request by the
+middleware, to show what precompression saves.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/compression.py
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_compression")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 300))
+CREATED_AT = "2024-01-01T00:00:00+00:00"
+
+
+async def seed():
+    branch_id = str(uuid.uuid4())
+    await server.db.branches.insert_one({
+        "id": branch_id, "name": "Bench Branch", "address": "Old Hubli, Hubballi",
+        "phone": "+91-836-0000000", "email": "bench@altaj.com", "is_active": True, "created_at": CREATED_AT
+    })
+    categories = [{
+        "id": str(uuid.uuid4()), "name": f"Category {c}", "description": "Biryanis, kebabs and curries",
+        "display_order": c, "is_active": True, "created_at": CREATED_AT
+    } for c in range(12)]
+    await server.db.menu_categories.insert_many(categories)
+    items = [{
+        "id": str(uuid.uuid4()),
+        "name": f"Chicken Dum Biryani {i}",
+        "description": "Basmati rice slow cooked with marinated chicken, saffron and fried onions",
+        "category_id": categories[i % len(categories)]["id"],
+        "base_price": 180 + i % 200,
+        "image_url": f"https://images.altaj.example/menu/{i}.jpg",
+        "is_vegetarian": i % 3 == 0,
+        "is_available": True,
+        "branch_ids": None,
+        "created_at": CREATED_AT
+    } for i in range(300)]
+    await server.db.menu_items.insert_many(items)
+    await server.db.reviews.insert_many([{
+        "id": str(uuid.uuid4()), "order_id": str(uuid.uuid4()), "customer_name": "Bench Customer",
+        "star_rating": 5, "feedback_text": "Great biryani, quick delivery and friendly staff.",
+        "status": "published", "created_at": CREATED_AT
+    } for _ in range(10)])
+    await server.db.orders.insert_many([{
+        "id": str(uuid.uuid4()), "order_number": f"ORD{n:06d}", "branch_id": branch_id,
+        "customer_name": "Bench Customer", "customer_phone": "+91-9876500000",
+        "order_type": "takeaway", "status": "pending", "payment_method": "cod", "payment_status": "pending",
+        "items": [{"menu_item_id": items[k]["id"], "menu_item_name": items[k]["name"], "quantity": 1,
+                   "unit_price": items[k]["base_price"], "total_price": items[k]["base_price"]} for k in range(3)],
+        "subtotal": 600.0, "tax": 30.0, "total": 630.0,
+        "created_at": CREATED_AT, "updated_at": CREATED_AT
+    } for n in range(100)])
+    return branch_id
+
+
+async def measure(http, url, encoding, headers):
+    wire_bytes = 0
+    cpu_start = time.process_time()
+    for _ in range(REQUESTS):
+        async with http.stream("GET", url, headers={"Accept-Encoding": encoding, **headers}) as response:
+            assert response.status_code == 200, response.status_code
+            async for chunk in response.aiter_raw():
+                wire_bytes += len(chunk)
+    cpu = time.process_time() - cpu_start
+    return wire_bytes / REQUESTS, cpu / REQUESTS * 1000
+
+
+def clear_payload_caches():
+    for cache in server.QueryCache.registry.values():
+        cache.clear()
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    encodings = ["identity", *reversed(server.COMPRESSION_ENCODINGS)]
+    rows = []
+    try:
+        branch_id = await seed()
+        cached = {
+            "menu items": f"/api/menu/items?branch_id={branch_id}",
+            "categories": "/api/menu/categories",
+            "public reviews": "/api/reviews/public",
+        }
+        dynamic = {"orders (per request)": f"/api/orders?branch_id={branch_id}&limit=100"}
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            response = await http.post("/api/auth/register", json={
+                "email": f"bench.{uuid.uuid4().hex[:8]}@altaj.com", "password": "bench123",
+                "name": "BENCH Admin", "role": "admin"
+            })
+            admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for name, url in {**cached, **dynamic}.items():
+                for encoding in encodings:
+                    await measure(http, url, encoding, admin_headers)  # warm the caches
+                    rows.append((name, encoding, *await measure(http, url, encoding, admin_headers)))
+
+            # Same cached payloads without precompression: the middleware
+            # compresses them on every request instead
+            min_size = server.COMPRESSION_MIN_SIZE
+            server.COMPRESSION_MIN_SIZE = 1 << 30
+            clear_payload_caches()
+            try:
+                for name, url in cached.items():
+                    for encoding in encodings[1:]:
+                        await measure(http, url, encoding, admin_headers)
+                        rows.append((f"{name} (per request)", encoding, *await measure(http, url, encoding, admin_headers)))
+            finally:
+                server.COMPRESSION_MIN_SIZE = min_size
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    print(f"{REQUESTS} requests per row\n")
+    print(f"{'endpoint':<30}{'encoding':<10}{'bytes':>10}{'CPU ms/req':>12}")
+    for name, encoding, wire_bytes, cpu_ms in sorted(rows, key=lambda row: row[0]):
+        print(f"{name:<30}{encoding:<10}{wire_bytes:>10.0f}{cpu_ms:>12.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
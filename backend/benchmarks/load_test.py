@@ -0,0 +1,297 @@
+"""
+Load test for the API hot paths.
+
+Drives a realistic mix of checkout, kitchen polling, menu browsing, order
+status transitions and reports, then reports throughput and p50/p95/p99 per
+scenario. Results are written to benchmarks/results/ as JSON and compared to
+a stored baseline; a regression beyond the tolerance fails the run.
+
+In-process (default) the FastAPI app is driven through httpx's ASGI
+transport against a scratch database on a local mongod, which is dropped
+afterwards. With --base-url the same mix runs against a live server.
+
+    python benchmarks/load_test.py --duration 30 --concurrency 20
+    python benchmarks/load_test.py --save-baseline
+    python benchmarks/load_test.py --base-url http://localhost:8001
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+DEFAULT_BASELINE = BENCH_DIR / "baselines" / "load_test.json"
+
+# scenario -> relative weight in the request mix
+SCENARIO_WEIGHTS = {
+    "checkout": 20,
+    "kitchen_poll": 35,
+    "menu_browse": 30,
+    "status_transition": 10,
+    "reports": 5,
+}
+
+STATUS_FLOW = ["confirmed", "preparing", "ready", "completed"]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LoadTest:
+    def __init__(self, http, concurrency, duration):
+        self.http = http
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = {name: [] for name in SCENARIO_WEIGHTS}
+        self.errors = {name: 0 for name in SCENARIO_WEIGHTS}
+        # Orders still moving through STATUS_FLOW: order_id -> next step index
+        self.open_orders = {}
+
+    async def setup(self):
+        """Create an admin, a branch and a small menu through the public API"""
+        suffix = uuid.uuid4().hex[:8]
+        response = await self.http.post("/api/auth/register", json={
+            "email": f"bench.admin.{suffix}@altaj.com",
+            "password": "bench123",
+            "name": "BENCH Admin",
+            "role": "admin"
+        })
+        response.raise_for_status()
+        self.admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await self.http.post("/api/branches", headers=self.admin_headers, json={
+            "name": f"BENCH Branch {suffix}",
+            "address": "Old Hubli, Hubballi",
+            "phone": "+91-836-0000000",
+            "email": f"bench.{suffix}@altaj.com"
+        })
+        response.raise_for_status()
+        self.branch_id = response.json()["id"]
+
+        self.menu_items = []
+        for c in range(5):
+            response = await self.http.post("/api/menu/categories", headers=self.admin_headers, json={
+                "name": f"BENCH Category {c}", "display_order": c
+            })
+            response.raise_for_status()
+            category_id = response.json()["id"]
+            for i in range(20):
+                response = await self.http.post("/api/menu/items", headers=self.admin_headers, json={
+                    "name": f"BENCH Dish {c}-{i}",
+                    "description": "Benchmark dish",
+                    "category_id": category_id,
+                    "base_price": 100 + 10 * i
+                })
+                response.raise_for_status()
+                self.menu_items.append(response.json())
+
+    async def checkout(self):
+        picks = random.sample(self.menu_items, 3)
+        items = []
+        for item in picks:
+            quantity = random.randint(1, 3)
+            items.append({
+                "menu_item_id": item["id"],
+                "menu_item_name": item["name"],
+                "quantity": quantity,
+                "unit_price": item["base_price"],
+                "total_price": item["base_price"] * quantity
+            })
+        response = await self.http.post("/api/orders", json={
+            "customer_name": "BENCH Customer",
+            "customer_phone": "+91-9876500000",
+            "branch_id": self.branch_id,
+            "order_type": "takeaway",
+            "items": items,
+            "payment_method": "cod"
+        })
+        if response.status_code == 200:
+            self.open_orders[response.json()["id"]] = 0
+        return response
+
+    async def kitchen_poll(self):
+        return await self.http.get(f"/api/orders?branch_id={self.branch_id}&limit=100")
+
+    async def menu_browse(self):
+        response = await self.http.get("/api/menu/categories")
+        if response.status_code != 200:
+            return response
+        return await self.http.get(f"/api/menu/items?branch_id={self.branch_id}")
+
+    async def status_transition(self):
+        if not self.open_orders:
+            return await self.checkout()
+        order_id = random.choice(list(self.open_orders))
+        step = self.open_orders[order_id]
+        if step + 1 >= len(STATUS_FLOW):
+            del self.open_orders[order_id]
+        else:
+            self.open_orders[order_id] = step + 1
+        return await self.http.put(f"/api/orders/{order_id}/status", json={"status": STATUS_FLOW[step]})
+
+    async def reports(self):
+        if random.random() < 0.5:
+            return await self.http.get(f"/api/reports/sales?branch_id={self.branch_id}", headers=self.admin_headers)
+        return await self.http.get(f"/api/dashboard/stats?branch_id={self.branch_id}", headers=self.admin_headers)
+
+    async def worker(self, deadline):
+        names = list(SCENARIO_WEIGHTS)
+        weights = list(SCENARIO_WEIGHTS.values())
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, name)()
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if ok:
+                self.latencies[name].append(elapsed)
+            else:
+                self.errors[name] += 1
+
+    async def run(self):
+        deadline = time.perf_counter() + self.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(deadline) for _ in range(self.concurrency)))
+        return self.summarize(time.perf_counter() - started)
+
+    def summarize(self, elapsed):
+        scenarios = {}
+        all_latencies = []
+        for name, latencies in self.latencies.items():
+            values = sorted(latencies)
+            all_latencies.extend(values)
+            scenarios[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        all_latencies.sort()
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration_s": round(elapsed, 2),
+            "concurrency": self.concurrency,
+            "total": {
+                "requests": len(all_latencies),
+                "errors": sum(self.errors.values()),
+                "throughput_rps": round(len(all_latencies) / elapsed, 2),
+                "p50_ms": round(percentile(all_latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(all_latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(all_latencies, 99) * 1000, 2),
+            },
+            "scenarios": scenarios,
+        }
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """List of human-readable regressions beyond ``tolerance`` (a fraction)"""
+    regressions = []
+    for name, current in [("total", result["total"]), *result["scenarios"].items()]:
+        previous = baseline["total"] if name == "total" else baseline.get("scenarios", {}).get(name)
+        if not previous or not previous.get("requests"):
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if previous[key] and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {previous[key]} -> {current[key]}")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']}")
+    if result["total"]["errors"] > baseline["total"].get("errors", 0):
+        regressions.append(f"errors: {baseline['total'].get('errors', 0)} -> {result['total']['errors']}")
+    return regressions
+
+
+def print_result(result):
+    print(f"\n{'scenario':<18}{'reqs':>8}{'errs':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in [*result["scenarios"].items(), ("total", result["total"])]:
+        print(f"{name:<18}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+
+async def run_in_process(args):
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = args.db_name
+    sys.path.insert(0, str(BENCH_DIR.parent))
+    import server
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as http:
+                test = LoadTest(http, args.concurrency, args.duration)
+                await test.setup()
+                return await test.run()
+    finally:
+        await server.client.drop_database(args.db_name)
+
+
+async def run_remote(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as http:
+        test = LoadTest(http, args.concurrency, args.duration)
+        await test.setup()
+        return await test.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Run against a live server instead of in-process")
+    parser.add_argument("--db-name", default="altaj_bench_load", help="Scratch database for in-process runs")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to generate load")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    runner = run_remote if args.base_url else run_in_process
+    result = asyncio.run(runner(args))
+    result["target"] = args.base_url or "in-process"
+    print_result(result)
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_path = RESULTS_DIR / f"load_test-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    result_path.write_text(json.dumps(result, indent=2))
+    print(f"\nResults saved to {result_path}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("No baseline found; run with --save-baseline to create one")
+        return 0
+
+    regressions = compare_to_baseline(result, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Branch filtering on GET /api/menu/items.
+
+Seeds 5,000 menu items across 20 branches into a scratch database on a local
+mongod: 30% are offered everywhere (branch_ids unset), the rest at one to
+three branches. It then compares the old approach, which loaded the first 500
+available items and filtered branch_ids in Python, with the endpoint's
+indexed query. For each, it reports latency and how many of each branch's
+items were actually returned.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/menu_branch_filter.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_menu")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+ITEMS = int(os.environ.get("BENCH_ITEMS", 5000))
+BRANCHES = int(os.environ.get("BENCH_BRANCHES", 20))
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 200))
+GLOBAL_SHARE = 0.3
+PAGE_LIMIT = 500
+
+
+async def seed():
+    random.seed(7)
+    branch_ids = [str(uuid.uuid4()) for _ in range(BRANCHES)]
+    category_id = str(uuid.uuid4())
+    await server.db.menu_categories.insert_one({
+        "id": category_id, "name": "Bench", "display_order": 0, "is_active": True,
+        "created_at": "2024-01-01T00:00:00+00:00"
+    })
+    items = []
+    for i in range(ITEMS):
+        restricted = random.random() >= GLOBAL_SHARE
+        items.append({
+            "id": str(uuid.uuid4()),
+            "name": f"Bench Dish {i}",
+            "description": "Benchmark dish",
+            "category_id": category_id,
+            "base_price": 100 + i % 300,
+            "is_vegetarian": False,
+            "is_available": True,
+            "branch_ids": random.sample(branch_ids, random.randint(1, 3)) if restricted else None,
+            "created_at": "2024-01-01T00:00:00+00:00"
+        })
+    await server.db.menu_items.insert_many(items)
+    await server.create_menu_indexes()
+
+    expected = {
+        branch_id: min(sum(1 for item in items if item["branch_ids"] is None or branch_id in item["branch_ids"]), PAGE_LIMIT)
+        for branch_id in branch_ids
+    }
+    return branch_ids, expected
+
+
+async def legacy_menu(branch_id):
+    """The pre-index implementation: first 500 items, then filter in Python"""
+    items = await server.db.menu_items.find({"is_available": True}, {"_id": 0}).to_list(PAGE_LIMIT)
+    return [item for item in items if item.get("branch_ids") is None or branch_id in item.get("branch_ids", [])]
+
+
+async def indexed_menu(http, branch_id):
+    response = await http.get(f"/api/menu/items?branch_id={branch_id}")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def measure(fetch, branch_ids, expected):
+    latencies = []
+    returned = {branch_id: 0 for branch_id in branch_ids}
+    for i in range(REQUESTS):
+        branch_id = branch_ids[i % len(branch_ids)]
+        start = time.perf_counter()
+        items = await fetch(branch_id)
+        latencies.append(time.perf_counter() - start)
+        returned[branch_id] = len(items)
+    latencies.sort()
+    complete = sum(1 for branch_id in branch_ids if returned[branch_id] == expected[branch_id])
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "items_returned": sum(returned.values()),
+        "items_expected": sum(expected.values()),
+        "complete_branches": complete,
+    }
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        branch_ids, expected = await seed()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            await indexed_menu(http, branch_ids[0])  # warm up
+            results = {
+                "python filter": await measure(legacy_menu, branch_ids, expected),
+                "indexed query": await measure(lambda b: indexed_menu(http, b), branch_ids, expected),
+            }
+        plan = await server.db.menu_items.find(
+            {"is_available": True, **server.menu_branch_filter(branch_ids[0])}
+        ).explain()
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    print(f"{ITEMS} items across {BRANCHES} branches, {REQUESTS} requests each\n")
+    print(f"{'approach':<16}{'p50 ms':>10}{'p95 ms':>10}{'returned':>10}{'expected':>10}{'complete':>10}")
+    for name, row in results.items():
+        print(f"{name:<16}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['items_returned']:>10}"
+              f"{row['items_expected']:>10}{row['complete_branches']:>7}/{BRANCHES}")
+    print(f"\nwinning plan: {plan['queryPlanner']['winningPlan']}")
+    return 0 if results["indexed query"]["complete_branches"] == BRANCHES else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,91 @@
+"""
+Metrics collection overhead on the hot order endpoints.
+
+Drives POST /api/orders and GET /api/orders in-process against a scratch
+database on a local mongod, alternating rounds with metrics enabled and
+disabled. Exits non-zero when collection adds more than 2% to median latency.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/metrics_overhead.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_metrics")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 20))
+REQUESTS_PER_ROUND = int(os.environ.get("BENCH_REQUESTS", 200))
+MAX_OVERHEAD = 0.02
+
+
+async def seed_branch():
+    branch_id = str(uuid.uuid4())
+    await server.db.branches.insert_one({
+        "id": branch_id,
+        "name": "Bench Branch",
+        "address": "Hubballi",
+        "phone": "+91-836-0000000",
+        "email": "bench@altaj.com",
+        "is_active": True,
+        "created_at": "2024-01-01T00:00:00+00:00"
+    })
+    return branch_id
+
+
+async def run_round(http, branch_id):
+    order = {
+        "customer_name": "Bench Customer",
+        "customer_phone": "+91-9876500000",
+        "branch_id": branch_id,
+        "order_type": "takeaway",
+        "items": [{"menu_item_id": "bench", "menu_item_name": "Chicken Biryani",
+                   "quantity": 2, "unit_price": 220.0, "total_price": 440.0}],
+        "payment_method": "cod"
+    }
+    latencies = []
+    for i in range(REQUESTS_PER_ROUND):
+        start = time.perf_counter()
+        if i % 2:
+            response = await http.get(f"/api/orders?branch_id={branch_id}&limit=50")
+        else:
+            response = await http.post("/api/orders", json=order)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return statistics.median(latencies)
+
+
+async def main():
+    branch_id = await seed_branch()
+    transport = httpx.ASGITransport(app=server.app)
+    samples = {True: [], False: []}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            await run_round(http, branch_id)  # warm up pools and caches
+            for round_number in range(ROUNDS):
+                # Alternate which mode goes first so drift affects both equally
+                for enabled in ((True, False) if round_number % 2 else (False, True)):
+                    server.metrics.enabled = enabled
+                    samples[enabled].append(await run_round(http, branch_id))
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    with_metrics = statistics.median(samples[True])
+    without_metrics = statistics.median(samples[False])
+    overhead = (with_metrics - without_metrics) / without_metrics
+    print(f"median latency without metrics: {without_metrics * 1000:.3f} ms")
+    print(f"median latency with metrics:    {with_metrics * 1000:.3f} ms")
+    print(f"overhead: {overhead * 100:+.2f}% (limit {MAX_OVERHEAD * 100:.0f}%)")
+    return 0 if overhead <= MAX_OVERHEAD else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
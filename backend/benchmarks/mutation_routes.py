@@ -0,0 +1,191 @@
+"""
+Mutation routes: latency and MongoDB round trips per request.
+
+Seeds a branch, menu items, tables, delivery partners and orders into a
+scratch database on a local mongod, then drives each update route
+BENCH_REQUESTS times and reports p50/p99 latency and the MongoDB commands
+each request issued (from the ``mongodb_commands_total`` counter). Results
+are saved to benchmarks/results/ labelled with the backend's commit.
+
+To compare two commits, check the older one out in a worktree and point
+BENCH_BACKEND_DIR at its backend, then run the current tree with
+BENCH_BASELINE set to the file that run saved:
+
+    git worktree add /tmp/before HEAD~1
+    BENCH_BACKEND_DIR=/tmp/before/backend python benchmarks/mutation_routes.py
+    BENCH_BASELINE=benchmarks/results/mutation_routes-<commit>.json python benchmarks/mutation_routes.py
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+BACKEND_DIR = Path(os.environ.get("BENCH_BACKEND_DIR", BENCH_DIR.parent)).resolve()
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_mutation_routes")
+os.environ["METRICS_ENABLED"] = "true"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 500))
+BASELINE = os.environ.get("BENCH_BASELINE")
+
+
+def backend_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", str(BACKEND_DIR), "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(sorted_values, pct):
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def mongo_commands():
+    total = 0
+    for line in server.metrics.render().splitlines():
+        if line.startswith("mongodb_commands_total{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+async def seed(http):
+    suffix = uuid.uuid4().hex[:8]
+    response = await http.post("/api/auth/register", json={
+        "email": f"bench.admin.{suffix}@altaj.com", "password": "bench123", "name": "BENCH Admin", "role": "admin"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    branch = (await http.post("/api/branches", headers=headers, json={
+        "name": f"BENCH Branch {suffix}", "address": "Old Hubli, Hubballi",
+        "phone": "+91-836-0000000", "email": f"bench.{suffix}@altaj.com"
+    })).json()
+    category = (await http.post("/api/menu/categories", headers=headers, json={"name": "BENCH Category"})).json()
+    item = (await http.post("/api/menu/items", headers=headers, json={
+        "name": "BENCH Chicken Biryani", "description": "Benchmark dish", "category_id": category["id"], "base_price": 240
+    })).json()
+    table = (await http.post("/api/tables", headers=headers, json={
+        "branch_id": branch["id"], "table_number": "BENCH1", "capacity": 4
+    })).json()
+    partners = [server.DeliveryPartner(
+        user_id=str(uuid.uuid4()), branch_id=branch["id"], name=f"BENCH Rider {n}", phone=f"+91-98765{n:05d}"
+    ).model_dump(mode="json") for n in range(REQUESTS + 1)]
+    await server.db.delivery_partners.insert_many([dict(partner) for partner in partners])
+    return headers, branch, item, table, partners
+
+
+async def place_orders(http, branch, item, order_type, status=None, headers=None):
+    orders = []
+    for _ in range(REQUESTS):
+        order = (await http.post("/api/orders", json={
+            "customer_name": "BENCH Customer", "customer_phone": "+91-9876500000", "branch_id": branch["id"],
+            "order_type": order_type, "payment_method": "cod",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]}],
+            **({"delivery_address": "Old Hubli, Hubballi"} if order_type == "delivery" else {})
+        })).json()
+        if status:
+            await http.put(f"/api/orders/{order['id']}/status", json={"status": status}, headers=headers)
+        orders.append(order)
+    return orders
+
+
+async def measure(http, requests):
+    latencies = []
+    commands = mongo_commands()
+    for method, url, body, headers in requests:
+        start = time.perf_counter()
+        response = await http.request(method, url, json=body, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.text)
+    commands = mongo_commands() - commands
+    latencies.sort()
+    return {
+        "commands": commands / len(requests),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+            headers, branch, item, table, partners = await seed(http)
+            branch_body = {key: branch[key] for key in ("name", "address", "phone", "email")}
+            item_body = {key: item[key] for key in ("name", "description", "category_id", "base_price")}
+            statuses = ["cleaning", "vacant"]
+            rider_statuses = ["busy", "available"]
+            kitchen_orders = await place_orders(http, branch, item, "takeaway")
+            delivery_orders = await place_orders(http, branch, item, "delivery", "ready", headers)
+
+            cases = {
+                "PUT /branches/{id}": [("PUT", f"/api/branches/{branch['id']}", branch_body, headers)] * REQUESTS,
+                "PUT /menu/items/{id}": [("PUT", f"/api/menu/items/{item['id']}", item_body, headers)] * REQUESTS,
+                "PUT /tables/{id}/status": [
+                    ("PUT", f"/api/tables/{table['id']}/status", {"status": statuses[n % 2]}, headers) for n in range(REQUESTS)
+                ],
+                "PUT /delivery-partners/{id}/status": [
+                    ("PUT", f"/api/delivery-partners/{partners[-1]['id']}/status", {"status": rider_statuses[n % 2]}, headers)
+                    for n in range(REQUESTS)
+                ],
+                "PUT /orders/{id}/status": [
+                    ("PUT", f"/api/orders/{order['id']}/status", {"status": "confirmed"}, headers) for order in kitchen_orders
+                ],
+                "PUT /orders/{id}/assign-delivery": [
+                    ("PUT", f"/api/orders/{order['id']}/assign-delivery", {"delivery_partner_id": partner["id"]}, headers)
+                    for order, partner in zip(delivery_orders, partners)
+                ],
+            }
+            for name, requests in cases.items():
+                results[name] = await measure(http, requests)
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    commit = backend_commit()
+    print(f"{REQUESTS} requests per route, backend at {commit}, {os.environ['MONGO_URL']}\n")
+    if BASELINE:
+        baseline = json.loads(Path(BASELINE).read_text())
+        print(f"{'':<36}{'mongo cmds':>16}{'p50 ms':>18}{'p99 ms':>18}")
+        print(f"{'route':<36}{baseline['commit'] + ' / ' + commit:>16}{'before / after':>18}{'before / after':>18}")
+        for name, row in results.items():
+            before = baseline["routes"].get(name)
+            if before is None:
+                continue
+            print(f"{name:<36}{before['commands']:>8.1f} / {row['commands']:<5.1f}"
+                  f"{before['p50_ms']:>10.2f} / {row['p50_ms']:<5.2f}{before['p99_ms']:>10.2f} / {row['p99_ms']:<5.2f}")
+    else:
+        print(f"{'route':<36}{'mongo cmds':>12}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, row in results.items():
+            print(f"{name:<36}{row['commands']:>12.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_path = RESULTS_DIR / f"mutation_routes-{commit}.json"
+    result_path.write_text(json.dumps({
+        "commit": commit,
+        "mongo_url": os.environ["MONGO_URL"],
+        "requests": REQUESTS,
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "routes": results
+    }, indent=2))
+    print(f"\nResults saved to {result_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
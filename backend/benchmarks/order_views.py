@@ -0,0 +1,104 @@
+"""
+Order list views: bytes and latency per view.
+
+Seeds 100 realistic orders (six line items, delivery addresses, special
+instructions) into a scratch database on a local mongod and requests a full
+page of GET /api/orders for each view and a sample ``fields=`` selection. It
+reports the BSON bytes MongoDB returns for the view's projection, the
+response size uncompressed and gzipped, and median/p95 latency.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/order_views.py
+"""
+import asyncio
+import gzip
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "altaj_bench_order_views")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bson  # noqa: E402
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 300))
+VARIANTS = {
+    "full": "view=full",
+    "summary": "view=summary",
+    "kitchen": "view=kitchen",
+    "fields (waiter)": "fields=order_number,customer_name,table_id,items,total,status",
+}
+
+
+async def seed():
+    branch_id = str(uuid.uuid4())
+    now = "2024-01-01T12:00:00+00:00"
+    await server.db.orders.insert_many([{
+        "id": str(uuid.uuid4()), "order_number": f"BENCH{n:06d}", "customer_id": str(uuid.uuid4()),
+        "customer_name": "Bench Customer", "customer_phone": "+91-9876500000", "customer_email": "bench@altaj.com",
+        "branch_id": branch_id, "order_type": "delivery",
+        "items": [{"menu_item_id": str(uuid.uuid4()), "menu_item_name": f"Chicken Dum Biryani {k}", "quantity": 2,
+                   "unit_price": 240.0, "total_price": 480.0} for k in range(6)],
+        "subtotal": 2880.0, "tax": 144.0, "total": 3024.0, "status": "preparing",
+        "payment_method": "online", "payment_status": "completed",
+        "razorpay_order_id": f"order_{uuid.uuid4().hex[:14]}", "razorpay_payment_id": f"pay_{uuid.uuid4().hex[:14]}",
+        "delivery_address": "Flat 4B, Sai Residency, Near Durgadbail Circle, Old Hubli, Hubballi 580024",
+        "special_instructions": "Less spicy, extra raita, ring the bell twice",
+        "created_at": now, "updated_at": now
+    } for n in range(100)])
+    return branch_id
+
+
+async def mongo_bytes(branch_id, query_string):
+    view, _, value = query_string.partition("=")
+    _, projection = server.resolve_order_view(value if view == "view" else "full", value if view == "fields" else None)
+    docs = await server.db.orders.find({"branch_id": branch_id}, {"_id": 0, **projection}).to_list(None)
+    return sum(len(bson.encode(doc)) for doc in docs)
+
+
+async def measure(http, url):
+    latencies = []
+    body = b""
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        response = await http.get(url, headers={"Accept-Encoding": "identity"})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+        body = response.content
+    latencies.sort()
+    return {
+        "json_bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body, 6)),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    results = {}
+    try:
+        branch_id = await seed()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for name, query_string in VARIANTS.items():
+                url = f"/api/orders?branch_id={branch_id}&limit=100&{query_string}"
+                await measure(http, url)  # warm up
+                results[name] = {"mongo_bytes": await mongo_bytes(branch_id, query_string), **await measure(http, url)}
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+    print(f"100 orders per page, {REQUESTS} requests per view\n")
+    print(f"{'view':<18}{'mongo B':>10}{'json B':>10}{'gzip B':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, row in results.items():
+        print(f"{name:<18}{row['mongo_bytes']:>10}{row['json_bytes']:>10}{row['gzip_bytes']:>10}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
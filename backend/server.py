@@ -1,36 +1,333 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Header, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Header, Request, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReturnDocument, monitoring
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import asyncio
+import json
+import math
+import time
+import bisect
+import threading
+import sys
+import contextvars
+import csv
+import io
+import gzip
+import email.utils
+import re
+import unicodedata
+from itertools import chain
+import numpy as np
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from functools import lru_cache
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, EmailStr, ConfigDict, TypeAdapter, create_model, ValidationError
+from typing import Dict, List, Optional, Literal
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
+import httpx
 from passlib.context import CryptContext
-import razorpay
 import hmac
 import hashlib
 import random
 import string
 
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip
+    brotli = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# ============================================================================
+# METRICS
+# ============================================================================
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsRegistry:
+    """Minimal Prometheus-compatible registry for counters, gauges and histograms.
+
+    Samples arrive from the event loop and from pymongo's executor threads,
+    so every mutation goes through one lock.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str, labels=()):
+        self._meta[name] = (metric_type, help_text, tuple(labels))
+
+    def inc(self, name: str, labels=(), value: float = 1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, labels=(), value: float = 0):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def add_gauge(self, name: str, labels=(), value: float = 1):
+        with self._lock:
+            key = (name, labels)
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(self, name: str, labels=(), value: float = 0):
+        index = bisect.bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Bucket counts (last slot is +Inf), then sum
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text, label_names) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "histogram":
+                for (sample_name, labels), histogram in histograms.items():
+                    if sample_name != name:
+                        continue
+                    base = _format_labels(label_names, labels)
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram[:-1]):
+                        cumulative += count
+                        bucket_labels = _format_labels(label_names + ("le",), labels + (str(bound),))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{base} {histogram[-1]}")
+                    lines.append(f"{name}_count{base} {cumulative}")
+            else:
+                samples = counters if metric_type == "counter" else gauges
+                for (sample_name, labels), value in samples.items():
+                    if sample_name == name:
+                        lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+metrics = MetricsRegistry(enabled=os.environ.get('METRICS_ENABLED', 'true').lower() == 'true')
+metrics.describe("http_requests_total", "counter", "HTTP requests by route and status", ("method", "route", "status"))
+metrics.describe("http_requests_in_flight", "gauge", "HTTP requests currently being handled", ("method", "route"))
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP handler latency", ("method", "route"))
+metrics.describe("mongodb_commands_total", "counter", "MongoDB commands by collection, command and outcome", ("collection", "command", "outcome"))
+metrics.describe("mongodb_command_duration_seconds", "histogram", "MongoDB command latency", ("collection", "command"))
+metrics.describe("mongodb_pool_connections", "gauge", "Open connections in the MongoDB pool", ("pool", "address"))
+metrics.describe("mongodb_pool_checked_out", "gauge", "Connections checked out of the MongoDB pool", ("pool", "address"))
+metrics.describe("mongodb_pool_checkout_failures_total", "counter", "Failed MongoDB pool checkouts", ("pool", "address", "reason"))
+metrics.describe("outbound_request_duration_seconds", "histogram", "Latency of calls to external services", ("service", "operation", "outcome"))
+metrics.describe("event_loop_lag_seconds", "gauge", "Most recent event loop scheduling delay")
+metrics.describe("http_response_bytes_total", "counter", "Compressible response bytes before and after compression", ("encoding", "stage"))
+
+
+# Set by the profiling middleware; Motor copies the context into its executor
+# threads, so command listeners can attribute work to the profiled request.
+active_request_profile = contextvars.ContextVar("active_request_profile", default=None)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command per collection and command name"""
+
+    def __init__(self):
+        self._commands = {}
+
+    def started(self, event):
+        profile = active_request_profile.get()
+        if not metrics.enabled and profile is None:
+            return
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else "-"
+        self._commands[(event.connection_id, event.request_id)] = (collection, profile)
+
+    def _finish(self, event, outcome: str):
+        entry = self._commands.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+        collection, profile = entry
+        duration = event.duration_micros / 1e6
+        if metrics.enabled:
+            metrics.inc("mongodb_commands_total", (collection, event.command_name, outcome))
+            metrics.observe("mongodb_command_duration_seconds", (collection, event.command_name), duration)
+        if profile is not None:
+            profile.record_mongo(collection, event.command_name, duration)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks open and checked-out connections per client and server"""
+
+    def __init__(self, pool: str):
+        self.pool = pool
+
+    def _labels(self, event) -> tuple:
+        return (self.pool, f"{event.address[0]}:{event.address[1]}")
+
+    def connection_created(self, event):
+        metrics.add_gauge("mongodb_pool_connections", self._labels(event), 1)
+
+    def connection_closed(self, event):
+        metrics.add_gauge("mongodb_pool_connections", self._labels(event), -1)
+
+    def connection_checked_out(self, event):
+        metrics.add_gauge("mongodb_pool_checked_out", self._labels(event), 1)
+
+    def connection_checked_in(self, event):
+        metrics.add_gauge("mongodb_pool_checked_out", self._labels(event), -1)
+
+    def connection_check_out_failed(self, event):
+        metrics.inc("mongodb_pool_checkout_failures_total", self._labels(event) + (str(event.reason),))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute that records count, in-flight and latency under the route template"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def instrumented_handler(request: Request):
+            if not metrics.enabled:
+                return await handler(request)
+            labels = (request.method, route)
+            status_code = 500
+            metrics.add_gauge("http_requests_in_flight", labels, 1)
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+                status_code = response.status_code
+                return response
+            except HTTPException as e:
+                status_code = e.status_code
+                raise
+            finally:
+                metrics.observe("http_request_duration_seconds", labels, time.perf_counter() - start)
+                metrics.add_gauge("http_requests_in_flight", labels, -1)
+                metrics.inc("http_requests_total", labels + (str(status_code),))
+
+        return instrumented_handler
+
+
+@contextmanager
+def track_outbound(service: str, operation: str):
+    """Time a call to an external service (Razorpay, Google, Facebook)"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        if metrics.enabled:
+            metrics.observe("outbound_request_duration_seconds", (service, operation, outcome), time.perf_counter() - start)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop wakes us up; sustained lag means blocking code"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        metrics.set_gauge("event_loop_lag_seconds", (), max(loop.time() - start - interval, 0.0))
+
+# MongoDB connection. No connection is opened here; the lifespan pings the
+# server before the app accepts traffic.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '10')),
+    maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000')),
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000')),
+    waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000')),
+    event_listeners=[MongoCommandMetrics(), MongoPoolMetrics("main")]
+)
 db = client[os.environ['DB_NAME']]
 
+# Reports, exports and extracts read through a second client with its own,
+# smaller pool that prefers secondaries, so a burst of reports cannot take
+# the connections order placement needs. Reads may lag the primary by up to
+# ANALYTICS_MAX_STALENESS_SECONDS (MongoDB's minimum is 90).
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', '90'))
+analytics_client = AsyncIOMotorClient(
+    os.environ.get('ANALYTICS_MONGO_URL', mongo_url),
+    readPreference="secondaryPreferred",
+    maxStalenessSeconds=ANALYTICS_MAX_STALENESS_SECONDS,
+    maxPoolSize=int(os.environ.get('ANALYTICS_MAX_POOL_SIZE', '10')),
+    minPoolSize=0,
+    connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000')),
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000')),
+    waitQueueTimeoutMS=int(os.environ.get('ANALYTICS_WAIT_QUEUE_TIMEOUT_MS', '30000')),
+    event_listeners=[MongoCommandMetrics(), MongoPoolMetrics("analytics")]
+)
+analytics_db = analytics_client[os.environ['DB_NAME']]
+
 # Razorpay Client
-razorpay_client = razorpay.Client(auth=(
-    os.environ.get('RAZORPAY_KEY_ID', ''),
-    os.environ.get('RAZORPAY_KEY_SECRET', '')
-))
+@lru_cache(maxsize=None)
+def get_razorpay_client():
+    # The SDK pulls in requests; only payment routes need it
+    import razorpay
+    return razorpay.Client(auth=(
+        os.environ.get('RAZORPAY_KEY_ID', ''),
+        os.environ.get('RAZORPAY_KEY_SECRET', '')
+    ))
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -38,14 +335,17 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Create the main app
 app = FastAPI(title="Al Taj Restaurant Multi-Branch System")
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=InstrumentedRoute)
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -56,10 +356,10 @@ def generate_otp(length=6):
     return ''.join(random.choices(string.digits, k=length))
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -71,6 +371,47 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def next_sequence(name: str, session=None) -> int:
+    """Next value of the named counter in ``counters``, starting at 1"""
+    counter = await db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    return counter["seq"]
+
+async def update_and_fetch(collection, query: dict, update: dict, not_found: str, projection: Optional[dict] = None) -> dict:
+    """Apply ``update`` to the document matching ``query`` and return it as
+    it is afterwards, in one round trip. Raises 404 with ``not_found`` when
+    nothing matches, so existence checks belong in ``query``."""
+    document = await collection.find_one_and_update(
+        query,
+        update,
+        projection={"_id": 0, **(projection or {})},
+        return_document=ReturnDocument.AFTER
+    )
+    if document is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return document
+
+# Set at startup; a standalone mongod has no multi-document transactions
+transactions_supported = False
+
+async def detect_transaction_support():
+    global transactions_supported
+    hello = await client.admin.command("hello")
+    transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+async def run_in_transaction(callback):
+    """Run ``callback(session)`` in a transaction when the deployment
+    supports them, otherwise as plain writes with ``session=None``"""
+    if not transactions_supported:
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
 def decode_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -92,6 +433,16 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """The caller when a valid token is sent; guests get None"""
+    if credentials is None:
+        return None
+    try:
+        payload = decode_token(credentials.credentials)
+    except HTTPException:
+        return None
+    return await db.users.find_one({"id": payload.get("sub")}, {"_id": 0})
+
 def require_role(allowed_roles: List[str]):
     def role_checker(current_user: dict = Depends(get_current_user)):
         if current_user.get("role") not in allowed_roles:
@@ -99,6 +450,744 @@ def require_role(allowed_roles: List[str]):
         return current_user
     return role_checker
 
+# ============================================================================
+# CHANGE EVENT HUB
+# ============================================================================
+
+class ChangeSubscription:
+    """A subscriber's view of the change hub: a bounded queue plus filters.
+
+    When the queue is full the oldest event is dropped so a slow consumer
+    can never block publishers; ``dropped`` counts how many were lost.
+    """
+
+    def __init__(self, collections=None, branch_id=None, order_id=None, maxsize=256):
+        self.collections = set(collections) if collections else None
+        self.branch_id = branch_id
+        self.order_id = order_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: dict) -> bool:
+        if self.collections and event["collection"] not in self.collections:
+            return False
+        if self.branch_id and event.get("branch_id") != self.branch_id:
+            return False
+        if self.order_id:
+            document = event.get("document") or {}
+            if self.order_id not in (event.get("id"), document.get("current_order_id")):
+                return False
+        return True
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None if nothing arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ChangeEventHub:
+    """Single fan-out point for changes to orders, tables and delivery partners.
+
+    Against a replica set the hub tails MongoDB change streams and persists
+    resume tokens in ``change_stream_tokens`` so a restart picks up where it
+    left off. Tokens are flushed at most once a second, so delivery after a
+    restart is at-least-once. On a standalone mongod change streams are not
+    available and the hub is fed by route handlers through ``emit``.
+    """
+
+    WATCHED_COLLECTIONS = ("orders", "tables", "delivery_partners")
+    TOKEN_FLUSH_INTERVAL = 1.0
+
+    def __init__(self, database):
+        self.db = database
+        self.mode = "local"
+        self._subscriptions = set()
+        self._tasks = []
+
+    async def start(self):
+        try:
+            hello = await self.db.client.admin.command("hello")
+        except PyMongoError as e:
+            logger.warning(f"Change hub could not inspect MongoDB topology: {e}")
+            hello = {}
+
+        if hello.get("setName"):
+            self.mode = "change_stream"
+            self._tasks = [asyncio.create_task(self._tail(name)) for name in self.WATCHED_COLLECTIONS]
+        else:
+            self.mode = "local"
+        logger.info(f"Change hub started in {self.mode} mode")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def subscribe(self, collections=None, branch_id=None, order_id=None, maxsize=256) -> ChangeSubscription:
+        subscription = ChangeSubscription(collections, branch_id, order_id, maxsize)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ChangeSubscription):
+        self._subscriptions.discard(subscription)
+
+    def emit(self, collection: str, operation: str, document: dict):
+        """Publish a write made by a route handler.
+
+        Ignored in change stream mode, where the same write reaches
+        subscribers through the stream.
+        """
+        if self.mode != "local" or not document:
+            return
+        self._dispatch(self._make_event(collection, operation, document))
+
+    def _make_event(self, collection: str, operation: str, document: dict) -> dict:
+        document = {k: v for k, v in document.items() if k != "_id"}
+        return {
+            "collection": collection,
+            "operation": operation,
+            "id": document.get("id"),
+            "branch_id": document.get("branch_id"),
+            "document": document,
+            "ts": datetime.now(timezone.utc).isoformat()
+        }
+
+    def _dispatch(self, event: dict):
+        for subscription in list(self._subscriptions):
+            if subscription.matches(event):
+                subscription.put(event)
+
+    async def _load_token(self, collection: str):
+        doc = await self.db.change_stream_tokens.find_one({"_id": collection})
+        return doc["token"] if doc else None
+
+    async def _save_token(self, collection: str, token):
+        await self.db.change_stream_tokens.update_one(
+            {"_id": collection},
+            {"$set": {"token": token, "updated_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+
+    async def _tail(self, collection: str):
+        token = await self._load_token(collection)
+        pending_token = None
+        last_flush = 0.0
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                async with self.db[collection].watch(full_document="updateLookup", resume_after=token) as stream:
+                    async for change in stream:
+                        document = change.get("fullDocument") or {}
+                        self._dispatch(self._make_event(collection, change["operationType"], document))
+
+                        token = pending_token = stream.resume_token
+                        if loop.time() - last_flush >= self.TOKEN_FLUSH_INTERVAL:
+                            await self._save_token(collection, pending_token)
+                            pending_token = None
+                            last_flush = loop.time()
+            except asyncio.CancelledError:
+                if pending_token is not None:
+                    await self._save_token(collection, pending_token)
+                raise
+            except OperationFailure as e:
+                # 280/286: the resume token is unusable or fell off the oplog
+                if e.code in (280, 286):
+                    logger.warning(f"Resume token for {collection} expired, restarting stream from now")
+                    token = None
+                else:
+                    logger.error(f"Change stream on {collection} failed: {e}")
+                await asyncio.sleep(1)
+            except PyMongoError as e:
+                logger.error(f"Change stream on {collection} interrupted: {e}")
+                await asyncio.sleep(1)
+
+
+change_hub = ChangeEventHub(db)
+
+# ============================================================================
+# QUERY CACHES
+# ============================================================================
+
+class QueryCache:
+    """In-process TTL cache for derived query results, evicting the least
+    recently used entry when full.
+
+    Each cache declares the collections it is built from; writes to those
+    collections call ``invalidate_collection`` to drop stale entries on
+    every worker. Other derived structures can join the registry by
+    providing ``depends_on`` and ``clear()``.
+    """
+
+    registry = {}
+
+    def __init__(self, name: str, ttl: float, depends_on=(), maxsize: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.depends_on = set(depends_on)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        QueryCache.registry[name] = self
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.maxsize:
+            self._entries.popitem(last=False)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def clear_local_caches(collection: str):
+    """Drop this worker's cached results derived from ``collection``"""
+    for cache in QueryCache.registry.values():
+        if collection in cache.depends_on:
+            cache.clear()
+
+CACHE_BUS_SIZE_BYTES = int(os.environ.get('CACHE_BUS_SIZE_BYTES', str(1 << 20)))
+CACHE_BUS_MAX_DOCS = int(os.environ.get('CACHE_BUS_MAX_DOCS', '10000'))
+CACHE_BUS_MAX_LAG_SECONDS = float(os.environ.get('CACHE_BUS_MAX_LAG_SECONDS', '5'))
+CACHE_BUS_RECONCILE_SECONDS = float(os.environ.get('CACHE_BUS_RECONCILE_SECONDS', '60'))
+
+metrics.describe("cache_invalidations_published_total", "counter", "Cache invalidations published to the bus", ("collection",))
+metrics.describe("cache_invalidation_lag_seconds", "histogram", "Time from publishing an invalidation to evicting on this worker", ("collection",))
+metrics.describe("cache_bus_full_flushes_total", "counter", "Full local cache flushes after losing track of the bus", ("reason",))
+
+class CollectionVersions:
+    """Per-collection write counters, persisted in ``collection_versions``.
+
+    A write bumps its collection's counter with ``$inc`` and publishes
+    ``(collection, id, version)`` to ``cache_invalidations``, a capped
+    collection every worker follows with a tailable cursor, so caches derived
+    from it are dropped on all workers as soon as the event arrives. A worker
+    that loses its place in the bus, or receives an event more than
+    CACHE_BUS_MAX_LAG_SECONDS old, flushes every local cache and re-reads
+    the counters; they are also re-read every CACHE_BUS_RECONCILE_SECONDS in
+    case a publish was lost.
+
+    The counters also provide ETags and Last-Modified for conditional GETs,
+    read from the local copy without touching MongoDB. The random epoch set
+    when a counter is created keeps ETags unique if the collection is reset.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._versions = {}
+        self._flushed_at = datetime.now(timezone.utc)
+
+    def _apply(self, collection: str, epoch: str, version: int, updated_at) -> bool:
+        known = self._versions.get(collection)
+        # Events can arrive after a newer refresh or be replayed from the bus
+        if known is not None and known[0] == epoch and known[1] >= version:
+            return False
+        self._versions[collection] = (epoch, version, updated_at)
+        clear_local_caches(collection)
+        return True
+
+    async def bump(self, collection: str, document_id: Optional[str] = None):
+        doc = await self.db.collection_versions.find_one_and_update(
+            {"_id": collection},
+            {
+                "$inc": {"version": 1},
+                "$set": {"updated_at": datetime.now(timezone.utc).replace(microsecond=0)},
+                "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._apply(collection, doc["epoch"], doc["version"], doc["updated_at"])
+        try:
+            await self.db.cache_invalidations.insert_one({
+                "collection": collection,
+                "document_id": document_id,
+                "epoch": doc["epoch"],
+                "version": doc["version"],
+                "updated_at": doc["updated_at"],
+                "published_at": datetime.now(timezone.utc)
+            })
+            metrics.inc("cache_invalidations_published_total", (collection,))
+        except PyMongoError as e:
+            # The counter already moved; other workers pick it up on reconcile
+            logger.error(f"Publishing invalidation for {collection} failed: {e}")
+
+    async def refresh(self):
+        async for doc in self.db.collection_versions.find({}):
+            self._apply(doc["_id"], doc["epoch"], doc["version"], doc.get("updated_at"))
+
+    async def full_flush(self, reason: str):
+        """Drop every local cache and re-read the counters, for when events
+        may have been missed"""
+        logger.warning(f"Flushing all local caches: {reason}")
+        metrics.inc("cache_bus_full_flushes_total", (reason,))
+        self._flushed_at = datetime.now(timezone.utc)
+        for cache in QueryCache.registry.values():
+            cache.clear()
+        await self.refresh()
+
+    async def ensure_bus(self):
+        try:
+            await self.db.create_collection(
+                "cache_invalidations", capped=True, size=CACHE_BUS_SIZE_BYTES, max=CACHE_BUS_MAX_DOCS
+            )
+        except CollectionInvalid:
+            pass
+
+    def _receive(self, event: dict) -> bool:
+        """Apply a bus event; True when it arrived too late to trust the
+        other caches on this worker"""
+        if not self._apply(event["collection"], event["epoch"], event["version"], event.get("updated_at")):
+            return False
+        # BSON dates come back naive (UTC)
+        published_at = event["published_at"].replace(tzinfo=timezone.utc)
+        lag = max((datetime.now(timezone.utc) - published_at).total_seconds(), 0.0)
+        metrics.observe("cache_invalidation_lag_seconds", (event["collection"],), lag)
+        return lag > CACHE_BUS_MAX_LAG_SECONDS and published_at > self._flushed_at
+
+    async def _tail(self):
+        while True:
+            try:
+                # Each (re)start scans the whole bus; _apply skips what is
+                # already known, so no resume position is needed
+                cursor = self.db.cache_invalidations.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        if self._receive(event):
+                            await self.full_flush("lag")
+                    await asyncio.sleep(0.1)
+                # An empty capped collection closes the cursor straight away
+                await asyncio.sleep(1)
+            except OperationFailure as e:
+                # 136: CappedPositionLost, the bus wrapped past our cursor
+                await asyncio.sleep(1)
+                await self._recover("position_lost" if e.code == 136 else "cursor_error", e)
+            except PyMongoError as e:
+                await asyncio.sleep(1)
+                await self._recover("cursor_error", e)
+
+    async def _recover(self, reason: str, error: Exception):
+        logger.error(f"Cache invalidation bus interrupted: {error}")
+        try:
+            await self.full_flush(reason)
+        except PyMongoError as e:
+            logger.error(f"Collection version refresh failed: {e}")
+
+    async def _reconcile(self):
+        while True:
+            await asyncio.sleep(CACHE_BUS_RECONCILE_SECONDS)
+            try:
+                await self.refresh()
+            except PyMongoError as e:
+                logger.error(f"Collection version refresh failed: {e}")
+
+    async def run(self):
+        await asyncio.gather(self._tail(), self._reconcile())
+
+    def key(self, *collections: str) -> tuple:
+        """Cache key component that changes whenever ``collections`` are written"""
+        return tuple(self._versions.get(collection, ("0", 0, None))[:2] for collection in collections)
+
+    def etag(self, *collections: str, extra: str = "") -> str:
+        tokens = [f"{epoch}.{version}" for epoch, version in self.key(*collections)]
+        if extra:
+            tokens.append(extra)
+        return '"' + "-".join(tokens) + '"'
+
+    def last_modified(self, *collections: str) -> Optional[datetime]:
+        stamps = [self._versions[c][2] for c in collections if c in self._versions and self._versions[c][2]]
+        if not stamps:
+            return None
+        # BSON dates come back naive (UTC)
+        return max(stamp.replace(tzinfo=timezone.utc) for stamp in stamps)
+
+
+collection_versions = CollectionVersions(db)
+
+async def invalidate_collection(collection: str, document_id: Optional[str] = None):
+    """Record a write to ``collection``: drops derived caches on every worker
+    and moves its ETags on"""
+    await collection_versions.bump(collection, document_id)
+
+async def share_change(collection: str, document_id: Optional[str] = None):
+    """Make a write to a change hub collection visible to other workers.
+
+    Against a replica set every worker's hub follows the change streams, so
+    there is nothing to do. On a standalone mongod ``emit`` only reaches
+    this worker; the write is published on the invalidation bus instead and
+    structures fed by the hub reload from MongoDB on their next read.
+    """
+    if change_hub.mode == "local":
+        await invalidate_collection(collection, document_id)
+
+# ============================================================================
+# REQUEST PROFILING
+# ============================================================================
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', '2')) / 1000
+PROFILE_RETENTION_DAYS = 7
+
+class RequestProfile:
+    """Statistical profile of a single request.
+
+    A sampler thread inspects the event loop thread every PROFILE_INTERVAL.
+    When the request's task is on the CPU its Python stack is recorded;
+    when it is suspended the sample counts as waiting. Each sample is
+    weighted by the time since the previous one, because CPU-bound code
+    holding the GIL delays the sampler. MongoDB time is measured exactly
+    through the command listener.
+    """
+
+    # Module prefixes used to bucket on-CPU samples by their innermost frame
+    CATEGORIES = (
+        ("pydantic", "validation"),
+        ("fastapi.encoders", "serialization"),
+        ("json", "serialization"),
+        ("starlette.responses", "serialization"),
+        ("motor", "mongo_driver"),
+        ("pymongo", "mongo_driver"),
+        ("bson", "mongo_driver"),
+    )
+
+    def __init__(self, task: asyncio.Task, loop_thread_id: int):
+        self.id = str(uuid.uuid4())
+        self.task = task
+        self.loop_thread_id = loop_thread_id
+        self.loop = task.get_loop()
+        # Weights are in microseconds so collapsed stacks stay integral
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.waiting = 0
+        self.other_tasks = 0
+        self.mongo = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.wall_time = time.perf_counter() - self.started_at
+
+    def record_mongo(self, collection: str, command: str, duration: float):
+        with self._lock:
+            entry = self.mongo.setdefault((collection, command), [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.loop_thread_id)
+            running = asyncio.current_task(self.loop)
+            now = time.perf_counter()
+            weight = int((now - last) * 1e6)
+            last = now
+            if running is self.task and frame is not None:
+                self._record_stack(frame, weight)
+            elif running is None:
+                self.waiting += weight
+            else:
+                self.other_tasks += weight
+
+    def _record_stack(self, frame, weight: int):
+        entries = []
+        innermost_module = frame.f_globals.get("__name__", "")
+        while frame is not None and len(entries) < 64:
+            module = frame.f_globals.get("__name__", "?")
+            if module.startswith("asyncio"):
+                break
+            entries.append(f"{module}:{frame.f_code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(entries))] += weight
+
+        category = "python"
+        for prefix, name in self.CATEGORIES:
+            if innermost_module == prefix or innermost_module.startswith(prefix + "."):
+                category = name
+                break
+        self.categories[category] += weight
+
+    def to_document(self, scope: dict, status_code: int) -> dict:
+        route = scope.get("route")
+        mongo_seconds = sum(seconds for _, seconds in self.mongo.values())
+        return {
+            "id": self.id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status_code": status_code,
+            "wall_ms": round(self.wall_time * 1000, 3),
+            "sample_interval_ms": PROFILE_INTERVAL * 1000,
+            "python_ms": round(sum(self.categories.values()) / 1000, 3),
+            "waiting_ms": round(self.waiting / 1000, 3),
+            "other_tasks_ms": round(self.other_tasks / 1000, 3),
+            "mongo_ms": round(mongo_seconds * 1000, 3),
+            "mongo_commands": [
+                {"collection": collection, "command": command, "count": count, "ms": round(seconds * 1000, 3)}
+                for (collection, command), (count, seconds) in self.mongo.items()
+            ],
+            "python_by_category": {k: round(v / 1000, 3) for k, v in self.categories.items()},
+            # Stored as [stack, microseconds] pairs: frame names contain dots,
+            # which make awkward field names
+            "collapsed_stacks": [[stack, count] for stack, count in self.stacks.most_common()],
+            "created_at": datetime.now(timezone.utc)
+        }
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry ``X-Profile`` with an admin token, plus a
+    PROFILE_SAMPLE_RATE fraction of all traffic.
+
+    One request is profiled at a time per worker; others pass straight
+    through. With no header and a zero sample rate the only cost is a scan
+    of the request headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        profile = RequestProfile(asyncio.current_task(), threading.get_ident())
+        token = active_request_profile.set(profile)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            active_request_profile.reset(token)
+            self._busy = False
+            asyncio.create_task(self._store(profile.to_document(scope, status_code)))
+
+    def _should_profile(self, scope) -> bool:
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return True
+        headers = scope["headers"]
+        if not any(name == b"x-profile" for name, _ in headers):
+            return False
+        authorization = next((value for name, value in headers if name == b"authorization"), b"").decode()
+        if not authorization.lower().startswith("bearer "):
+            return False
+        try:
+            payload = decode_token(authorization[7:])
+        except Exception:
+            return False
+        return payload.get("role") == "admin"
+
+    async def _store(self, document: dict):
+        try:
+            await db.request_profiles.insert_one(document)
+        except PyMongoError as e:
+            logger.error(f"Failed to store request profile {document['id']}: {e}")
+
+# ============================================================================
+# RESPONSE COMPRESSION
+# ============================================================================
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "image/svg+xml", "text/")
+# Preferred first
+COMPRESSION_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+def compress_body(body: bytes, encoding: str, precompressed: bool = False) -> bytes:
+    """Cheaper settings for per-request compression, the best ratio for
+    payloads compressed once and cached"""
+    if encoding == "br":
+        return brotli.compress(body, quality=9 if precompressed else 4)
+    return gzip.compress(body, compresslevel=9 if precompressed else 6)
+
+def negotiate_encoding(accept_encoding: str, available=COMPRESSION_ENCODINGS) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """Strong validator for one content-coding of a representation"""
+    if not encoding or not etag.endswith('"') or etag.startswith("W/"):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match covers ``etag`` in any encoding"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    variants = {etag, *(encoded_etag(etag, encoding) for encoding in ("gzip", "br"))}
+    return "*" in tags or any(tag in variants for tag in tags)
+
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Conditional GET check; If-None-Match takes precedence over If-Modified-Since"""
+    if "if-none-match" in request.headers:
+        return if_none_match(request, etag)
+    since = request.headers.get("if-modified-since")
+    if since and last_modified:
+        try:
+            return last_modified <= email.utils.parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None,
+                      cache_control: str = REVALIDATE_CACHE_CONTROL) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if last_modified:
+        headers["Last-Modified"] = email.utils.format_datetime(last_modified, usegmt=True)
+    return headers
+
+class CompressionMiddleware:
+    """gzip/brotli for buffered responses of a compressible content type
+    above COMPRESSION_MIN_SIZE.
+
+    Streaming responses (exports, server-sent events) and responses that
+    already carry a Content-Encoding, such as precompressed cached
+    payloads, pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES) \
+                        or content_type.startswith("text/event-stream"):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body") or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress_body(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers:
+                headers["ETag"] = encoded_etag(headers["etag"], encoding)
+            if metrics.enabled:
+                metrics.inc("http_response_bytes_total", (encoding, "original"), len(body))
+                metrics.inc("http_response_bytes_total", (encoding, "sent"), len(compressed))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+class CachedPayload:
+    """A JSON body serialized once, with its ETag and compressed variants,
+    for read-mostly payloads served to many clients."""
+
+    def __init__(self, content):
+        self.content = content
+        self.body = json.dumps(content, separators=(",", ":")).encode()
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.encoded = {}
+        if len(self.body) >= COMPRESSION_MIN_SIZE:
+            for encoding in COMPRESSION_ENCODINGS:
+                self.encoded[encoding] = compress_body(self.body, encoding, precompressed=True)
+
+    def response(self, request: Request, etag: Optional[str] = None, last_modified: Optional[datetime] = None,
+                 cache_control: str = REVALIDATE_CACHE_CONTROL) -> Response:
+        """Serve the payload, or a 304 when the client's copy is current.
+
+        ``etag`` defaults to a hash of the body; routes backed by
+        collection versions pass their version ETag instead.
+        """
+        etag = etag or self.etag
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), tuple(self.encoded))
+        headers = validator_headers(encoded_etag(etag, encoding), last_modified, cache_control)
+        if not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        if encoding is None:
+            return Response(self.body, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(self.encoded[encoding], media_type="application/json", headers=headers)
+
+async def cached_payload(cache: QueryCache, key: tuple, load) -> CachedPayload:
+    payload = cache.get(key)
+    if payload is None:
+        payload = CachedPayload(await load())
+        cache.set(key, payload)
+    return payload
+
 # ============================================================================
 # DATA MODELS
 # ============================================================================
@@ -201,6 +1290,14 @@ class MenuItem(BaseModel):
     branch_ids: Optional[List[str]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class MenuSearchResult(MenuItem):
+    category_name: Optional[str] = None
+    score: float
+
+class BestsellerItem(MenuItem):
+    rank: int
+    quantity_sold: int
+
 # Table Models - States: vacant → occupied → cleaning → vacant
 class TableCreate(BaseModel):
     branch_id: str
@@ -211,6 +1308,7 @@ class TableCreate(BaseModel):
 class TableStatusUpdate(BaseModel):
     status: Literal["vacant", "occupied", "cleaning"]
     order_id: Optional[str] = None
+    expected_version: Optional[int] = None  # refuse the update if the table has moved on
 
 class Table(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -221,6 +1319,7 @@ class Table(BaseModel):
     location: Optional[str] = None
     status: Literal["vacant", "occupied", "cleaning"] = "vacant"
     current_order_id: Optional[str] = None
+    version: int = 0  # floor version of the table's last write
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # Delivery Partner Models - States: available → busy → available
@@ -288,9 +1387,45 @@ class Order(BaseModel):
     table_id: Optional[str] = None
     delivery_partner_id: Optional[str] = None
     special_instructions: Optional[str] = None
+    status_timestamps: Dict[str, datetime] = Field(default_factory=dict)  # status -> when the order entered it
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class OrderSummary(BaseModel):
+    """Order list row without line items, addresses or payment details"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: str
+    branch_id: str
+    customer_name: str
+    customer_phone: str
+    order_type: str
+    status: str = "pending"
+    payment_status: str = "pending"
+    total: float
+    table_id: Optional[str] = None
+    item_count: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+class KitchenOrderItem(BaseModel):
+    menu_item_name: str
+    quantity: int
+
+class KitchenOrder(BaseModel):
+    """What the kitchen needs to cook an order: no customer or prices"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: str
+    branch_id: str
+    order_type: str
+    status: str = "pending"
+    table_id: Optional[str] = None
+    items: List[KitchenOrderItem]
+    special_instructions: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
 class OrderStatusUpdate(BaseModel):
     status: Literal["pending", "confirmed", "preparing", "ready", "picked_up", "on_the_way", "delivered", "served", "completed", "cancelled"]
 
@@ -355,6 +1490,10 @@ class Coupon(BaseModel):
     usage_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class OfferEvaluate(BaseModel):
+    order_total: float
+    branch_id: Optional[str] = None
+
 class CouponApply(BaseModel):
     code: str
     order_total: float
@@ -415,7 +1554,6 @@ async def send_otp(otp_request: OTPRequest):
             phone = "+91" + phone
     
     # Validate Indian phone format
-    import re
     if not re.match(r"^\+91[6-9]\d{9}$", phone):
         raise HTTPException(status_code=400, detail="Invalid Indian phone number")
     
@@ -591,16 +1729,15 @@ async def google_auth_session(request: GoogleSessionRequest):
     Exchange Emergent Auth session_id for app JWT token.
     This is called after the user returns from Google OAuth via Emergent Auth.
     """
-    import httpx
-    
     try:
         # Call Emergent Auth to get session data
         async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": request.session_id},
-                timeout=10.0
-            )
+            with track_outbound("google", "session_data"):
+                response = await client.get(
+                    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+                    headers={"X-Session-ID": request.session_id},
+                    timeout=10.0
+                )
             
             if response.status_code != 200:
                 raise HTTPException(status_code=401, detail="Invalid session ID")
@@ -673,8 +1810,6 @@ async def facebook_auth(request: FacebookAuthRequest):
     Authenticate with Facebook access token.
     Verifies token with Facebook Graph API and creates/updates user.
     """
-    import httpx
-    
     try:
         async with httpx.AsyncClient() as client:
             # Verify token and get user data from Facebook
@@ -684,7 +1819,8 @@ async def facebook_auth(request: FacebookAuthRequest):
                 "access_token": request.access_token,
             }
             
-            response = await client.get(user_url, params=user_params, timeout=10.0)
+            with track_outbound("facebook", "me"):
+                response = await client.get(user_url, params=user_params, timeout=10.0)
             
             if response.status_code != 200:
                 raise HTTPException(status_code=401, detail="Invalid Facebook token")
@@ -761,39 +1897,49 @@ async def create_branch(branch_data: BranchCreate, current_user: dict = Depends(
     doc = branch.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.branches.insert_one(doc)
+    await invalidate_collection("branches", branch.id)
     return branch
 
+branch_payload_cache = QueryCache("branch_payloads", ttl=60, depends_on=("branches",))
+
 @api_router.get("/branches", response_model=List[Branch])
-async def get_branches(is_active: Optional[bool] = None):
+async def get_branches(request: Request, is_active: Optional[bool] = None):
+    etag, last_modified = collection_versions.etag("branches"), collection_versions.last_modified("branches")
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    payload = await cached_payload(
+        branch_payload_cache, (collection_versions.key("branches"), is_active), lambda: load_branches(is_active)
+    )
+    return payload.response(request, etag, last_modified)
+
+async def load_branches(is_active: Optional[bool]):
     query = {}
     if is_active is not None:
         query["is_active"] = is_active
-    
     branches = await db.branches.find(query, {"_id": 0}).to_list(1000)
-    for branch in branches:
-        if isinstance(branch['created_at'], str):
-            branch['created_at'] = datetime.fromisoformat(branch['created_at'])
-    return branches
+    return [Branch(**branch).model_dump(mode="json") for branch in branches]
 
 @api_router.get("/branches/{branch_id}", response_model=Branch)
-async def get_branch(branch_id: str):
-    branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
-    if not branch:
-        raise HTTPException(status_code=404, detail="Branch not found")
-    if isinstance(branch['created_at'], str):
-        branch['created_at'] = datetime.fromisoformat(branch['created_at'])
-    return branch
+async def get_branch(request: Request, branch_id: str):
+    etag, last_modified = collection_versions.etag("branches"), collection_versions.last_modified("branches")
+    # The validators cover the whole collection, so the branch has to be
+    # known to exist before a 304 is given; only found branches are cached
+    key = (collection_versions.key("branches"), "branch", branch_id)
+    payload = branch_payload_cache.get(key)
+    if payload is None:
+        branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
+        if not branch:
+            raise HTTPException(status_code=404, detail="Branch not found")
+        payload = CachedPayload(Branch(**branch).model_dump(mode="json"))
+        branch_payload_cache.set(key, payload)
+    return payload.response(request, etag, last_modified)
 
 @api_router.put("/branches/{branch_id}", response_model=Branch)
 async def update_branch(branch_id: str, branch_data: BranchCreate, current_user: dict = Depends(require_role(["admin"]))):
-    existing_branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
-    if not existing_branch:
-        raise HTTPException(status_code=404, detail="Branch not found")
-    
     update_data = branch_data.model_dump()
-    await db.branches.update_one({"id": branch_id}, {"$set": update_data})
+    updated_branch = await update_and_fetch(db.branches, {"id": branch_id}, {"$set": update_data}, "Branch not found")
+    await invalidate_collection("branches", branch_id)
     
-    updated_branch = await db.branches.find_one({"id": branch_id}, {"_id": 0})
     if isinstance(updated_branch['created_at'], str):
         updated_branch['created_at'] = datetime.fromisoformat(updated_branch['created_at'])
     return updated_branch
@@ -808,15 +1954,24 @@ async def create_category(category_data: MenuCategoryCreate, current_user: dict
     doc = category.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.menu_categories.insert_one(doc)
+    await invalidate_collection("menu_categories", category.id)
     return category
 
+category_payload_cache = QueryCache("category_payloads", ttl=60, depends_on=("menu_categories",))
+
 @api_router.get("/menu/categories", response_model=List[MenuCategory])
-async def get_categories():
+async def get_categories(request: Request):
+    etag, last_modified = collection_versions.etag("menu_categories"), collection_versions.last_modified("menu_categories")
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    payload = await cached_payload(
+        category_payload_cache, (collection_versions.key("menu_categories"),), load_active_categories
+    )
+    return payload.response(request, etag, last_modified)
+
+async def load_active_categories():
     categories = await db.menu_categories.find({"is_active": True}, {"_id": 0}).sort("display_order", 1).to_list(100)
-    for category in categories:
-        if isinstance(category['created_at'], str):
-            category['created_at'] = datetime.fromisoformat(category['created_at'])
-    return categories
+    return [MenuCategory(**category).model_dump(mode="json") for category in categories]
 
 # ============================================================================
 # MENU ITEM ROUTES
@@ -833,49 +1988,392 @@ async def create_menu_item(item_data: MenuItemCreate, current_user: dict = Depen
     doc = item.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.menu_items.insert_one(doc)
+    await invalidate_collection("menu_items", item.id)
     return item
 
+def menu_branch_filter(branch_id: str) -> dict:
+    """Items offered at ``branch_id``: branch_ids unset means every branch"""
+    return {"$or": [{"branch_ids": None}, {"branch_ids": branch_id}]}
+
+menu_payload_cache = QueryCache("menu_payloads", ttl=60, depends_on=("menu_items",))
+MENU_ITEMS_LIMIT = 500
+
+async def known_menu_filters(branch_id: Optional[str], category_id: Optional[str]) -> bool:
+    """Whether the filters name an existing branch and active category,
+    checked against the cached branch and category lists"""
+    if branch_id:
+        branches = await cached_payload(
+            branch_payload_cache, (collection_versions.key("branches"), None), lambda: load_branches(None)
+        )
+        if not any(branch["id"] == branch_id for branch in branches.content):
+            return False
+    if category_id:
+        categories = await cached_payload(
+            category_payload_cache, (collection_versions.key("menu_categories"),), load_active_categories
+        )
+        if not any(category["id"] == category_id for category in categories.content):
+            return False
+    return True
+
 @api_router.get("/menu/items", response_model=List[MenuItem])
-async def get_menu_items(category_id: Optional[str] = None, branch_id: Optional[str] = None, limit: Optional[int] = 500):
+async def get_menu_items(
+    request: Request,
+    category_id: Optional[str] = None,
+    branch_id: Optional[str] = None,
+    limit: Optional[int] = MENU_ITEMS_LIMIT,
+    sort: Optional[Literal["popular"]] = None,
+    window: int = 7
+):
+    # Popularity moves with every completed order, so only the plain menu
+    # is revalidated against the collection version
+    etag, last_modified = collection_versions.etag("menu_items"), collection_versions.last_modified("menu_items")
+    if sort is None and not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    
+    # Reasonable limit for menu items
+    limit = min(limit or MENU_ITEMS_LIMIT, MENU_ITEMS_LIMIT)
+    # Only full menus of real branches and categories are cached, so query
+    # strings made up by clients can't fill the cache
+    payload = None
+    if limit == MENU_ITEMS_LIMIT and await known_menu_filters(branch_id, category_id):
+        payload = await cached_payload(
+            menu_payload_cache, (collection_versions.key("menu_items"), category_id, branch_id),
+            lambda: load_menu_items(category_id, branch_id, limit)
+        )
+        items = payload.content
+    else:
+        items = await load_menu_items(category_id, branch_id, limit)
+    if sort == "popular":
+        # Most sold first over the window; unsold items keep menu order
+        scores = dict(popularity_index.ranking(branch_id, check_popularity_window(window)))
+        return sorted(items, key=lambda item: -scores.get(item["id"], 0))
+    if payload is None:
+        return Response(json.dumps(items, separators=(",", ":")), media_type="application/json",
+                        headers=validator_headers(etag, last_modified))
+    return payload.response(request, etag, last_modified)
+
+async def load_menu_items(category_id: Optional[str], branch_id: Optional[str], limit: int):
     query = {"is_available": True}
     if category_id:
         query["category_id"] = category_id
-    
-    # Reasonable limit for menu items
-    limit = min(limit or 500, 500)
-    items = await db.menu_items.find(query, {"_id": 0}).to_list(limit)
-    
-    # Filter by branch if specified
     if branch_id:
-        filtered_items = []
-        for item in items:
-            # If branch_ids is None, item is available at all branches
-            if item.get("branch_ids") is None or branch_id in item.get("branch_ids", []):
-                filtered_items.append(item)
-        items = filtered_items
-    
-    for item in items:
-        if isinstance(item['created_at'], str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-    return items
+        query.update(menu_branch_filter(branch_id))
+    # Sorted by _id to keep insertion order whichever index serves the query
+    items = await db.menu_items.find(query, {"_id": 0}).sort("_id", 1).to_list(limit)
+    return [MenuItem(**item).model_dump(mode="json") for item in items]
 
 @api_router.put("/menu/items/{item_id}", response_model=MenuItem)
 async def update_menu_item(item_id: str, item_data: MenuItemCreate, current_user: dict = Depends(require_role(["admin"]))):
-    existing_item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
-    if not existing_item:
-        raise HTTPException(status_code=404, detail="Menu item not found")
-    
     update_data = item_data.model_dump()
-    await db.menu_items.update_one({"id": item_id}, {"$set": update_data})
+    updated_item = await update_and_fetch(db.menu_items, {"id": item_id}, {"$set": update_data}, "Menu item not found")
+    await invalidate_collection("menu_items", item_id)
     
-    updated_item = await db.menu_items.find_one({"id": item_id}, {"_id": 0})
     if isinstance(updated_item['created_at'], str):
         updated_item['created_at'] = datetime.fromisoformat(updated_item['created_at'])
     return updated_item
 
+# ============================================================================
+# MENU SEARCH
+# ============================================================================
+
+class MenuSearchIndex:
+    """In-process inverted index over menu item names, descriptions and
+    category names.
+
+    Query terms match tokens exactly, by prefix (bisect over the sorted
+    vocabulary) or, for terms of three or more characters, by trigram
+    similarity so that "biriyani" still finds "biryani". Every term has to
+    match for an item to be returned. Menu writes mark the index stale
+    through ``invalidate_collection`` and the next search rebuilds it.
+    """
+
+    FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+    PREFIX_SCORE = 0.9
+    FUZZY_SCORE = 0.8
+    MIN_SIMILARITY = 0.4
+    MAX_EXPANSIONS = 50
+
+    def __init__(self, db):
+        self.db = db
+        self.depends_on = {"menu_items", "menu_categories"}
+        self.stale = True
+        self.built = False
+        self._lock = asyncio.Lock()
+        self.items = []
+        self.postings = {}
+        self.vocabulary = []
+        self.trigram_postings = {}
+        self.trigram_counts = {}
+        QueryCache.registry["menu_search"] = self
+
+    @staticmethod
+    def tokenize(text: Optional[str]) -> List[str]:
+        if not text:
+            return []
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        return re.findall(r"\w+", text)
+
+    @staticmethod
+    def trigrams(token: str) -> set:
+        padded = f" {token} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def clear(self):
+        self.stale = True
+
+    async def ensure_fresh(self):
+        # Until the first build lands there is nothing to serve, so callers
+        # queue on the lock behind it; afterwards a rebuild in progress
+        # doesn't hold up searches against the previous index
+        if not self.stale and self.built:
+            return
+        async with self._lock:
+            if self.stale:
+                # Cleared first so a write landing during the load marks it stale again
+                self.stale = False
+                try:
+                    await self.build()
+                except Exception:
+                    self.stale = True
+                    raise
+
+    async def build(self):
+        categories = await self.db.menu_categories.find({"is_active": True}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        items = await self.db.menu_items.find({"is_available": True}, {"_id": 0}).to_list(None)
+        category_names = {c["id"]: c["name"] for c in categories}
+        
+        postings = {}
+        for index, item in enumerate(items):
+            if isinstance(item['created_at'], str):
+                item['created_at'] = datetime.fromisoformat(item['created_at'])
+            item["category_name"] = category_names.get(item["category_id"])
+            fields = {"name": item["name"], "category": item["category_name"], "description": item.get("description")}
+            for field, text in fields.items():
+                weight = self.FIELD_WEIGHTS[field]
+                for token in self.tokenize(text):
+                    token_postings = postings.setdefault(token, {})
+                    token_postings[index] = max(token_postings.get(index, 0), weight)
+        
+        trigram_postings = {}
+        trigram_counts = {}
+        for token in postings:
+            if len(token) >= 3:
+                grams = self.trigrams(token)
+                trigram_counts[token] = len(grams)
+                for gram in grams:
+                    trigram_postings.setdefault(gram, []).append(token)
+        
+        self.items = items
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+        self.trigram_postings = trigram_postings
+        self.trigram_counts = trigram_counts
+        self.built = True
+
+    def _expand(self, term: str) -> dict:
+        """Vocabulary tokens matching ``term`` -> match quality in (0, 1]"""
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+        
+        start = bisect.bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:start + self.MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            matches.setdefault(token, self.PREFIX_SCORE)
+        
+        if len(term) >= 3:
+            grams = self.trigrams(term)
+            shared = Counter(token for gram in grams for token in self.trigram_postings.get(gram, ()))
+            for token, count in shared.items():
+                similarity = count / (len(grams) + self.trigram_counts[token] - count)
+                if similarity >= self.MIN_SIMILARITY:
+                    matches[token] = max(matches.get(token, 0), similarity * self.FUZZY_SCORE)
+        return matches
+
+    def search(self, query: str, branch_id: Optional[str] = None, limit: int = 20) -> List[dict]:
+        terms = self.tokenize(query)
+        if not terms:
+            return []
+        
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, quality in self._expand(term).items():
+                for index, weight in self.postings[token].items():
+                    term_scores[index] = max(term_scores.get(index, 0), quality * weight)
+            scores = term_scores if scores is None else {
+                index: score + term_scores[index] for index, score in scores.items() if index in term_scores
+            }
+            if not scores:
+                return []
+        
+        results = []
+        for index, score in sorted(scores.items(), key=lambda pair: (-pair[1], self.items[pair[0]]["name"])):
+            item = self.items[index]
+            if branch_id and item.get("branch_ids") is not None and branch_id not in item["branch_ids"]:
+                continue
+            results.append({**item, "score": round(score, 3)})
+            if len(results) >= limit:
+                break
+        return results
+
+menu_search_index = MenuSearchIndex(db)
+
+@api_router.get("/menu/search", response_model=List[MenuSearchResult])
+async def search_menu(q: str, branch_id: Optional[str] = None, limit: int = 20):
+    """Search available dishes by name, description or category, tolerating typos"""
+    await menu_search_index.ensure_fresh()
+    return menu_search_index.search(q, branch_id, min(limit, 100))
+
 # ============================================================================
 # TABLE ROUTES
 # ============================================================================
+# Every table write takes the next value of its branch's ``tables:<branch>``
+# counter as the table's ``version``, so "what changed since version N" is
+# the tables with a higher version. On a replica set the counter is bumped
+# in the same transaction as the table write, so versions commit in order.
+# A standalone mongod has no transactions and the per-branch lock only
+# orders writes within one worker, so version N can land after N+1 written
+# by another worker; there ``since_version`` polls also return the
+# TABLE_VERSION_WINDOW versions below the one asked for.
+
+TABLE_VERSION_WINDOW = 20
+
+class FloorMap:
+    """Tables of every branch, kept current from the change hub.
+
+    Loaded once, then follows table writes through a change hub
+    subscription; a copy only replaces the one held if its ``version`` is
+    higher, so late or repeated events are harmless. If the subscription
+    drops events, or on a standalone mongod another worker publishes a
+    table write on the invalidation bus, the map reloads from MongoDB.
+    """
+
+    def __init__(self, db, hub):
+        self.db = db
+        self.hub = hub
+        self.depends_on = {"tables"}
+        self.stale = True
+        self._lock = asyncio.Lock()
+        self._write_locks = {}
+        self._subscription = None
+        self._dropped = 0
+        self._tables = {}  # branch_id -> {table_id: table}
+        self._branches = {}  # table_id -> branch_id
+        QueryCache.registry["floor_map"] = self
+
+    def clear(self):
+        self.stale = True
+
+    def write_lock(self, branch_id: str) -> asyncio.Lock:
+        return self._write_locks.setdefault(branch_id, asyncio.Lock())
+
+    def subscription(self) -> ChangeSubscription:
+        if self._subscription is None:
+            self._subscription = self.hub.subscribe(collections=["tables"])
+        return self._subscription
+
+    async def ensure_fresh(self):
+        self.drain()
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    self.stale = False
+                    self._dropped = self.subscription().dropped
+                    try:
+                        tables = await self.db.tables.find({}, {"_id": 0}).to_list(None)
+                    except Exception:
+                        self.stale = True
+                        raise
+                    for table in tables:
+                        self.apply(table)
+
+    def drain(self):
+        subscription = self.subscription()
+        while not subscription.queue.empty():
+            self.apply(subscription.queue.get_nowait()["document"])
+        if subscription.dropped != self._dropped:
+            self._dropped = subscription.dropped
+            self.stale = True
+
+    async def run(self):
+        subscription = self.subscription()
+        while True:
+            self.apply((await subscription.get())["document"])
+            self.drain()
+
+    def apply(self, table: dict):
+        if not table.get("id") or not table.get("branch_id"):
+            return
+        tables = self._tables.setdefault(table["branch_id"], {})
+        current = tables.get(table["id"])
+        if current is None or table.get("version", 0) > current.get("version", 0):
+            tables[table["id"]] = table
+            self._branches[table["id"]] = table["branch_id"]
+
+    def get(self, table_id: str) -> Optional[dict]:
+        branch_id = self._branches.get(table_id)
+        return self._tables[branch_id][table_id] if branch_id else None
+
+    def tables(self, branch_id: Optional[str] = None, status: Optional[str] = None,
+               since_version: Optional[int] = None) -> List[dict]:
+        floors = [self._tables.get(branch_id, {})] if branch_id else list(self._tables.values())
+        return [
+            table for floor in floors for table in floor.values()
+            if (status is None or table.get("status") == status)
+            and (since_version is None or table.get("version", 0) > since_version)
+        ]
+
+floor_map = FloorMap(db, change_hub)
+
+async def write_table(table_id: str, branch_id: str, update: dict, expected_version: Optional[int] = None) -> Optional[dict]:
+    """Apply ``update`` to a table under the next version of its branch's
+    floor. With ``expected_version`` the write only lands if the table is
+    still at that version. Returns the updated table, or None if nothing
+    matched."""
+    async def write(session):
+        return await versioned_table_update(table_id, branch_id, update, expected_version, session)
+    
+    async with floor_map.write_lock(branch_id):
+        updated_table = await run_in_transaction(write)
+    change_hub.emit("tables", "update", updated_table)
+    if updated_table is not None:
+        await share_change("tables", table_id)
+    return updated_table
+
+async def versioned_table_update(table_id: str, branch_id: str, update: dict,
+                                 expected_version: Optional[int], session) -> Optional[dict]:
+    """The write behind ``write_table``, for callers that already hold the
+    branch's write lock and run their own transaction. Emits nothing."""
+    query = {"id": table_id}
+    if expected_version is not None:
+        query["version"] = expected_version
+    version = await next_sequence(f"tables:{branch_id}", session=session)
+    return await db.tables.find_one_and_update(
+        query,
+        {"$set": {**update, "version": version}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+async def migrate_legacy_tables():
+    """Replace the old ``is_occupied`` flag with ``status`` and give
+    unversioned tables version 0"""
+    await db.tables.update_many(
+        {"status": {"$exists": False}, "is_occupied": True},
+        {"$set": {"status": "occupied"}, "$unset": {"is_occupied": ""}}
+    )
+    await db.tables.update_many(
+        {"status": {"$exists": False}},
+        {"$set": {"status": "vacant"}, "$unset": {"is_occupied": ""}}
+    )
+    await db.tables.update_many({"version": {"$exists": False}}, {"$set": {"version": 0}})
+
+async def create_table_indexes():
+    await db.tables.create_index("id")
 
 @api_router.post("/tables", response_model=Table)
 async def create_table(table_data: TableCreate, current_user: dict = Depends(require_role(["admin", "branch_manager"]))):
@@ -887,29 +2385,37 @@ async def create_table(table_data: TableCreate, current_user: dict = Depends(req
     table = Table(**table_data.model_dump())
     doc = table.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
-    await db.tables.insert_one(doc)
+    
+    async def write(session):
+        doc["version"] = table.version = await next_sequence(f"tables:{table.branch_id}", session=session)
+        await db.tables.insert_one(doc, session=session)
+    
+    async with floor_map.write_lock(table.branch_id):
+        await run_in_transaction(write)
+    change_hub.emit("tables", "insert", doc)
+    await share_change("tables", table.id)
     return table
 
 @api_router.get("/tables", response_model=List[Table])
-async def get_tables(branch_id: Optional[str] = None, status: Optional[str] = None):
-    query = {}
-    if branch_id:
-        query["branch_id"] = branch_id
-    if status:
-        query["status"] = status
-    
-    tables = await db.tables.find(query, {"_id": 0}).to_list(1000)
-    for table in tables:
-        if isinstance(table['created_at'], str):
-            table['created_at'] = datetime.fromisoformat(table['created_at'])
-        # Handle legacy data with is_occupied field
-        if 'is_occupied' in table and 'status' not in table:
-            table['status'] = 'occupied' if table['is_occupied'] else 'vacant'
-    return tables
+async def get_tables(branch_id: Optional[str] = None, status: Optional[str] = None, since_version: Optional[int] = None):
+    """Tables from the in-memory floor map. With ``since_version`` (needs
+    ``branch_id``) only tables written after that version are returned;
+    pass back the highest ``version`` seen to poll for changes. Without
+    transactions the window below it is sent again, as a write from another
+    worker may have committed late."""
+    if since_version is not None and not branch_id:
+        raise HTTPException(status_code=400, detail="since_version requires branch_id")
+    if since_version is not None and not transactions_supported:
+        since_version = max(since_version - TABLE_VERSION_WINDOW, 0)
+    
+    await floor_map.ensure_fresh()
+    return floor_map.tables(branch_id, status, since_version)
 
 @api_router.put("/tables/{table_id}/status")
 async def update_table_status(table_id: str, status_update: TableStatusUpdate):
-    """Update table status: vacant, occupied, or cleaning"""
+    """Update table status: vacant, occupied, or cleaning. With
+    ``expected_version`` the update is refused with 409 if the table has
+    changed since."""
     update_data = {"status": status_update.status}
     
     if status_update.status == "occupied" and status_update.order_id:
@@ -917,11 +2423,14 @@ async def update_table_status(table_id: str, status_update: TableStatusUpdate):
     elif status_update.status == "vacant":
         update_data["current_order_id"] = None
     
-    result = await db.tables.update_one({"id": table_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    await floor_map.ensure_fresh()
+    table = floor_map.get(table_id) or await db.tables.find_one({"id": table_id}, {"_id": 0})
+    if not table:
         raise HTTPException(status_code=404, detail="Table not found")
     
-    updated_table = await db.tables.find_one({"id": table_id}, {"_id": 0})
+    updated_table = await write_table(table_id, table["branch_id"], update_data, status_update.expected_version)
+    if updated_table is None:
+        raise HTTPException(status_code=409, detail="Table was changed by someone else; reload and try again")
     return updated_table
 
 # ============================================================================
@@ -954,6 +2463,7 @@ async def create_delivery_partner(partner_data: DeliveryPartnerCreate, current_u
     doc = partner.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.delivery_partners.insert_one(doc)
+    change_hub.emit("delivery_partners", "insert", doc)
     return partner
 
 @api_router.get("/delivery-partners", response_model=List[DeliveryPartner])
@@ -991,11 +2501,10 @@ async def update_delivery_partner_status(partner_id: str, status_update: Deliver
     if status_update.status == "available":
         update_data["current_order_id"] = None
     
-    result = await db.delivery_partners.update_one({"id": partner_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Delivery partner not found")
-    
-    updated_partner = await db.delivery_partners.find_one({"id": partner_id}, {"_id": 0})
+    updated_partner = await update_and_fetch(
+        db.delivery_partners, {"id": partner_id}, {"$set": update_data}, "Delivery partner not found"
+    )
+    change_hub.emit("delivery_partners", "update", updated_partner)
     return updated_partner
 
 @api_router.get("/delivery-partners/me", response_model=DeliveryPartner)
@@ -1008,12 +2517,350 @@ async def get_my_delivery_profile(current_user: dict = Depends(get_current_user)
         partner['created_at'] = datetime.fromisoformat(partner['created_at'])
     return partner
 
+# ============================================================================
+# CUSTOMER BOOTSTRAP
+# ============================================================================
+
+# Branch, category and menu payloads are shared by every visitor and come
+# from the same caches as their own endpoints; tables and delivery
+# availability change with each order and are always read live.
+
+@api_router.get("/bootstrap")
+async def get_bootstrap(request: Request, branch_id: Optional[str] = None):
+    """Everything the customer landing page needs in one round trip: active
+    branches, categories, and the menu, tables and delivery availability of
+    ``branch_id`` (the first active branch when omitted).
+
+    The ETag is a hash of the payload, so an unchanged page revalidates
+    with a 304 and no body.
+    """
+    branches, categories = await asyncio.gather(
+        cached_payload(
+            branch_payload_cache, (collection_versions.key("branches"), True), lambda: load_branches(True)
+        ),
+        cached_payload(
+            category_payload_cache, (collection_versions.key("menu_categories"),), load_active_categories
+        ),
+    )
+    branches, categories = branches.content, categories.content
+    if branch_id is None and branches:
+        branch_id = branches[0]["id"]
+    if branch_id and not any(branch["id"] == branch_id for branch in branches):
+        raise HTTPException(status_code=404, detail="Branch not found")
+    
+    menu_items, tables, delivery = [], [], {"available": False}
+    if branch_id:
+        menu, tables, delivery = await asyncio.gather(
+            cached_payload(
+                menu_payload_cache, (collection_versions.key("menu_items"), None, branch_id),
+                lambda: load_menu_items(None, branch_id, MENU_ITEMS_LIMIT)
+            ),
+            get_tables(branch_id=branch_id),
+            check_delivery_availability(branch_id),
+        )
+        menu_items = menu.content
+    
+    payload = {
+        "branch_id": branch_id,
+        "branches": branches,
+        "categories": categories,
+        "menu_items": menu_items,
+        "tables": [Table(**table).model_dump(mode="json") for table in tables],
+        "delivery_available": delivery["available"]
+    }
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ============================================================================
+# IDEMPOTENCY KEYS
+# ============================================================================
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '2048'))
+IDEMPOTENCY_LOCK_SECONDS = 60  # a key still in progress after this is assumed abandoned
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_POLL_SECONDS = 0.1
+IDEMPOTENCY_SAVE_ATTEMPTS = 5
+
+metrics.describe("idempotent_replays_total", "counter", "Requests answered with the stored response for their Idempotency-Key", ("scope",))
+
+class IdempotencyStore:
+    """First responses of requests sent with an ``Idempotency-Key`` header.
+
+    The first request with a key claims it in ``idempotency_keys`` and runs
+    the handler. Its response, success or 4xx, is kept there and in a local
+    cache, and a retry gets it back without the handler running again. A
+    duplicate that arrives while the first is still running waits for it:
+    on the same worker through a future, on another worker by polling the
+    document. A 5xx or unexpected error releases the key so the client can
+    retry; a key left in progress by a worker that died can be taken over
+    by the same request after IDEMPOTENCY_LOCK_SECONDS. Keys expire after
+    IDEMPOTENCY_TTL_HOURS.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._responses = QueryCache("idempotent_responses", ttl=IDEMPOTENCY_TTL_HOURS * 3600, maxsize=IDEMPOTENCY_CACHE_SIZE)
+        self._in_flight = {}
+
+    async def run(self, request: Request, scope: str, payload: BaseModel, handler):
+        """``handler()``'s result, or the stored response for the request's
+        ``Idempotency-Key`` if it has been seen before"""
+        key = request.headers.get("idempotency-key")
+        if not key:
+            return await handler()
+        if len(key) > 255:
+            raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+        key = f"{scope}:{key}"
+        fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+        
+        while True:
+            stored = self._responses.get(key)
+            if stored is not None:
+                metrics.inc("idempotent_replays_total", (scope,))
+                return self.respond(stored, fingerprint, replayed=True)
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            # Resolves to None if the first attempt failed; then try again
+            await asyncio.shield(in_flight)
+        
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        stored = None
+        try:
+            stored = await self.claim(key, fingerprint)
+            replayed = stored is not None
+            if not replayed:
+                stored = await self.execute(key, fingerprint, handler)
+            self._responses.set(key, stored)
+        finally:
+            del self._in_flight[key]
+            future.set_result(stored)
+        if replayed:
+            metrics.inc("idempotent_replays_total", (scope,))
+        return self.respond(stored, fingerprint, replayed)
+
+    @staticmethod
+    def check(stored: dict, fingerprint: str):
+        if stored["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    def respond(self, stored: dict, fingerprint: str, replayed: bool) -> Response:
+        self.check(stored, fingerprint)
+        headers = {"Idempotent-Replayed": "true"} if replayed else None
+        return Response(stored["body"], status_code=stored["status_code"], media_type="application/json", headers=headers)
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        """None once this request owns ``key``; the stored response if
+        another request already completed it"""
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await self.db.idempotency_keys.insert_one({
+                    "_id": key, "fingerprint": fingerprint, "state": "in_progress", "created_at": now, "locked_at": now
+                })
+                return None
+            except DuplicateKeyError:
+                pass
+            
+            doc = await self.db.idempotency_keys.find_one({"_id": key}, {"_id": 0, "fingerprint": 1, "state": 1, "status_code": 1, "body": 1})
+            if doc is None:
+                continue  # released or expired since the insert; claim it afresh
+            self.check(doc, fingerprint)
+            if doc["state"] == "done":
+                return doc
+            # The owner may have died mid-request. Only the same request may
+            # take over, so the stored fingerprint is kept.
+            taken = await self.db.idempotency_keys.find_one_and_update(
+                {
+                    "_id": key, "state": "in_progress", "fingerprint": fingerprint,
+                    "locked_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+                },
+                {"$set": {"locked_at": now}}
+            )
+            if taken is not None:
+                return None
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def execute(self, key: str, fingerprint: str, handler) -> dict:
+        try:
+            content, status_code = jsonable_encoder(await handler()), 200
+        except HTTPException as e:
+            if e.status_code >= 500:
+                await self.release(key)
+                raise
+            content, status_code = {"detail": e.detail}, e.status_code
+        except BaseException:
+            await asyncio.shield(self.release(key))
+            raise
+        
+        stored = {"fingerprint": fingerprint, "status_code": status_code, "body": json.dumps(content, separators=(",", ":"))}
+        # The handler's work is done; a key left in progress could be taken
+        # over later and run it twice, so the save outlives a disconnect
+        await asyncio.shield(self.save(key, stored))
+        return stored
+
+    async def save(self, key: str, stored: dict):
+        for attempt in range(IDEMPOTENCY_SAVE_ATTEMPTS):
+            try:
+                await self.db.idempotency_keys.update_one({"_id": key}, {"$set": {**stored, "state": "done"}})
+                return
+            except PyMongoError as e:
+                if attempt == IDEMPOTENCY_SAVE_ATTEMPTS - 1:
+                    logger.error(f"Storing the response for idempotency key {key} failed: {e}")
+                    return
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS * 2 ** attempt)
+
+    async def release(self, key: str):
+        await self.db.idempotency_keys.delete_one({"_id": key, "state": "in_progress"})
+
+idempotency_store = IdempotencyStore(db)
+
+async def create_idempotency_indexes():
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_HOURS * 3600)
+
+# ============================================================================
+# ORDER EVENTS
+# ============================================================================
+# Append-only log of order status transitions. Each branch has its own
+# sequence (``seq``) so consumers can poll for "everything after N" on the
+# (branch_id, seq) index instead of re-reading orders. On a replica set the
+# event commits in the same transaction as the order update. A standalone
+# mongod has no transactions, so a reader could see seq N+1 before N is
+# written. There each event is stamped with ``logged_at`` once its seq is
+# allocated, events younger than ORDER_EVENT_SETTLE_SECONDS are held back,
+# and a page stops at the first gap in ``seq``. A gap older than
+# ORDER_EVENT_GAP_SECONDS is taken to be an insert that failed and skipped.
+
+ORDER_EVENT_SETTLE_SECONDS = 2
+ORDER_EVENT_GAP_SECONDS = 30
+PAYMENT_ACTOR = {"id": None, "role": "payment_gateway"}
+
+def order_actor(user: Optional[dict]) -> dict:
+    if user is None:
+        return {"id": None, "role": "guest"}
+    return {"id": user["id"], "role": user.get("role")}
+
+async def append_order_event(order: dict, from_status: Optional[str], to_status: str, actor: dict, ts: str, session=None):
+    seq = await next_sequence(f"order_events:{order['branch_id']}", session=session)
+    await db.order_events.insert_one({
+        "order_id": order["id"],
+        "branch_id": order["branch_id"],
+        "from": from_status,
+        "to": to_status,
+        "actor": actor,
+        "ts": ts,
+        "seq": seq,
+        "logged_at": datetime.now(timezone.utc).isoformat()
+    }, session=session)
+
+async def transition_order(order_id: str, update: dict, actor: dict, conditions: Optional[dict] = None) -> Optional[dict]:
+    """Apply ``update`` (including ``status`` and ``updated_at``) to an order
+    and log the status change, in one transaction with the sales rollup
+    update it implies; the time the order entered the new status is kept in
+    ``status_timestamps``. Returns the order as it was before the
+    update, or None if it does not exist or doesn't match ``conditions``."""
+    async def write(session):
+        before = await db.orders.find_one_and_update(
+            {"id": order_id, **(conditions or {})},
+            {"$set": {**update, f"status_timestamps.{update['status']}": update["updated_at"]}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        rollup = 0
+        if before is not None and before.get("status") != update["status"]:
+            await append_order_event(before, before.get("status"), update["status"], actor, update["updated_at"], session)
+            await record_kitchen_sla(before, update["status"], update["updated_at"], session)
+            # Keep the daily sales rollup in step with completions and reversals
+            rollup = await sync_order_sales_rollup(before, update["status"], session)
+        return before, rollup
+    
+    before, rollup = await run_in_transaction(write)
+    if rollup:
+        popularity_index.record(before, rollup)
+    if before is not None:
+        await share_change("orders", order_id)
+    return before
+
+def order_after(before: dict, update: dict) -> dict:
+    """The order as ``transition_order`` left it, without reading it back"""
+    status_timestamps = {**before.get("status_timestamps", {}), update["status"]: update["updated_at"]}
+    return {**before, **update, "status_timestamps": status_timestamps}
+
+async def create_order_event_indexes():
+    await db.order_events.create_index([("branch_id", 1), ("seq", 1)], unique=True)
+    await db.order_events.create_index([("order_id", 1), ("seq", 1)])
+
+class OrderEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+    order_id: str
+    branch_id: str
+    from_status: Optional[str] = Field(None, alias="from")
+    to_status: str = Field(alias="to")
+    actor: dict
+    ts: datetime
+    seq: int
+
+class OrderEventPage(BaseModel):
+    events: List[OrderEvent]
+    next_seq: int
+
+@api_router.get("/order-events", response_model=OrderEventPage, response_model_by_alias=True)
+async def get_order_events(
+    branch_id: Optional[str] = None,
+    after_seq: int = 0,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: dict = Depends(require_role(["admin", "branch_manager"]))
+):
+    """Status transitions of a branch's orders with ``seq`` greater than
+    ``after_seq``, oldest first. Pass ``next_seq`` back as ``after_seq`` to
+    read only what is new."""
+    if current_user["role"] == "branch_manager":
+        branch_id = current_user.get("branch_id")
+    if not branch_id:
+        raise HTTPException(status_code=400, detail="branch_id is required")
+    
+    query = {"branch_id": branch_id, "seq": {"$gt": after_seq}}
+    if transactions_supported:
+        events = await db.order_events.find(query, {"_id": 0}).sort("seq", 1).to_list(limit)
+        return {"events": events, "next_seq": events[-1]["seq"] if events else after_seq}
+    
+    now = datetime.now(timezone.utc)
+    settled = (now - timedelta(seconds=ORDER_EVENT_SETTLE_SECONDS)).isoformat()
+    abandoned = (now - timedelta(seconds=ORDER_EVENT_GAP_SECONDS)).isoformat()
+    query["$or"] = [{"logged_at": {"$lte": settled}}, {"logged_at": {"$exists": False}, "ts": {"$lte": settled}}]
+    events = []
+    expected = after_seq + 1
+    for event in await db.order_events.find(query, {"_id": 0}).sort("seq", 1).to_list(limit):
+        if event["seq"] != expected and event.get("logged_at", event["ts"]) > abandoned:
+            break  # an earlier seq may still be on its way
+        events.append(event)
+        expected = event["seq"] + 1
+    return {"events": events, "next_seq": events[-1]["seq"] if events else after_seq}
+
 # ============================================================================
 # ORDER ROUTES
 # ============================================================================
 
 @api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate):
+async def create_order(
+    request: Request,
+    order_data: OrderCreate,
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
+    """Place an order. Retries that send the same ``Idempotency-Key`` get
+    the first response back instead of a second order."""
+    return await idempotency_store.run(request, "orders", order_data, lambda: place_order(order_data, current_user))
+
+async def place_order(order_data: OrderCreate, current_user: Optional[dict]) -> Order:
     # Validate branch exists
     branch = await db.branches.find_one({"id": order_data.branch_id}, {"_id": 0})
     if not branch:
@@ -1033,8 +2880,7 @@ async def create_order(order_data: OrderCreate):
         table = await db.tables.find_one({"id": order_data.table_id}, {"_id": 0})
         if not table:
             raise HTTPException(status_code=400, detail="Table not found")
-        table_status = table.get("status", "occupied" if table.get("is_occupied") else "vacant")
-        if table_status != "vacant":
+        if table.get("status") != "vacant":
             raise HTTPException(status_code=400, detail="Selected table is not available")
     
     # Calculate totals
@@ -1058,21 +2904,99 @@ async def create_order(order_data: OrderCreate):
     })
     
     order = Order(**order_dict)
+    order.status_timestamps = {order.status: order.created_at}
     doc = order.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     doc["updated_at"] = doc["updated_at"].isoformat()
+    doc["status_timestamps"] = {order.status: doc["created_at"]}
+    
+    # The table claim fails if anyone changed the table since it was checked
+    claims_table = order_data.order_type == "dine_in" and bool(order_data.table_id)
+    claimed = None
+    
+    async def write(session):
+        nonlocal claimed
+        claimed = None
+        if claims_table:
+            claimed = await versioned_table_update(
+                order_data.table_id, table["branch_id"],
+                {"status": "occupied", "current_order_id": order.id},
+                table.get("version", 0), session
+            )
+            if claimed is None:
+                raise HTTPException(status_code=400, detail="Selected table is not available")
+        await db.orders.insert_one(doc, session=session)
+        await append_order_event(doc, None, doc["status"], order_actor(current_user), doc["created_at"], session)
     
-    await db.orders.insert_one(doc)
-    
-    # Update table status if dine-in
-    if order_data.order_type == "dine_in" and order_data.table_id:
-        await db.tables.update_one(
-            {"id": order_data.table_id},
-            {"$set": {"status": "occupied", "current_order_id": order.id}}
-        )
+    try:
+        async with (floor_map.write_lock(table["branch_id"]) if claims_table else nullcontext()):
+            await run_in_transaction(write)
+    except Exception:
+        # Without transactions the claim already landed; hand the table back
+        # unless someone has written it since
+        if claimed is not None and not transactions_supported:
+            await write_table(
+                claimed["id"], claimed["branch_id"],
+                {"status": "vacant", "current_order_id": None},
+                expected_version=claimed["version"]
+            )
+        raise
+    if claimed is not None:
+        change_hub.emit("tables", "update", claimed)
+        await share_change("tables", claimed["id"])
+    change_hub.emit("orders", "insert", doc)
+    await share_change("orders", order.id)
     
     return order
 
+# Named views for order lists: a lighter response model and the projection
+# that reads only its fields from MongoDB
+ORDER_VIEWS = {
+    "summary": (OrderSummary, {
+        **{field: 1 for field in OrderSummary.model_fields if field != "item_count"},
+        "item_count": {"$size": {"$ifNull": ["$items", []]}}
+    }),
+    "kitchen": (KitchenOrder, {
+        **{field: 1 for field in KitchenOrder.model_fields if field != "items"},
+        "items.menu_item_name": 1,
+        "items.quantity": 1
+    }),
+    "full": (Order, {}),
+}
+
+@lru_cache(maxsize=128)
+def order_fields_model(fields: tuple):
+    """Response model for a ``fields=`` selection; every field is optional
+    so documents missing one still validate"""
+    return create_model(
+        "OrderFields",
+        __config__=ConfigDict(extra="ignore"),
+        **{field: (Optional[Order.model_fields[field].annotation], None) for field in fields}
+    )
+
+@lru_cache(maxsize=None)
+def order_list_adapter(model) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def resolve_order_view(view: str, fields: Optional[str]) -> tuple:
+    """Response model and projection for a named view, or for a
+    comma-separated ``fields`` list, which takes precedence"""
+    if not fields:
+        return ORDER_VIEWS[view]
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(Order.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown order fields: {', '.join(sorted(unknown))}")
+    selected = tuple(field for field in Order.model_fields if field in requested or field == "id")
+    return order_fields_model(selected), {field: 1 for field in selected}
+
+async def order_list_response(query: dict, view: str, fields: Optional[str], skip: int, limit: int) -> Response:
+    model, projection = resolve_order_view(view, fields)
+    orders = await db.orders.find(query, {"_id": 0, **projection}).sort("created_at", -1).skip(skip).to_list(limit)
+    # Validate and serialize in one pass in pydantic-core
+    adapter = order_list_adapter(model)
+    return Response(adapter.dump_json(adapter.validate_python(orders)), media_type="application/json")
+
 @api_router.get("/orders", response_model=List[Order])
 async def get_orders(
     branch_id: Optional[str] = None,
@@ -1080,8 +3004,13 @@ async def get_orders(
     order_type: Optional[str] = None,
     customer_id: Optional[str] = None,
     limit: Optional[int] = 50,
-    skip: Optional[int] = 0
+    skip: Optional[int] = 0,
+    view: Literal["summary", "kitchen", "full"] = "full",
+    fields: Optional[str] = None
 ):
+    """List orders, newest first. ``view=summary`` drops line items and
+    details, ``view=kitchen`` keeps only what the kitchen needs, and
+    ``fields=`` picks top-level fields (``id`` is always included)."""
     query = {}
     if branch_id:
         query["branch_id"] = branch_id
@@ -1096,18 +3025,14 @@ async def get_orders(
     limit = min(limit or 50, 100)  # Max 100 per request
     skip = skip or 0
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
-    for order in orders:
-        if isinstance(order['created_at'], str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-        if isinstance(order['updated_at'], str):
-            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
-    return orders
+    return await order_list_response(query, view, fields, skip, limit)
 
 @api_router.get("/orders/my-orders", response_model=List[Order])
 async def get_my_orders(
     limit: Optional[int] = 50,
     skip: Optional[int] = 0,
+    view: Literal["summary", "kitchen", "full"] = "full",
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Get orders for the current logged-in customer"""
@@ -1129,15 +3054,7 @@ async def get_my_orders(
     limit = min(limit or 50, 100)
     skip = skip or 0
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
-    
-    for order in orders:
-        if isinstance(order['created_at'], str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-        if isinstance(order['updated_at'], str):
-            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
-    
-    return orders
+    return await order_list_response(query, view, fields, skip, limit)
 
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str):
@@ -1151,17 +3068,19 @@ async def get_order(order_id: str):
     return order
 
 @api_router.put("/orders/{order_id}/status", response_model=Order)
-async def update_order_status(order_id: str, status_update: OrderStatusUpdate):
-    existing_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not existing_order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
+async def update_order_status(
+    order_id: str,
+    status_update: OrderStatusUpdate,
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
     update_data = {
         "status": status_update.status,
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.orders.update_one({"id": order_id}, {"$set": update_data})
+    existing_order = await transition_order(order_id, update_data, order_actor(current_user))
+    if not existing_order:
+        raise HTTPException(status_code=404, detail="Order not found")
     
     # Handle table status changes for dine-in orders
     if existing_order.get("table_id"):
@@ -1170,70 +3089,300 @@ async def update_order_status(order_id: str, status_update: OrderStatusUpdate):
             pass
         elif status_update.status == "completed":
             # Mark table as cleaning (waiter will mark vacant after cleaning)
-            await db.tables.update_one(
-                {"id": existing_order["table_id"]},
-                {"$set": {"status": "cleaning", "current_order_id": None}}
+            await write_table(
+                existing_order["table_id"], existing_order["branch_id"],
+                {"status": "cleaning", "current_order_id": None}
             )
     
     # Handle delivery partner status changes for delivery orders
     if existing_order.get("order_type") == "delivery" and existing_order.get("delivery_partner_id"):
         if status_update.status == "delivered":
             # Free up the delivery partner
-            await db.delivery_partners.update_one(
+            updated_partner = await db.delivery_partners.find_one_and_update(
                 {"id": existing_order["delivery_partner_id"]},
-                {"$set": {"status": "available", "current_order_id": None}}
+                {"$set": {"status": "available", "current_order_id": None}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
             )
+            change_hub.emit("delivery_partners", "update", updated_partner)
     
-    updated_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    updated_order = order_after(existing_order, update_data)
+    change_hub.emit("orders", "update", updated_order)
     if isinstance(updated_order['created_at'], str):
         updated_order['created_at'] = datetime.fromisoformat(updated_order['created_at'])
     if isinstance(updated_order['updated_at'], str):
         updated_order['updated_at'] = datetime.fromisoformat(updated_order['updated_at'])
     return updated_order
 
-@api_router.put("/orders/{order_id}/assign-delivery", response_model=Order)
-async def assign_delivery_partner(order_id: str, assignment: DeliveryAssignment, current_user: dict = Depends(get_current_user)):
-    """Assign a delivery partner to an order"""
-    existing_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not existing_order:
+async def assignable_order(order_id: str):
+    order = await db.orders.find_one({"id": order_id}, {"_id": 0, "order_type": 1, "status": 1})
+    if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    if existing_order.get("order_type") != "delivery":
+    if order.get("order_type") != "delivery":
         raise HTTPException(status_code=400, detail="Order is not a delivery order")
-    
-    if existing_order.get("status") != "ready":
+    if order.get("status") != "ready":
         raise HTTPException(status_code=400, detail="Order must be ready for delivery assignment")
-    
-    # Validate delivery partner exists and is available
-    partner = await db.delivery_partners.find_one({"id": assignment.delivery_partner_id}, {"_id": 0})
-    if not partner:
-        raise HTTPException(status_code=400, detail="Delivery partner not found")
-    if partner.get("status") != "available":
-        raise HTTPException(status_code=400, detail="Delivery partner is not available")
-    
-    # Update order with delivery partner
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {
-            "delivery_partner_id": assignment.delivery_partner_id,
-            "status": "picked_up",
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+
+@api_router.put("/orders/{order_id}/assign-delivery", response_model=Order)
+async def assign_delivery_partner(order_id: str, assignment: DeliveryAssignment, current_user: dict = Depends(get_current_user)):
+    """Assign a delivery partner to an order"""
+    # Order problems are reported ahead of partner problems, and a partner
+    # is only claimed for an order that qualifies
+    await assignable_order(order_id)
+    
+    # The availability check is part of the claim's filter
+    updated_partner = await db.delivery_partners.find_one_and_update(
+        {"id": assignment.delivery_partner_id, "status": "available"},
+        {"$set": {"status": "busy", "current_order_id": order_id}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if updated_partner is None:
+        partner = await db.delivery_partners.find_one({"id": assignment.delivery_partner_id}, {"_id": 0, "status": 1})
+        raise HTTPException(status_code=400, detail="Delivery partner not found" if not partner else "Delivery partner is not available")
     
-    # Mark delivery partner as busy
-    await db.delivery_partners.update_one(
-        {"id": assignment.delivery_partner_id},
-        {"$set": {"status": "busy", "current_order_id": order_id}}
+    update_data = {
+        "delivery_partner_id": assignment.delivery_partner_id,
+        "status": "picked_up",
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    existing_order = await transition_order(
+        order_id, update_data, order_actor(current_user), conditions={"order_type": "delivery", "status": "ready"}
     )
+    if existing_order is None:
+        # The order changed since it was checked; hand the partner back
+        await db.delivery_partners.update_one(
+            {"id": assignment.delivery_partner_id, "current_order_id": order_id},
+            {"$set": {"status": "available", "current_order_id": None}}
+        )
+        await assignable_order(order_id)
+        raise HTTPException(status_code=400, detail="Order must be ready for delivery assignment")
+    change_hub.emit("delivery_partners", "update", updated_partner)
     
-    updated_order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    updated_order = order_after(existing_order, update_data)
+    change_hub.emit("orders", "update", updated_order)
     if isinstance(updated_order['created_at'], str):
         updated_order['created_at'] = datetime.fromisoformat(updated_order['created_at'])
     if isinstance(updated_order['updated_at'], str):
         updated_order['updated_at'] = datetime.fromisoformat(updated_order['updated_at'])
     return updated_order
 
+# ============================================================================
+# KITCHEN QUEUE
+# ============================================================================
+# Orders carry no promised time, so a ticket is promised
+# KITCHEN_PROMISE_MINUTES after it was placed. Tickets with the same promise
+# go in KITCHEN_ORDER_TYPE_PRIORITY order: seated guests, then riders, then
+# counter pickups.
+
+KITCHEN_QUEUE_STATUSES = ("pending", "confirmed", "preparing", "ready", "picked_up", "on_the_way", "served")
+KITCHEN_COOKING_STATUSES = ("pending", "confirmed", "preparing")
+KITCHEN_PROMISE_MINUTES = {"dine_in": 20, "takeaway": 20, "delivery": 30}
+KITCHEN_ORDER_TYPE_PRIORITY = {"dine_in": 0, "delivery": 1, "takeaway": 2}
+KITCHEN_QUEUE_BUFFER = 1024
+KITCHEN_QUEUE_PROJECTION = {
+    "_id": 0, "id": 1, "order_number": 1, "branch_id": 1, "order_type": 1, "status": 1, "table_id": 1,
+    "items.menu_item_id": 1, "items.menu_item_name": 1, "items.quantity": 1,
+    "special_instructions": 1, "created_at": 1, "updated_at": 1
+}
+
+metrics.describe("kitchen_queue_reloads_total", "counter", "Kitchen queue reloads from MongoDB", ("reason",))
+
+def kitchen_ticket(order: dict) -> dict:
+    created_at = order["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    promised_at = created_at + timedelta(minutes=KITCHEN_PROMISE_MINUTES.get(order["order_type"], 20))
+    return {
+        "id": order["id"],
+        "order_number": order["order_number"],
+        "order_type": order["order_type"],
+        "status": order["status"],
+        "table_id": order.get("table_id"),
+        "items": [
+            {"menu_item_id": item.get("menu_item_id"), "menu_item_name": item["menu_item_name"], "quantity": item["quantity"]}
+            for item in order.get("items", [])
+        ],
+        "special_instructions": order.get("special_instructions"),
+        "created_at": created_at.isoformat(),
+        "promised_at": promised_at.isoformat(),
+        "updated_at": order["updated_at"]
+    }
+
+def kitchen_ticket_sort_key(ticket: dict) -> tuple:
+    return (
+        datetime.fromisoformat(ticket["promised_at"]),
+        KITCHEN_ORDER_TYPE_PRIORITY.get(ticket["order_type"], len(KITCHEN_ORDER_TYPE_PRIORITY)),
+        ticket["order_number"]
+    )
+
+class KitchenQueue:
+    """Active kitchen tickets per branch, kept current from the change hub.
+
+    Tickets are loaded once, then follow order inserts and updates through
+    a change hub subscription; an order leaves the queue once it is
+    delivered, completed or cancelled. Each branch also keeps a running
+    total of every dish still to be cooked on its pending, confirmed and
+    preparing tickets, so cooks can batch. If the subscription drops events
+    the queue reloads from MongoDB. On a standalone mongod the hub only sees
+    this worker's writes, so the queue also reloads when another worker
+    publishes an order write on the invalidation bus (see ``share_change``).
+    The response payload for a branch is built once per change.
+    """
+
+    def __init__(self, db, hub):
+        self.db = db
+        self.hub = hub
+        self.depends_on = {"orders"}
+        self.stale = True
+        self._lock = asyncio.Lock()
+        self._subscription = None
+        self._dropped = 0
+        self._tickets = {}  # branch_id -> {order_id: ticket}
+        self._batches = {}  # branch_id -> {dish: {"menu_item_name", "quantity", "orders"}}
+        self._loading = None  # order_id -> updated_at of changes applied during a reload
+        self._views = {}
+        QueryCache.registry["kitchen_queue"] = self
+
+    def clear(self):
+        self.stale = True
+
+    def subscription(self) -> ChangeSubscription:
+        if self._subscription is None:
+            self._subscription = self.hub.subscribe(collections=["orders"], maxsize=KITCHEN_QUEUE_BUFFER)
+        return self._subscription
+
+    async def ensure_fresh(self):
+        self.drain()
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    self.stale = False
+                    try:
+                        await self.build()
+                    except Exception:
+                        self.stale = True
+                        raise
+
+    async def build(self):
+        """Reload from MongoDB. The current tickets keep serving until the
+        load has succeeded and the new ones are swapped in."""
+        subscription = self.subscription()
+        # Anything still queued is older than what the load reads
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        self._dropped = subscription.dropped
+        # Changes applied while the load runs may be newer than what it
+        # returns; remember them so the loaded copy can't overwrite them
+        self._loading = {}
+        try:
+            orders = await self.db.orders.find(
+                {"status": {"$in": list(KITCHEN_QUEUE_STATUSES)}}, KITCHEN_QUEUE_PROJECTION
+            ).to_list(None)
+            loading, self._loading = self._loading, None
+            carried = [
+                (branch_id, ticket)
+                for branch_id, tickets in self._tickets.items()
+                for order_id, ticket in tickets.items() if order_id in loading
+            ]
+            previous = self._tickets, self._batches, self._views
+            self._tickets, self._batches, self._views = {}, {}, {}
+            try:
+                for order in orders:
+                    if order["id"] not in loading:
+                        self.apply(order)
+                for branch_id, ticket in carried:
+                    self._tickets.setdefault(branch_id, {})[ticket["id"]] = ticket
+                    self._count(branch_id, ticket, 1)
+            except Exception:
+                self._tickets, self._batches, self._views = previous
+                raise
+        finally:
+            self._loading = None
+
+    def drain(self):
+        """Apply whatever the subscription has buffered"""
+        subscription = self.subscription()
+        while not subscription.queue.empty():
+            self.apply(subscription.queue.get_nowait()["document"])
+        if subscription.dropped != self._dropped:
+            self._dropped = subscription.dropped
+            self.stale = True
+            metrics.inc("kitchen_queue_reloads_total", ("dropped_events",))
+
+    async def run(self):
+        """Apply order changes as they arrive, so reads rarely have to"""
+        subscription = self.subscription()
+        while True:
+            event = await subscription.get()
+            self.apply(event["document"])
+            self.drain()
+
+    def apply(self, order: dict):
+        order_id, branch_id = order.get("id"), order.get("branch_id")
+        if not order_id or not branch_id:
+            return
+        ticket = kitchen_ticket(order) if order.get("status") in KITCHEN_QUEUE_STATUSES else None
+        updated_at = datetime.fromisoformat(order["updated_at"])
+        tickets = self._tickets.setdefault(branch_id, {})
+        current = tickets.get(order_id)
+        if current is not None and datetime.fromisoformat(current["updated_at"]) > updated_at:
+            return  # a late copy of an older state
+        if self._loading is not None:
+            self._loading[order_id] = updated_at
+        
+        if current is not None:
+            self._count(branch_id, current, -1)
+            del tickets[order_id]
+        if ticket is not None:
+            tickets[order_id] = ticket
+            self._count(branch_id, ticket, 1)
+        self._views.pop(branch_id, None)
+
+    def _count(self, branch_id: str, ticket: dict, sign: int):
+        if ticket["status"] not in KITCHEN_COOKING_STATUSES:
+            return
+        batch = self._batches.setdefault(branch_id, {})
+        # A dish listed twice on one ticket still counts as one order
+        dishes = {}
+        for item in ticket["items"]:
+            key = item["menu_item_id"] or item["menu_item_name"]
+            name, quantity = dishes.get(key, (item["menu_item_name"], 0))
+            dishes[key] = (name, quantity + item["quantity"])
+        for key, (name, quantity) in dishes.items():
+            dish = batch.setdefault(key, {"menu_item_id": key, "menu_item_name": name, "quantity": 0, "orders": 0})
+            dish["quantity"] += sign * quantity
+            dish["orders"] += sign
+            if dish["orders"] <= 0:
+                del batch[key]
+
+    def view(self, branch_id: str) -> CachedPayload:
+        """Tickets in cooking order and dishes pending across them, largest first"""
+        payload = self._views.get(branch_id)
+        if payload is None:
+            tickets = sorted(self._tickets.get(branch_id, {}).values(), key=kitchen_ticket_sort_key)
+            batch = sorted(self._batches.get(branch_id, {}).values(), key=lambda dish: (-dish["quantity"], dish["menu_item_name"]))
+            payload = self._views[branch_id] = CachedPayload({"branch_id": branch_id, "tickets": tickets, "batch": batch})
+        return payload
+
+kitchen_queue = KitchenQueue(db, change_hub)
+
+@api_router.get("/kitchen/queue")
+async def get_kitchen_queue(
+    request: Request,
+    branch_id: Optional[str] = None,
+    current_user: dict = Depends(require_role(["admin", "branch_manager", "kitchen_staff"]))
+):
+    """Active tickets for a branch, next due first, with a running count of
+    each dish still to be cooked across them"""
+    if current_user["role"] != "admin":
+        branch_id = current_user.get("branch_id")
+    if not branch_id:
+        raise HTTPException(status_code=400, detail="branch_id is required")
+    
+    await kitchen_queue.ensure_fresh()
+    return kitchen_queue.view(branch_id).response(request)
+
 # ============================================================================
 # OFFER ROUTES
 # ============================================================================
@@ -1246,35 +3395,164 @@ async def create_offer(offer_data: OfferCreate, current_user: dict = Depends(req
     doc["valid_from"] = doc["valid_from"].isoformat()
     doc["valid_until"] = doc["valid_until"].isoformat()
     await db.offers.insert_one(doc)
+    await invalidate_collection("offers", offer.id)
     return offer
 
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def offer_discount(offer: dict, order_total: float) -> float:
+    if offer["discount_type"] == "percentage":
+        discount = order_total * (offer["discount_value"] / 100)
+    else:
+        discount = offer["discount_value"]
+    return min(discount, order_total)  # Discount can't exceed order total
+
+class OfferIndex:
+    """Live offers per branch, kept current by an interval sweep.
+
+    Active offers are loaded once per write and turned into start/end
+    events sorted by time. Applying the events that are due gives the live
+    set; a timer fires at the next boundary, so offers start and expire on
+    time without any request rescanning them. The live list, ETag token and
+    response payload for each branch are built once per boundary.
+    """
+
+    UNLISTED_BRANCH = "*"
+
+    def __init__(self, db):
+        self.db = db
+        self.depends_on = {"offers"}
+        self.stale = True
+        self._lock = asyncio.Lock()
+        self._events = []
+        self._cursor = 0
+        self._live = {}
+        self._views = {}
+        self._branch_ids = set()
+        self._timer = None
+        QueryCache.registry["offer_index"] = self
+
+    def clear(self):
+        self.stale = True
+
+    async def ensure_fresh(self):
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    # Cleared first so a write landing during the load marks it stale again
+                    self.stale = False
+                    try:
+                        await self.build()
+                    except Exception:
+                        self.stale = True
+                        raise
+        elif self._cursor < len(self._events) and self._events[self._cursor][0] <= datetime.now(timezone.utc):
+            # The timer is late (e.g. the loop was busy); catch up now
+            self.advance()
+
+    async def build(self):
+        offers = await self.db.offers.find({"is_active": True}, {"_id": 0}).to_list(None)
+        now = datetime.now(timezone.utc)
+        events = []
+        for position, doc in enumerate(offers):
+            try:
+                offer = Offer(**doc)
+            except ValidationError as e:
+                # One bad document shouldn't take every other offer down with it
+                logger.error(f"Skipping malformed offer {doc.get('id')}: {e}")
+                continue
+            valid_from, valid_until = as_utc(offer.valid_from), as_utc(offer.valid_until)
+            if valid_until < now:
+                continue
+            content = offer.model_dump(mode="json")
+            events.append((valid_from, position, True, content))
+            # valid_until is inclusive
+            events.append((valid_until + timedelta(microseconds=1), position, False, content))
+        events.sort(key=lambda event: event[:3])
+        
+        self._events = events
+        self._cursor = 0
+        self._live = {}
+        self.advance()
+
+    def advance(self):
+        now = datetime.now(timezone.utc)
+        while self._cursor < len(self._events) and self._events[self._cursor][0] <= now:
+            _, position, starts, content = self._events[self._cursor]
+            if starts:
+                self._live[position] = content
+            else:
+                self._live.pop(position, None)
+            self._cursor += 1
+        self._views = {}
+        self._branch_ids = {
+            branch_id for content in self._live.values() for branch_id in content["branch_ids"] or ()
+        }
+        
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._cursor < len(self._events):
+            delay = (self._events[self._cursor][0] - now).total_seconds()
+            self._timer = asyncio.get_running_loop().call_later(max(delay, 0), self.advance)
+
+    def live(self, branch_id: Optional[str]) -> dict:
+        """Live offers for a branch (all branches when None), in creation order"""
+        if branch_id and branch_id not in self._branch_ids:
+            # No live offer names this branch, so it sees only the offers
+            # valid everywhere; one view serves every such id, which keeps
+            # the cache bounded whatever ids clients send
+            branch_id = self.UNLISTED_BRANCH
+        view = self._views.get(branch_id)
+        if view is None:
+            offers = [
+                content for _, content in sorted(self._live.items())
+                if not branch_id or content["branch_ids"] is None or branch_id in content["branch_ids"]
+            ]
+            view = self._views[branch_id] = {
+                "offers": offers,
+                # The live set changes with the clock as well as with
+                # writes, so it is part of the ETag
+                "token": hashlib.sha256(",".join(offer["id"] for offer in offers).encode()).hexdigest()[:12],
+                "payload": CachedPayload(offers)
+            }
+        return view
+
+    def evaluate(self, branch_id: Optional[str], order_total: float) -> dict:
+        applicable = []
+        for offer in self.live(branch_id)["offers"]:
+            if offer["min_order_value"] and order_total < offer["min_order_value"]:
+                continue
+            discount = offer_discount(offer, order_total)
+            applicable.append({
+                "id": offer["id"],
+                "title": offer["title"],
+                "description": offer["description"],
+                "discount_type": offer["discount_type"],
+                "discount_value": offer["discount_value"],
+                "calculated_discount": round(discount, 2),
+                "final_total": round(order_total - discount, 2)
+            })
+        applicable.sort(key=lambda offer: -offer["calculated_discount"])
+        return {"offers": applicable, "best_offer": applicable[0] if applicable else None}
+
+offer_index = OfferIndex(db)
+
 @api_router.get("/offers", response_model=List[Offer])
-async def get_offers(branch_id: Optional[str] = None):
-    now = datetime.now(timezone.utc)
-    query = {
-        "is_active": True,
-        "valid_from": {"$lte": now.isoformat()},
-        "valid_until": {"$gte": now.isoformat()}
-    }
-    
-    offers = await db.offers.find(query, {"_id": 0}).to_list(1000)
-    
-    # Filter by branch if specified
-    if branch_id:
-        filtered_offers = []
-        for offer in offers:
-            if offer.get("branch_ids") is None or branch_id in offer.get("branch_ids", []):
-                filtered_offers.append(offer)
-        offers = filtered_offers
-    
-    for offer in offers:
-        if isinstance(offer['created_at'], str):
-            offer['created_at'] = datetime.fromisoformat(offer['created_at'])
-        if isinstance(offer['valid_from'], str):
-            offer['valid_from'] = datetime.fromisoformat(offer['valid_from'])
-        if isinstance(offer['valid_until'], str):
-            offer['valid_until'] = datetime.fromisoformat(offer['valid_until'])
-    return offers
+async def get_offers(request: Request, branch_id: Optional[str] = None):
+    await offer_index.ensure_fresh()
+    view = offer_index.live(branch_id)
+    etag = collection_versions.etag("offers", extra=view["token"])
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=validator_headers(etag))
+    return view["payload"].response(request, etag)
+
+@api_router.post("/offers/evaluate")
+async def evaluate_offers(data: OfferEvaluate):
+    """Offers live now for a cart, with the discount each gives, best first"""
+    await offer_index.ensure_fresh()
+    return offer_index.evaluate(data.branch_id, data.order_total)
 
 # ============================================================================
 # COUPON ROUTES
@@ -1414,6 +3692,7 @@ async def create_review(review_data: ReviewCreate, current_user: dict = Depends(
     doc["created_at"] = doc["created_at"].isoformat()
     doc["updated_at"] = doc["updated_at"].isoformat()
     await db.reviews.insert_one(doc)
+    await invalidate_collection("reviews", review.id)
     
     return review
 
@@ -1454,9 +3733,15 @@ async def get_all_reviews(
     
     return reviews
 
+review_payload_cache = QueryCache("review_payloads", ttl=60, depends_on=("reviews",))
+
 @api_router.get("/reviews/public")
-async def get_public_reviews():
+async def get_public_reviews(request: Request):
     """Get published reviews for public display"""
+    payload = await cached_payload(review_payload_cache, ("public",), load_public_reviews)
+    return payload.response(request)
+
+async def load_public_reviews():
     reviews = await db.reviews.find(
         {"status": "published"}, 
         {"_id": 0, "customer_id": 0, "customer_email": 0, "order_details": 0}
@@ -1469,7 +3754,7 @@ async def get_public_reviews():
         if review.get("customer_name"):
             review["customer_name"] = review["customer_name"].split()[0]
     
-    return reviews
+    return jsonable_encoder(reviews)
 
 @api_router.get("/reviews/stats")
 async def get_review_stats(current_user: dict = Depends(require_role(["admin"]))):
@@ -1513,6 +3798,7 @@ async def publish_review(review_id: str, current_user: dict = Depends(require_ro
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await invalidate_collection("reviews", review_id)
     return {"message": "Review published"}
 
 @api_router.patch("/reviews/{review_id}/unpublish")
@@ -1524,6 +3810,7 @@ async def unpublish_review(review_id: str, current_user: dict = Depends(require_
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await invalidate_collection("reviews", review_id)
     return {"message": "Review unpublished"}
 
 @api_router.patch("/reviews/{review_id}/reply")
@@ -1538,6 +3825,7 @@ async def reply_to_review(review_id: str, admin_response: str, current_user: dic
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await invalidate_collection("reviews", review_id)
     return {"message": "Reply added"}
 
 @api_router.delete("/reviews/{review_id}")
@@ -1546,6 +3834,7 @@ async def delete_review(review_id: str, current_user: dict = Depends(require_rol
     result = await db.reviews.delete_one({"id": review_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Review not found")
+    await invalidate_collection("reviews", review_id)
     return {"message": "Review deleted"}
 
 @api_router.get("/orders/{order_id}/review-status")
@@ -1556,6 +3845,268 @@ async def get_order_review_status(order_id: str, current_user: dict = Depends(ge
         return {"reviewed": True, "rating": review.get("star_rating")}
     return {"reviewed": False}
 
+# ============================================================================
+# SALES ROLLUP
+# ============================================================================
+
+# sales_daily holds one row per (branch_id, date, order_type, payment_method)
+# with revenue, subtotal, tax, order_count and item_quantities.<menu_item_id>.
+# Dates are the UTC date of the order's created_at, matching the reports.
+
+def sales_rollup_key(order: dict) -> dict:
+    return {
+        "branch_id": order["branch_id"],
+        "date": order["created_at"][:10],
+        "order_type": order.get("order_type", "unknown"),
+        "payment_method": order.get("payment_method") or "unknown"
+    }
+
+async def apply_order_to_sales_rollup(order: dict, sign: int, session=None):
+    """Add (sign=1) or remove (sign=-1) a completed order from its rollup row"""
+    key = sales_rollup_key(order)
+    increments = {
+        "revenue": sign * order.get("total", 0),
+        "subtotal": sign * order.get("subtotal", 0),
+        "tax": sign * order.get("tax", 0),
+        "order_count": sign
+    }
+    for item in order.get("items", []):
+        field = f"item_quantities.{item['menu_item_id']}"
+        increments[field] = increments.get(field, 0) + sign * item["quantity"]
+    
+    await db.sales_daily.update_one(
+        {"_id": "|".join(key.values())},
+        {"$inc": increments, "$setOnInsert": key},
+        upsert=True,
+        session=session
+    )
+
+async def sync_order_sales_rollup(order: dict, new_status: str, session=None) -> int:
+    """Count an order once when it completes and take it back out if it
+    later moves away from completed (e.g. cancelled). ``order`` is the order
+    as it was before the transition; returns the sign applied, or 0.
+
+    Runs inside ``transition_order``'s transaction. The
+    ``sales_rollup_applied`` flag is flipped with an update conditioned on
+    the order's current status, so a completion that loses a race with a
+    cancellation counts nothing, and repeated transitions can't double
+    count.
+    """
+    if new_status == "completed":
+        sign = 1
+        result = await db.orders.update_one(
+            {"id": order["id"], "status": "completed", "sales_rollup_applied": {"$ne": True}},
+            {"$set": {"sales_rollup_applied": True}},
+            session=session
+        )
+    elif order.get("status") == "completed":
+        sign = -1
+        result = await db.orders.update_one(
+            {"id": order["id"], "status": {"$ne": "completed"}, "sales_rollup_applied": True},
+            {"$set": {"sales_rollup_applied": False}},
+            session=session
+        )
+    else:
+        return 0
+    if not result.modified_count:
+        return 0
+    await apply_order_to_sales_rollup(order, sign, session)
+    return sign
+
+async def rebuild_sales_rollup() -> dict:
+    """Rebuild sales_daily from order history.
+
+    Rows are built in a scratch collection and swapped in with a rename so
+    readers never see a half-built rollup. Completions landing while the
+    rebuild runs may be missed; run it off-peak.
+    """
+    day = {"$substrBytes": ["$created_at", 0, 10]}
+    group_key = {
+        "branch_id": "$branch_id",
+        "date": day,
+        "order_type": {"$ifNull": ["$order_type", "unknown"]},
+        "payment_method": {"$ifNull": ["$payment_method", "unknown"]}
+    }
+    completed = {"$match": {"status": "completed"}}
+    
+    rows = {}
+    async for row in db.orders.aggregate([
+        completed,
+        {"$group": {
+            "_id": group_key,
+            "revenue": {"$sum": "$total"},
+            "subtotal": {"$sum": "$subtotal"},
+            "tax": {"$sum": "$tax"},
+            "order_count": {"$sum": 1}
+        }}
+    ], allowDiskUse=True):
+        key = row.pop("_id")
+        rows["|".join(key.values())] = {**key, **row, "item_quantities": {}}
+    
+    async for row in db.orders.aggregate([
+        completed,
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {**group_key, "menu_item_id": "$items.menu_item_id"},
+            "quantity": {"$sum": "$items.quantity"}
+        }}
+    ], allowDiskUse=True):
+        key = row["_id"]
+        menu_item_id = key.pop("menu_item_id", None)
+        if menu_item_id:
+            rows["|".join(key.values())]["item_quantities"][menu_item_id] = row["quantity"]
+    
+    await db.sales_daily_rebuild.drop()
+    if rows:
+        await db.sales_daily_rebuild.insert_many([{"_id": key, **row} for key, row in rows.items()])
+        await db.sales_daily_rebuild.rename("sales_daily", dropTarget=True)
+    else:
+        await db.sales_daily.delete_many({})
+    await ensure_sales_rollup_indexes()
+    
+    await db.orders.update_many(
+        {"status": "completed", "sales_rollup_applied": {"$ne": True}},
+        {"$set": {"sales_rollup_applied": True}}
+    )
+    await db.orders.update_many(
+        {"status": {"$ne": "completed"}, "sales_rollup_applied": True},
+        {"$set": {"sales_rollup_applied": False}}
+    )
+    await popularity_index.refresh()
+    return {"rows": len(rows), "orders": sum(row["order_count"] for row in rows.values())}
+
+async def ensure_sales_rollup_indexes():
+    await db.sales_daily.create_index([("branch_id", 1), ("date", 1)])
+    await db.sales_daily.create_index("date")
+
+def sales_rollup_date_query(branch_id: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> dict:
+    query = {}
+    if branch_id:
+        query["branch_id"] = branch_id
+    if start_date:
+        query["date"] = {"$gte": start_date[:10]}
+    if end_date:
+        query.setdefault("date", {})["$lte"] = end_date[:10]
+    return query
+
+# ============================================================================
+# MENU POPULARITY
+# ============================================================================
+
+POPULARITY_WINDOWS = (7, 30)
+POPULARITY_REFRESH_MINUTES = float(os.environ.get('POPULARITY_REFRESH_MINUTES', '10'))
+ALL_BRANCHES = "*"
+
+class PopularityIndex:
+    """Quantity sold per menu item and branch over rolling 7/30-day windows.
+
+    Held in memory as branch -> date -> Counter, using the same UTC order
+    dates as sales_daily. Completions handled by this worker are applied
+    straight away; ``refresh`` reloads from sales_daily (picking up other
+    workers' completions) and the snapshot in menu_popularity lets a
+    restarted worker rank items before its first refresh.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._days = {}
+        self._ranked = {}
+        self.refreshed_at = None
+
+    def record(self, order: dict, sign: int):
+        date = order["created_at"][:10]
+        for branch_id in (order["branch_id"], ALL_BRANCHES):
+            counts = self._days.setdefault(branch_id, {}).setdefault(date, Counter())
+            for item in order.get("items", []):
+                counts[item["menu_item_id"]] += sign * item["quantity"]
+        self._ranked.clear()
+
+    def ranking(self, branch_id: Optional[str], window: int = 7) -> list:
+        """[(menu_item_id, quantity)] best seller first"""
+        since = (datetime.now(timezone.utc) - timedelta(days=window - 1)).date().isoformat()
+        key = (branch_id or ALL_BRANCHES, since)
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            totals = Counter()
+            for date, counts in self._days.get(key[0], {}).items():
+                if date >= since:
+                    totals.update(counts)
+            ranked = [(item_id, quantity) for item_id, quantity in totals.most_common() if quantity > 0]
+            self._ranked[key] = ranked
+        return ranked
+
+    async def refresh(self):
+        since = (datetime.now(timezone.utc) - timedelta(days=max(POPULARITY_WINDOWS) - 1)).date().isoformat()
+        days = {}
+        async for row in self.db.sales_daily.find(
+            {"date": {"$gte": since}}, {"_id": 0, "branch_id": 1, "date": 1, "item_quantities": 1}
+        ):
+            for branch_id in (row["branch_id"], ALL_BRANCHES):
+                days.setdefault(branch_id, {}).setdefault(row["date"], Counter()).update(row.get("item_quantities", {}))
+        self._days = days
+        self._ranked.clear()
+        self.refreshed_at = datetime.now(timezone.utc)
+
+    async def save_snapshot(self):
+        updated_at = datetime.now(timezone.utc).isoformat()
+        for branch_id, days in self._days.items():
+            await self.db.menu_popularity.replace_one(
+                {"_id": branch_id},
+                {"days": {date: dict(counts) for date, counts in days.items()}, "updated_at": updated_at},
+                upsert=True
+            )
+
+    async def load_snapshot(self) -> bool:
+        docs = await self.db.menu_popularity.find({}).to_list(None)
+        if not docs:
+            return False
+        self._days = {
+            doc["_id"]: {date: Counter(counts) for date, counts in doc["days"].items()}
+            for doc in docs
+        }
+        self._ranked.clear()
+        return True
+
+popularity_index = PopularityIndex(db)
+
+def check_popularity_window(window: int) -> int:
+    if window not in POPULARITY_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {list(POPULARITY_WINDOWS)}")
+    return window
+
+async def run_popularity_refresh():
+    while True:
+        try:
+            await popularity_index.refresh()
+            await popularity_index.save_snapshot()
+        except Exception as e:
+            logger.error(f"Menu popularity refresh failed: {e}")
+        await asyncio.sleep(POPULARITY_REFRESH_MINUTES * 60)
+
+@api_router.get("/menu/bestsellers", response_model=List[BestsellerItem])
+async def get_bestsellers(branch_id: Optional[str] = None, window: int = 7, limit: int = 10):
+    """Best selling available items over the last 7 or 30 days"""
+    ranking = popularity_index.ranking(branch_id, check_popularity_window(window))
+    if not ranking:
+        return []
+    query = {"id": {"$in": [item_id for item_id, _ in ranking]}, "is_available": True}
+    if branch_id:
+        query.update(menu_branch_filter(branch_id))
+    items = await db.menu_items.find(query, {"_id": 0}).to_list(None)
+    items_by_id = {item["id"]: item for item in items}
+    
+    bestsellers = []
+    for item_id, quantity in ranking:
+        item = items_by_id.get(item_id)
+        if not item:
+            continue
+        if isinstance(item['created_at'], str):
+            item['created_at'] = datetime.fromisoformat(item['created_at'])
+        bestsellers.append({**item, "rank": len(bestsellers) + 1, "quantity_sold": quantity})
+        if len(bestsellers) >= limit:
+            break
+    return bestsellers
+
 # ============================================================================
 # REPORTS & ANALYTICS ROUTES
 # ============================================================================
@@ -1567,27 +4118,19 @@ async def get_sales_report(
     end_date: Optional[str] = None,
     current_user: dict = Depends(require_role(["admin", "branch_manager"]))
 ):
-    query = {"status": {"$in": ["completed"]}}
+    # Served from the daily rollup; dates are whole UTC days, inclusive
+    query = sales_rollup_date_query(branch_id, start_date, end_date)
+    rows = await analytics_db.sales_daily.find(query, {"_id": 0, "item_quantities": 0}).to_list(None)
     
-    if branch_id:
-        query["branch_id"] = branch_id
-    
-    if start_date:
-        query["created_at"] = {"$gte": start_date}
-    if end_date:
-        query.setdefault("created_at", {})["$lte"] = end_date
-    
-    orders = await db.orders.find(query, {"_id": 0}).to_list(10000)
-    
-    total_revenue = sum(order.get("total", 0) for order in orders)
-    total_orders = len(orders)
+    total_revenue = sum(row["revenue"] for row in rows)
+    total_orders = sum(row["order_count"] for row in rows)
     avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
     
     # Order type breakdown
     order_type_counts = {}
-    for order in orders:
-        order_type = order.get("order_type", "unknown")
-        order_type_counts[order_type] = order_type_counts.get(order_type, 0) + 1
+    for row in rows:
+        order_type_counts[row["order_type"]] = order_type_counts.get(row["order_type"], 0) + row["order_count"]
+    order_type_counts = {k: v for k, v in order_type_counts.items() if v}
     
     return {
         "total_revenue": round(total_revenue, 2),
@@ -1602,17 +4145,19 @@ async def get_sales_report(
 
 @api_router.get("/reports/branch-performance")
 async def get_branch_performance(current_user: dict = Depends(require_role(["admin"]))):
-    branches = await db.branches.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    branches = await analytics_db.branches.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    
+    totals = {}
+    async for row in analytics_db.sales_daily.aggregate([
+        {"$group": {"_id": "$branch_id", "revenue": {"$sum": "$revenue"}, "orders": {"$sum": "$order_count"}}}
+    ]):
+        totals[row["_id"]] = row
     
     performance_data = []
     for branch in branches:
-        orders = await db.orders.find(
-            {"branch_id": branch["id"], "status": "completed"},
-            {"_id": 0}
-        ).to_list(10000)
-        
-        total_revenue = sum(order.get("total", 0) for order in orders)
-        total_orders = len(orders)
+        branch_totals = totals.get(branch["id"], {})
+        total_revenue = branch_totals.get("revenue", 0)
+        total_orders = branch_totals.get("orders", 0)
         
         performance_data.append({
             "branch_id": branch["id"],
@@ -1624,6 +4169,662 @@ async def get_branch_performance(current_user: dict = Depends(require_role(["adm
     
     return performance_data
 
+@api_router.post("/reports/sales-rollup/rebuild")
+async def rebuild_sales_rollup_route(current_user: dict = Depends(require_role(["admin"]))):
+    """Rebuild the daily sales rollup from order history (Admin only)"""
+    result = await rebuild_sales_rollup()
+    logger.info(f"Sales rollup rebuilt: {result['rows']} rows from {result['orders']} orders")
+    return {"message": "Sales rollup rebuilt", **result}
+
+# ============================================================================
+# EXPORT ROUTES
+# ============================================================================
+
+EXPORT_ORDER_FIELDS = [
+    "id", "order_number", "branch_id", "created_at", "updated_at", "status", "order_type",
+    "customer_name", "customer_phone", "customer_email", "payment_method", "payment_status",
+    "razorpay_payment_id", "subtotal", "tax", "total", "table_id", "delivery_partner_id"
+]
+EXPORT_ITEM_FIELDS = ["menu_item_id", "menu_item_name", "quantity", "unit_price", "total_price"]
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def export_rows(order: dict, flatten_items: bool):
+    """One row per order, or one per line item when flattening; an order
+    without items still gets one row, with the item columns empty"""
+    base = {field: order.get(field) for field in EXPORT_ORDER_FIELDS}
+    if not flatten_items:
+        base["items"] = order.get("items", [])
+        yield base
+        return
+    for item in order.get("items") or [{}]:
+        yield {**base, **{f"item_{field}": item.get(field) for field in EXPORT_ITEM_FIELDS}}
+
+@api_router.get("/exports/orders")
+async def export_orders(
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    branch_id: Optional[str] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    flatten_items: bool = False,
+    current_user: dict = Depends(require_role(["admin", "branch_manager"]))
+):
+    """Stream orders for accounting straight from a cursor.
+
+    Rows are written to the response as the cursor yields them, so memory
+    use does not depend on the size of the range. ``from``/``to`` compare
+    against created_at; a bare date in ``to`` includes that whole day.
+    """
+    if current_user["role"] == "branch_manager":
+        branch_id = current_user.get("branch_id")
+        if not branch_id:
+            raise HTTPException(status_code=403, detail="No branch assigned to this account")
+    
+    query = {}
+    if branch_id:
+        query["branch_id"] = branch_id
+    if start:
+        query["created_at"] = {"$gte": start}
+    if end:
+        query.setdefault("created_at", {})["$lte"] = (end + "\uffff") if len(end) == 10 else end
+    
+    projection = {"_id": 0, **{field: 1 for field in EXPORT_ORDER_FIELDS}, "items": 1}
+    cursor = analytics_db.orders.find(query, projection).sort("created_at", 1).batch_size(1000)
+    
+    if flatten_items:
+        columns = EXPORT_ORDER_FIELDS + [f"item_{field}" for field in EXPORT_ITEM_FIELDS]
+    else:
+        columns = EXPORT_ORDER_FIELDS + ["items"]
+    
+    async def csv_stream():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        # Send the header right away so the client sees the first byte
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        
+        async for order in cursor:
+            for row in export_rows(order, flatten_items):
+                if not flatten_items:
+                    row["items"] = json.dumps(row["items"], separators=(",", ":"))
+                writer.writerow(row)
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    
+    async def ndjson_stream():
+        chunk = []
+        size = 0
+        first = True
+        async for order in cursor:
+            for row in export_rows(order, flatten_items):
+                line = json.dumps(row, separators=(",", ":"), default=str) + "\n"
+                chunk.append(line)
+                size += len(line)
+            # No header to send, so the first order goes out on its own
+            if first or size >= EXPORT_FLUSH_BYTES:
+                yield "".join(chunk)
+                chunk, size, first = [], 0, False
+        if chunk:
+            yield "".join(chunk)
+    
+    # from/to are free-form query strings; keep only characters that can't
+    # break out of the quoted header value
+    filename = re.sub(r"[^A-Za-z0-9._-]", "", f"orders-{start or 'all'}-{end or 'now'}.{format}")
+    return StreamingResponse(
+        csv_stream() if format == "csv" else ndjson_stream(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============================================================================
+# ANALYTICS EXTRACTS (PARQUET)
+# ============================================================================
+
+ANALYTICS_DIR = Path(os.environ.get('ANALYTICS_EXPORT_DIR', ROOT_DIR / 'analytics'))
+ANALYTICS_EXTRACT_INTERVAL_HOURS = float(os.environ.get('ANALYTICS_EXTRACT_INTERVAL_HOURS', '24'))
+ANALYTICS_BATCH_SIZE = 5000
+
+EXTRACT_ORDER_COLUMNS = [
+    "id", "order_number", "branch_id", "customer_id", "order_type", "status",
+    "payment_method", "payment_status", "subtotal", "tax", "total",
+    "table_id", "delivery_partner_id", "created_at", "updated_at"
+]
+EXTRACT_ITEM_COLUMNS = ["menu_item_id", "menu_item_name", "quantity", "unit_price", "total_price"]
+
+class AnalyticsExtractor:
+    """Incrementally extracts orders and order line items to Parquet.
+
+    Files are partitioned as ``<dataset>/branch_id=<id>/month=<YYYY-MM>/``
+    by order creation month. Orders are read in (updated_at, id) order and
+    the manifest keeps the last pair written as the watermark, so each run
+    appends only orders past it. An order that changed after an earlier run
+    appears again; keep the row with the latest updated_at per order id.
+    """
+
+    def __init__(self, database, root: Path, reader=None):
+        self.db = database
+        # Orders are read from ``reader`` (the analytics client); leases
+        # always go to the primary
+        self.reader = reader if reader is not None else database
+        self.root = root
+        self.manifest_path = root / "manifest.json"
+        self.running = False
+        self._lease_owner = None
+
+    def load_manifest(self) -> dict:
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {"watermark": None, "watermark_id": None, "dedupe_key": ["id", "updated_at"], "files": []}
+
+    def _save_manifest(self, manifest: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2))
+        tmp_path.replace(self.manifest_path)
+
+    async def _acquire_lease(self, seconds: int) -> bool:
+        """Only one worker per deployment runs an extract at a time"""
+        now = datetime.now(timezone.utc)
+        owner = uuid.uuid4().hex
+        try:
+            await self.db.job_leases.update_one(
+                {"_id": "analytics_extract", "expires_at": {"$lt": now}},
+                {"$set": {"expires_at": now + timedelta(seconds=seconds), "owner": owner}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Upsert hit the existing, unexpired lease: another worker holds it
+            return False
+        self._lease_owner = owner
+        return True
+
+    async def _release_lease(self):
+        # A run that outlived its lease must not drop one another worker has taken since
+        await self.db.job_leases.delete_one({"_id": "analytics_extract", "owner": self._lease_owner})
+        self._lease_owner = None
+
+    async def run(self) -> dict:
+        if self.running or not await self._acquire_lease(3600):
+            return {"status": "already_running"}
+        self.running = True
+        try:
+            return await self._extract()
+        finally:
+            self.running = False
+            await self._release_lease()
+
+    async def _extract(self) -> dict:
+        manifest = await asyncio.to_thread(self.load_manifest)
+        # A secondary may not have seen the latest writes yet; stopping short
+        # of the staleness bound keeps them from landing behind the watermark
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ANALYTICS_MAX_STALENESS_SECONDS)).isoformat()
+        query = {"updated_at": {"$lte": cutoff}}
+        if manifest["watermark"]:
+            # Orders sharing the watermark's updated_at may be split across
+            # batches, so the id breaks the tie
+            query["$or"] = [
+                {"updated_at": {"$gt": manifest["watermark"]}},
+                {"updated_at": manifest["watermark"], "id": {"$gt": manifest.get("watermark_id") or ""}}
+            ]
+        projection = {"_id": 0, **{column: 1 for column in EXTRACT_ORDER_COLUMNS}, "items": 1}
+        cursor = self.reader.orders.find(query, projection).sort([("updated_at", 1), ("id", 1)]).batch_size(ANALYTICS_BATCH_SIZE)
+        
+        run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        totals = {"orders": 0, "order_items": 0}
+        batch_number = 0
+        batch = []
+        async for order in cursor:
+            batch.append(order)
+            if len(batch) == ANALYTICS_BATCH_SIZE:
+                await self._write_batch(batch, manifest, run_id, batch_number, totals)
+                batch_number += 1
+                batch = []
+        if batch:
+            await self._write_batch(batch, manifest, run_id, batch_number, totals)
+        
+        manifest["last_run"] = {"run_id": run_id, **totals}
+        await asyncio.to_thread(self._save_manifest, manifest)
+        return {"status": "completed", "run_id": run_id, "watermark": manifest["watermark"], **totals}
+
+    async def _write_batch(self, batch: list, manifest: dict, run_id: str, batch_number: int, totals: dict):
+        files = await asyncio.to_thread(self._write_parquet, batch, f"{run_id}-{batch_number:05d}")
+        manifest["files"].extend(files)
+        manifest["watermark"], manifest["watermark_id"] = batch[-1]["updated_at"], batch[-1]["id"]
+        for entry in files:
+            totals[entry["dataset"]] += entry["rows"]
+        # Persist after every batch so a crash resumes from the last written batch
+        await asyncio.to_thread(self._save_manifest, manifest)
+
+    def _write_parquet(self, batch: list, part_name: str) -> list:
+        import pandas as pd
+        
+        # Column-wise construction: one list per field, converted in bulk
+        orders = pd.DataFrame({column: [order.get(column) for order in batch] for column in EXTRACT_ORDER_COLUMNS})
+        orders["created_at"] = pd.to_datetime(orders["created_at"], utc=True, format="ISO8601")
+        orders["updated_at"] = pd.to_datetime(orders["updated_at"], utc=True, format="ISO8601")
+        orders[["subtotal", "tax", "total"]] = orders[["subtotal", "tax", "total"]].astype("float64")
+        orders["month"] = orders["created_at"].dt.strftime("%Y-%m")
+        
+        item_lists = [order.get("items") or [] for order in batch]
+        counts = np.fromiter((len(items) for items in item_lists), dtype=np.int64, count=len(item_lists))
+        flat_items = list(chain.from_iterable(item_lists))
+        items = pd.DataFrame({column: [item.get(column) for item in flat_items] for column in EXTRACT_ITEM_COLUMNS})
+        items["quantity"] = items["quantity"].astype("int64")
+        items[["unit_price", "total_price"]] = items[["unit_price", "total_price"]].astype("float64")
+        for column in ("id", "branch_id", "order_type", "status", "created_at", "updated_at", "month"):
+            items[column] = np.repeat(orders[column].to_numpy(), counts)
+        items = items.rename(columns={"id": "order_id"})
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        items["line_number"] = np.arange(len(items), dtype=np.int64) - starts
+        
+        written = []
+        for dataset, frame in (("orders", orders), ("order_items", items)):
+            for (branch_id, month), partition in frame.groupby(["branch_id", "month"], sort=False):
+                directory = self.root / dataset / f"branch_id={branch_id}" / f"month={month}"
+                directory.mkdir(parents=True, exist_ok=True)
+                path = directory / f"part-{part_name}.parquet"
+                partition.drop(columns=["branch_id", "month"]).to_parquet(path, index=False)
+                written.append({
+                    "dataset": dataset,
+                    "path": str(path.relative_to(self.root)),
+                    "branch_id": branch_id,
+                    "month": month,
+                    "rows": len(partition)
+                })
+        return written
+
+analytics_extractor = AnalyticsExtractor(db, ANALYTICS_DIR, reader=analytics_db)
+
+async def run_scheduled_analytics_extracts():
+    interval = ANALYTICS_EXTRACT_INTERVAL_HOURS * 3600
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await analytics_extractor.run()
+            logger.info(f"Scheduled analytics extract: {result}")
+        except Exception as e:
+            logger.error(f"Scheduled analytics extract failed: {e}")
+
+@api_router.post("/analytics/extracts", status_code=202)
+async def start_analytics_extract(current_user: dict = Depends(require_role(["admin"]))):
+    """Start an incremental Parquet extract in the background (Admin only)"""
+    if analytics_extractor.running:
+        return {"status": "already_running"}
+    background_tasks.append(asyncio.create_task(analytics_extractor.run()))
+    return {"status": "started"}
+
+@api_router.get("/analytics/extracts")
+async def get_analytics_extracts(current_user: dict = Depends(require_role(["admin"]))):
+    """Extract manifest summary: watermark, last run and partitions (Admin only)"""
+    manifest = await asyncio.to_thread(analytics_extractor.load_manifest)
+    partitions = {}
+    for entry in manifest["files"]:
+        key = (entry["dataset"], entry["branch_id"], entry["month"])
+        partitions[key] = partitions.get(key, 0) + entry["rows"]
+    return {
+        "running": analytics_extractor.running,
+        "directory": str(analytics_extractor.root),
+        "watermark": manifest["watermark"],
+        "watermark_id": manifest.get("watermark_id"),
+        "last_run": manifest.get("last_run"),
+        "partitions": [
+            {"dataset": dataset, "branch_id": branch_id, "month": month, "rows": rows}
+            for (dataset, branch_id, month), rows in sorted(partitions.items())
+        ]
+    }
+
+# ============================================================================
+# ITEM & HOURLY SALES ANALYTICS
+# ============================================================================
+
+# Results are cached per (branch, range) for a few minutes; ranges that
+# include today trail live orders by at most the TTL.
+item_analytics_cache = QueryCache("item_analytics", ttl=300, depends_on=("menu_items", "menu_categories"))
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def analytics_match(branch_id: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> dict:
+    match = {"status": "completed"}
+    if branch_id:
+        match["branch_id"] = branch_id
+    if start_date:
+        match["created_at"] = {"$gte": start_date}
+    if end_date:
+        match.setdefault("created_at", {})["$lte"] = (end_date + "\uffff") if len(end_date) == 10 else end_date
+    return match
+
+async def load_menu_catalog():
+    """menu_item_id -> category_id and category_id -> name"""
+    items = await analytics_db.menu_items.find({}, {"_id": 0, "id": 1, "category_id": 1}).to_list(None)
+    categories = await analytics_db.menu_categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    return {i["id"]: i["category_id"] for i in items}, {c["id"]: c["name"] for c in categories}
+
+@api_router.get("/reports/items")
+async def get_item_sales_report(
+    branch_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(require_role(["admin", "branch_manager"]))
+):
+    """Top sellers and revenue per item and per category"""
+    cache_key = ("items", branch_id, start_date, end_date, limit)
+    cached = item_analytics_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Unwind and group per item in MongoDB; only one row per dish comes back
+    rows = await analytics_db.orders.aggregate([
+        {"$match": analytics_match(branch_id, start_date, end_date)},
+        {"$project": {"_id": 0, "items": 1}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.menu_item_id",
+            "name": {"$last": "$items.menu_item_name"},
+            "quantity": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.total_price"},
+            "orders": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    item_categories, category_names = await load_menu_catalog()
+    
+    item_ids = np.array([row["_id"] for row in rows], dtype=object)
+    quantity = np.array([row["quantity"] for row in rows], dtype=np.int64)
+    revenue = np.array([row["revenue"] for row in rows], dtype=np.float64)
+    orders = np.array([row["orders"] for row in rows], dtype=np.int64)
+    total_revenue = float(revenue.sum())
+    
+    top = np.argsort(-quantity, kind="stable")[:limit]
+    top_items = [
+        {
+            "menu_item_id": item_ids[i],
+            "name": rows[i]["name"],
+            "category": category_names.get(item_categories.get(item_ids[i]), "Uncategorized"),
+            "quantity": int(quantity[i]),
+            "revenue": round(float(revenue[i]), 2),
+            "orders": int(orders[i]),
+            "revenue_share": round(float(revenue[i]) / total_revenue, 4) if total_revenue else 0
+        }
+        for i in top
+    ]
+    
+    # Category rollup: map each item to a category code and bincount
+    category_of_item = np.array([item_categories.get(item_id, "") for item_id in item_ids], dtype=str)
+    category_ids, category_codes = np.unique(category_of_item, return_inverse=True)
+    category_quantity = np.bincount(category_codes, weights=quantity, minlength=len(category_ids))
+    category_revenue = np.bincount(category_codes, weights=revenue, minlength=len(category_ids))
+    categories = [
+        {
+            "category_id": category_ids[c] or None,
+            "name": category_names.get(category_ids[c], "Uncategorized"),
+            "quantity": int(category_quantity[c]),
+            "revenue": round(float(category_revenue[c]), 2),
+            "revenue_share": round(float(category_revenue[c]) / total_revenue, 4) if total_revenue else 0
+        }
+        for c in np.argsort(-category_revenue, kind="stable")
+    ]
+    
+    result = {
+        "total_revenue": round(total_revenue, 2),
+        "total_quantity": int(quantity.sum()),
+        "top_items": top_items,
+        "categories": categories,
+        "period": {"start_date": start_date, "end_date": end_date}
+    }
+    item_analytics_cache.set(cache_key, result)
+    return result
+
+HEATMAP_BUCKET = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:[03]0")
+
+@api_router.get("/reports/heatmap")
+async def get_sales_heatmap(
+    branch_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    menu_item_id: Optional[str] = None,
+    tz_offset_minutes: int = 330,
+    current_user: dict = Depends(require_role(["admin", "branch_manager"]))
+):
+    """Day-of-week x hour grid of orders, revenue and quantity.
+
+    Hours are local to ``tz_offset_minutes`` (default IST). With
+    ``menu_item_id`` the grid covers that dish only.
+    """
+    cache_key = ("heatmap", branch_id, start_date, end_date, menu_item_id, tz_offset_minutes)
+    cached = item_analytics_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Group into half-hour UTC buckets ("YYYY-MM-DDTHH:00" / ":30") in
+    # MongoDB, so half-hour offsets such as IST land in the right local hour.
+    # At most 17,520 rows for a year, whatever the order volume.
+    hour_bucket = {"$concat": [
+        {"$substrBytes": ["$created_at", 0, 14]},
+        {"$cond": [{"$lt": [{"$substrBytes": ["$created_at", 14, 2]}, "30"]}, "00", "30"]}
+    ]}
+    match = analytics_match(branch_id, start_date, end_date)
+    match.setdefault("created_at", {})["$type"] = "string"
+    pipeline = [{"$match": match}]
+    if menu_item_id:
+        pipeline += [
+            {"$project": {"_id": 0, "created_at": 1, "items": 1}},
+            {"$unwind": "$items"},
+            {"$match": {"items.menu_item_id": menu_item_id}},
+            {"$group": {
+                "_id": hour_bucket,
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$items.total_price"},
+                "quantity": {"$sum": "$items.quantity"}
+            }}
+        ]
+    else:
+        pipeline += [
+            {"$group": {
+                "_id": hour_bucket,
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$total"},
+                "quantity": {"$sum": {"$sum": "$items.quantity"}}
+            }}
+        ]
+    rows = await analytics_db.orders.aggregate(pipeline).to_list(None)
+    # A created_at that isn't an ISO timestamp yields a bucket NumPy can't parse
+    rows = [row for row in rows if isinstance(row["_id"], str) and HEATMAP_BUCKET.fullmatch(row["_id"])]
+    
+    buckets = np.array([row["_id"] for row in rows], dtype="U16").astype("datetime64[m]")
+    local = buckets + np.timedelta64(tz_offset_minutes, "m")
+    hours_since_epoch = local.astype("datetime64[h]").astype(np.int64)
+    # 1970-01-01 was a Thursday (index 3 with Monday = 0)
+    day_of_week = (hours_since_epoch // 24 + 3) % 7
+    hour = hours_since_epoch % 24
+    cell = day_of_week * 24 + hour
+    
+    def grid(values):
+        return np.bincount(cell, weights=values, minlength=168).reshape(7, 24)
+    
+    orders = grid(np.array([row["orders"] for row in rows], dtype=np.float64))
+    revenue = grid(np.array([row["revenue"] for row in rows], dtype=np.float64))
+    quantity = grid(np.array([row["quantity"] for row in rows], dtype=np.float64))
+    busiest_day, busiest_hour = np.unravel_index(int(np.argmax(orders)), orders.shape) if rows else (0, 0)
+    
+    result = {
+        "days": DAY_NAMES,
+        "hours": list(range(24)),
+        "orders": orders.astype(np.int64).tolist(),
+        "revenue": np.round(revenue, 2).tolist(),
+        "quantity": quantity.astype(np.int64).tolist(),
+        "orders_by_day": orders.sum(axis=1).astype(np.int64).tolist(),
+        "orders_by_hour": orders.sum(axis=0).astype(np.int64).tolist(),
+        "busiest": {"day": DAY_NAMES[int(busiest_day)], "hour": int(busiest_hour)} if rows else None,
+        "tz_offset_minutes": tz_offset_minutes,
+        "period": {"start_date": start_date, "end_date": end_date}
+    }
+    item_analytics_cache.set(cache_key, result)
+    return result
+
+# ============================================================================
+# KITCHEN SLA
+# ============================================================================
+# Stage durations (e.g. confirmed -> ready) are folded into quantile sketches
+# as orders move, one per (branch, local date, local hour the stage started,
+# order type, stage) in ``kitchen_sla``. Each sketch is a DDSketch-style
+# histogram over logarithmic buckets: a duration lands in bucket
+# ceil(log_gamma(seconds)), so any quantile read back is within
+# KITCHEN_SLA_ACCURACY of the true value, and sketches merge by adding bucket
+# counts. The report merges the matching documents instead of sorting orders.
+
+KITCHEN_SLA_ACCURACY = 0.01
+KITCHEN_SLA_GAMMA = (1 + KITCHEN_SLA_ACCURACY) / (1 - KITCHEN_SLA_ACCURACY)
+KITCHEN_SLA_TZ_OFFSET_MINUTES = int(os.environ.get('KITCHEN_SLA_TZ_OFFSET_MINUTES', '330'))
+KITCHEN_SLA_QUANTILES = (0.5, 0.9, 0.95)
+
+# stage -> (status it starts at, status it ends at)
+KITCHEN_SLA_STAGES = {
+    "pending_to_confirmed": ("pending", "confirmed"),
+    "confirmed_to_preparing": ("confirmed", "preparing"),
+    "preparing_to_ready": ("preparing", "ready"),
+    "confirmed_to_ready": ("confirmed", "ready"),
+    "pending_to_ready": ("pending", "ready"),
+    "ready_to_served": ("ready", "served"),
+    "ready_to_picked_up": ("ready", "picked_up"),
+    "picked_up_to_delivered": ("picked_up", "delivered"),
+}
+
+def sla_bucket(seconds: float) -> int:
+    # Durations under a second share bucket 0
+    return math.ceil(math.log(max(seconds, 1.0)) / math.log(KITCHEN_SLA_GAMMA))
+
+def sla_bucket_value(index: int) -> float:
+    """Representative duration of a bucket, within the relative accuracy of
+    everything in it"""
+    return 2 * KITCHEN_SLA_GAMMA ** index / (KITCHEN_SLA_GAMMA + 1) if index > 0 else 1.0
+
+class QuantileSketch:
+    """Sum of kitchen_sla bucket counts, answering quantile queries"""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+
+    def merge(self, buckets: dict, count: int, total: float):
+        for index, n in buckets.items():
+            self.buckets[int(index)] += n
+        self.count += count
+        self.total += total
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = 0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative > rank:
+                return sla_bucket_value(index)
+        return sla_bucket_value(max(self.buckets))
+
+async def record_kitchen_sla(order: dict, new_status: str, ts: str, session=None):
+    """Add the stages ``order`` completes by entering ``new_status``"""
+    timestamps = order.get("status_timestamps") or {}
+    ended_at = datetime.fromisoformat(ts)
+    for stage, (start_status, end_status) in KITCHEN_SLA_STAGES.items():
+        if end_status != new_status or start_status not in timestamps:
+            continue
+        started_at = datetime.fromisoformat(timestamps[start_status])
+        seconds = (ended_at - started_at).total_seconds()
+        if seconds < 0:
+            continue
+        local = started_at + timedelta(minutes=KITCHEN_SLA_TZ_OFFSET_MINUTES)
+        await db.kitchen_sla.update_one(
+            {
+                "branch_id": order["branch_id"],
+                "date": local.date().isoformat(),
+                "hour": local.hour,
+                "order_type": order.get("order_type"),
+                "stage": stage
+            },
+            {"$inc": {"count": 1, "total_seconds": seconds, f"buckets.{sla_bucket(seconds)}": 1}},
+            upsert=True,
+            session=session
+        )
+
+async def create_kitchen_sla_indexes():
+    await db.kitchen_sla.create_index(
+        [("branch_id", 1), ("date", 1), ("hour", 1), ("order_type", 1), ("stage", 1)], unique=True
+    )
+    await db.kitchen_sla.create_index("date")
+
+@api_router.get("/reports/kitchen-sla")
+async def get_kitchen_sla(
+    branch_id: Optional[str] = None,
+    order_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    hour_from: int = Query(0, ge=0, le=23),
+    hour_to: int = Query(23, ge=0, le=23),
+    bucket_hours: int = Query(1, ge=1, le=24),
+    current_user: dict = Depends(require_role(["admin", "branch_manager"]))
+):
+    """p50/p90/p95 stage durations in seconds per branch, order type and
+    hour bucket. Dates and hours are local to KITCHEN_SLA_TZ_OFFSET_MINUTES
+    and refer to when the stage started; ``hour_from``/``hour_to`` (inclusive)
+    narrow the day, e.g. 19 and 22 for the dinner rush, or 22 and 2 for a
+    window across midnight."""
+    if 24 % bucket_hours:
+        raise HTTPException(status_code=400, detail="bucket_hours must divide 24")
+    if current_user["role"] == "branch_manager":
+        branch_id = current_user.get("branch_id")
+        if not branch_id:
+            raise HTTPException(status_code=403, detail="No branch assigned to this account")
+    
+    if hour_from <= hour_to:
+        query = {"hour": {"$gte": hour_from, "$lte": hour_to}}
+    else:
+        query = {"$or": [{"hour": {"$gte": hour_from}}, {"hour": {"$lte": hour_to}}]}
+    if branch_id:
+        query["branch_id"] = branch_id
+    if order_type:
+        query["order_type"] = order_type
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = start_date[:10]
+        if end_date:
+            query["date"]["$lte"] = end_date[:10]
+    
+    sketches = {}
+    async for doc in analytics_db.kitchen_sla.find(query, {"_id": 0}):
+        hour_start = doc["hour"] - doc["hour"] % bucket_hours
+        key = (doc["branch_id"], doc["order_type"], hour_start)
+        sketch = sketches.setdefault(key, {}).setdefault(doc["stage"], QuantileSketch())
+        sketch.merge(doc.get("buckets", {}), doc["count"], doc["total_seconds"])
+    
+    rows = []
+    for (row_branch_id, row_order_type, hour_start), stages in sorted(sketches.items()):
+        rows.append({
+            "branch_id": row_branch_id,
+            "order_type": row_order_type,
+            "hour_start": hour_start,
+            "hour_end": hour_start + bucket_hours,
+            "stages": {
+                stage: {
+                    "count": sketch.count,
+                    "mean": round(sketch.total / sketch.count, 1),
+                    **{f"p{round(q * 100)}": round(sketch.quantile(q), 1) for q in KITCHEN_SLA_QUANTILES}
+                }
+                for stage, sketch in stages.items()
+            }
+        })
+    return {
+        "tz_offset_minutes": KITCHEN_SLA_TZ_OFFSET_MINUTES,
+        "relative_accuracy": KITCHEN_SLA_ACCURACY,
+        "rows": rows
+    }
+
 # ============================================================================
 # DASHBOARD STATS
 # ============================================================================
@@ -1638,24 +4839,23 @@ async def get_dashboard_stats(
         query["branch_id"] = branch_id
     
     # Total orders by status
-    all_orders = await db.orders.find(query, {"_id": 0}).to_list(10000)
-    
     status_counts = {}
-    for order in all_orders:
-        status = order.get("status", "unknown")
-        status_counts[status] = status_counts.get(status, 0) + 1
+    async for row in analytics_db.orders.aggregate([
+        {"$match": query},
+        {"$group": {"_id": {"$ifNull": ["$status", "unknown"]}, "count": {"$sum": 1}}}
+    ]):
+        status_counts[row["_id"]] = row["count"]
     
-    # Today's revenue
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_query = {**query, "created_at": {"$gte": today_start.isoformat()}, "status": "completed"}
-    today_orders = await db.orders.find(today_query, {"_id": 0}).to_list(10000)
-    today_revenue = sum(order.get("total", 0) for order in today_orders)
+    # Today's revenue from the rollup
+    today = datetime.now(timezone.utc).date().isoformat()
+    today_rows = await analytics_db.sales_daily.find({**query, "date": today}, {"_id": 0, "item_quantities": 0}).to_list(None)
+    today_revenue = sum(row["revenue"] for row in today_rows)
     
     return {
-        "total_orders": len(all_orders),
+        "total_orders": sum(status_counts.values()),
         "orders_by_status": status_counts,
         "today_revenue": round(today_revenue, 2),
-        "today_orders": len(today_orders)
+        "today_orders": sum(row["order_count"] for row in today_rows)
     }
 
 # ============================================================================
@@ -1663,8 +4863,12 @@ async def get_dashboard_stats(
 # ============================================================================
 
 @api_router.post("/payment/create-order")
-async def create_payment_order(payment_data: PaymentOrderCreate):
-    """Create a Razorpay payment order"""
+async def create_payment_order(request: Request, payment_data: PaymentOrderCreate):
+    """Create a Razorpay payment order. Retries that send the same
+    ``Idempotency-Key`` get the first Razorpay order back."""
+    return await idempotency_store.run(request, "payment_orders", payment_data, lambda: start_payment(payment_data))
+
+async def start_payment(payment_data: PaymentOrderCreate) -> dict:
     try:
         # Verify our order exists
         order = await db.orders.find_one({"id": payment_data.order_id}, {"_id": 0})
@@ -1672,25 +4876,29 @@ async def create_payment_order(payment_data: PaymentOrderCreate):
             raise HTTPException(status_code=404, detail="Order not found")
         
         # Create Razorpay order
-        razorpay_order = razorpay_client.order.create({
-            "amount": payment_data.amount,
-            "currency": payment_data.currency,
-            "payment_capture": 1,
-            "notes": {
-                "order_id": payment_data.order_id,
-                "order_number": order.get("order_number")
-            }
-        })
+        with track_outbound("razorpay", "order.create"):
+            razorpay_order = get_razorpay_client().order.create({
+                "amount": payment_data.amount,
+                "currency": payment_data.currency,
+                "payment_capture": 1,
+                "notes": {
+                    "order_id": payment_data.order_id,
+                    "order_number": order.get("order_number")
+                }
+            })
         
         # Store payment details in order
-        await db.orders.update_one(
+        updated_order = await db.orders.find_one_and_update(
             {"id": payment_data.order_id},
             {"$set": {
                 "razorpay_order_id": razorpay_order["id"],
                 "payment_status": "pending",
                 "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
+            }},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
+        change_hub.emit("orders", "update", updated_order)
         
         return {
             "razorpay_order_id": razorpay_order["id"],
@@ -1717,26 +4925,27 @@ async def verify_payment(verification: PaymentVerification):
             raise HTTPException(status_code=400, detail="Invalid payment signature")
         
         # Fetch payment details from Razorpay
-        payment = razorpay_client.payment.fetch(verification.razorpay_payment_id)
+        with track_outbound("razorpay", "payment.fetch"):
+            payment = get_razorpay_client().payment.fetch(verification.razorpay_payment_id)
         
         # Update order with payment details
-        await db.orders.update_one(
-            {"id": verification.order_id},
-            {"$set": {
-                "razorpay_payment_id": verification.razorpay_payment_id,
-                "payment_status": "completed" if payment["status"] == "captured" else "failed",
-                "payment_method": payment.get("method"),
-                "payment_details": {
-                    "amount": payment["amount"],
-                    "currency": payment["currency"],
-                    "status": payment["status"],
-                    "method": payment.get("method"),
-                    "captured_at": payment.get("captured_at")
-                },
-                "status": "confirmed",  # Move order to confirmed status
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        update_data = {
+            "razorpay_payment_id": verification.razorpay_payment_id,
+            "payment_status": "completed" if payment["status"] == "captured" else "failed",
+            "payment_method": payment.get("method"),
+            "payment_details": {
+                "amount": payment["amount"],
+                "currency": payment["currency"],
+                "status": payment["status"],
+                "method": payment.get("method"),
+                "captured_at": payment.get("captured_at")
+            },
+            "status": "confirmed",  # Move order to confirmed status
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        existing_order = await transition_order(verification.order_id, update_data, PAYMENT_ACTOR)
+        if existing_order:
+            change_hub.emit("orders", "update", order_after(existing_order, update_data))
         
         return {
             "success": True,
@@ -1759,14 +4968,13 @@ async def payment_webhook(request: Request):
         webhook_secret = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
         
         # Verify webhook signature
-        razorpay_client.utility.verify_webhook_signature(
+        get_razorpay_client().utility.verify_webhook_signature(
             payload.decode(),
             signature,
             webhook_secret
         )
         
         # Process webhook event
-        import json
         event = json.loads(payload.decode())
         
         if event["event"] == "payment.captured":
@@ -1774,20 +4982,121 @@ async def payment_webhook(request: Request):
             order_id = event["payload"]["payment"]["entity"]["notes"].get("order_id")
             
             if order_id:
-                await db.orders.update_one(
-                    {"id": order_id},
-                    {"$set": {
-                        "payment_status": "completed",
-                        "status": "confirmed",
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }}
-                )
+                update_data = {
+                    "payment_status": "completed",
+                    "status": "confirmed",
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                }
+                existing_order = await transition_order(order_id, update_data, PAYMENT_ACTOR)
+                if existing_order:
+                    change_hub.emit("orders", "update", order_after(existing_order, update_data))
         
         return {"status": "processed"}
     except Exception as e:
         logger.error(f"Webhook processing failed: {str(e)}")
         raise HTTPException(status_code=400, detail="Webhook verification failed")
 
+# ============================================================================
+# REALTIME EVENTS ROUTES
+# ============================================================================
+
+EVENT_STREAM_STAFF_ROLES = ("admin", "branch_manager", "waiter", "kitchen_staff")
+# What a customer following their own order sees; no contact or payment details
+ORDER_TRACKING_FIELDS = (
+    "id", "order_number", "branch_id", "order_type", "status", "status_timestamps",
+    "items", "subtotal", "tax", "total", "payment_status", "created_at", "updated_at"
+)
+
+def tracking_event(event: dict) -> dict:
+    document = event["document"]
+    return {**event, "document": {field: document[field] for field in ORDER_TRACKING_FIELDS if field in document}}
+
+@api_router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    branch_id: Optional[str] = None,
+    order_id: Optional[str] = None,
+    collections: Optional[str] = None,
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
+    """Server-sent events feed of order, table and delivery partner changes.
+
+    Staff may follow everything (admin) or their own branch. Anyone else
+    has to name an ``order_id`` and gets that order's changes only, without
+    customer contact or payment details."""
+    watched = [c for c in collections.split(",") if c] if collections else None
+    if watched and not set(watched) <= set(ChangeEventHub.WATCHED_COLLECTIONS):
+        raise HTTPException(status_code=400, detail="Unknown collection in filter")
+    
+    staff = current_user is not None and current_user.get("role") in EVENT_STREAM_STAFF_ROLES
+    if staff and current_user["role"] != "admin":
+        branch_id = current_user.get("branch_id")
+        if not branch_id:
+            raise HTTPException(status_code=403, detail="No branch assigned to this account")
+    if not staff:
+        if not order_id:
+            raise HTTPException(status_code=403, detail="order_id is required without a staff account")
+        watched = ["orders"]
+    
+    subscription = change_hub.subscribe(collections=watched, branch_id=branch_id, order_id=order_id)
+    
+    async def event_source():
+        try:
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=15)
+                if event is None:
+                    # Keep-alive comment so proxies don't close idle streams
+                    yield ": ping\n\n"
+                    continue
+                if not staff:
+                    event = tracking_event(event)
+                yield f"event: {event['collection']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            change_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============================================================================
+# PROFILING ROUTES
+# ============================================================================
+
+@api_router.get("/admin/profiles")
+async def list_request_profiles(
+    route: Optional[str] = None,
+    limit: int = 50,
+    current_user: dict = Depends(require_role(["admin"]))
+):
+    """List captured request profiles, newest first (Admin only)"""
+    query = {"route": route} if route else {}
+    profiles = await db.request_profiles.find(
+        query,
+        {"_id": 0, "collapsed_stacks": 0, "mongo_commands": 0}
+    ).sort("created_at", -1).to_list(min(limit, 200))
+    return profiles
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_request_profile(
+    profile_id: str,
+    format: Literal["json", "collapsed"] = "json",
+    current_user: dict = Depends(require_role(["admin"]))
+):
+    """Download a request profile; ``collapsed`` is flamegraph.pl / speedscope input"""
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        lines = "".join(f"{stack} {count}\n" for stack, count in profile["collapsed_stacks"])
+        return PlainTextResponse(
+            lines,
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.txt"'}
+        )
+    return profile
+
 # ============================================================================
 # USER MANAGEMENT ROUTES
 # ============================================================================
@@ -1803,6 +5112,15 @@ async def get_all_users(current_user: dict = Depends(require_role(["admin"]))):
     
     return users
 
+# ============================================================================
+# METRICS ROUTE
+# ============================================================================
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ============================================================================
 # ROOT ROUTE
 # ============================================================================
@@ -1818,6 +5136,10 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware)
+
+app.add_middleware(ProfilingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1833,6 +5155,120 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+background_tasks = []
+
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'true').lower() == 'true'
+
+metrics.describe("startup_phase_seconds", "gauge", "Time spent in each startup phase before accepting traffic", ("phase",))
+
+@contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    yield
+    metrics.set_gauge("startup_phase_seconds", (name,), time.perf_counter() - start)
+
+async def create_profile_indexes():
+    await db.request_profiles.create_index("id", unique=True)
+    await db.request_profiles.create_index("created_at", expireAfterSeconds=PROFILE_RETENTION_DAYS * 86400)
+
+async def create_order_indexes():
+    await db.orders.create_index("created_at")
+    await db.orders.create_index([("updated_at", 1), ("id", 1)])
+    await db.orders.create_index([("branch_id", 1), ("created_at", 1)])
+    await db.orders.create_index("status")
+
+async def create_menu_indexes():
+    await db.menu_items.create_index("id")
+    # Multikey on branch_ids; serves both arms of menu_branch_filter
+    await db.menu_items.create_index([("is_available", 1), ("branch_ids", 1)])
+    await db.menu_items.create_index([("category_id", 1), ("is_available", 1)])
+
+async def ensure_indexes():
+    await asyncio.gather(
+        create_profile_indexes(),
+        create_order_indexes(),
+        create_menu_indexes(),
+        create_table_indexes(),
+        create_idempotency_indexes(),
+        create_order_event_indexes(),
+        create_kitchen_sla_indexes(),
+        ensure_sales_rollup_indexes(),
+    )
+
+async def warm_caches():
+    """Build the branch, category and menu payloads the landing page asks
+    for, so the first visitors don't each pay for a cold cache"""
+    branches = await cached_payload(
+        branch_payload_cache, (collection_versions.key("branches"), True), lambda: load_branches(True)
+    )
+    menu_version = collection_versions.key("menu_items")
+    await asyncio.gather(
+        cached_payload(
+            branch_payload_cache, (collection_versions.key("branches"), None), lambda: load_branches(None)
+        ),
+        cached_payload(
+            category_payload_cache, (collection_versions.key("menu_categories"),), load_active_categories
+        ),
+        cached_payload(
+            menu_payload_cache, (menu_version, None, None), lambda: load_menu_items(None, None, MENU_ITEMS_LIMIT)
+        ),
+        *(
+            cached_payload(
+                menu_payload_cache, (menu_version, None, branch["id"]),
+                lambda branch_id=branch["id"]: load_menu_items(None, branch_id, MENU_ITEMS_LIMIT)
+            )
+            for branch in branches.content
+        ),
+    )
+
+def warm_clients():
+    # Loads the bcrypt backend, otherwise the first login does it
+    get_pwd_context().handler().get_backend()
+    get_razorpay_client()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect, prepare collections and warm caches before accepting
+    traffic; stop background work on shutdown"""
+    started = time.perf_counter()
+    with startup_phase("total"):
+        with startup_phase("ping"):
+            await client.admin.command("ping")
+            await detect_transaction_support()
+        with startup_phase("indexes"):
+            await ensure_indexes()
+        with startup_phase("state"):
+            await change_hub.start()
+            await collection_versions.ensure_bus()
+            await collection_versions.refresh()
+            await popularity_index.load_snapshot()
+            await kitchen_queue.ensure_fresh()
+            await migrate_legacy_tables()
+            await floor_map.ensure_fresh()
+        if STARTUP_WARMUP:
+            with startup_phase("warmup"):
+                await asyncio.gather(warm_caches(), asyncio.to_thread(warm_clients))
+
+        background_tasks.append(asyncio.create_task(collection_versions.run()))
+        background_tasks.append(asyncio.create_task(run_popularity_refresh()))
+        background_tasks.append(asyncio.create_task(kitchen_queue.run()))
+        background_tasks.append(asyncio.create_task(floor_map.run()))
+        # First deploy: backfill from history so reports aren't empty
+        if not await db.sales_daily.find_one({}) and await db.orders.find_one({"status": "completed"}):
+            background_tasks.append(asyncio.create_task(rebuild_sales_rollup()))
+        if ANALYTICS_EXTRACT_INTERVAL_HOURS > 0:
+            background_tasks.append(asyncio.create_task(run_scheduled_analytics_extracts()))
+        if metrics.enabled:
+            background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+    logger.info(f"Ready to serve after {time.perf_counter() - started:.2f}s")
+
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await change_hub.stop()
+        client.close()
+        analytics_client.close()
+
+app.router.lifespan_context = lifespan
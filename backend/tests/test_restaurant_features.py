@@ -5,6 +5,9 @@ Testing: Table management, Delivery fleet, Order routing, Customer flows
 import pytest
 import requests
 import os
+import json
+import time
+import uuid
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://restaurant-hub-74.preview.emergentagent.com')
 
@@ -218,6 +221,17 @@ class TestMenuItems:
             assert "base_price" in item
             assert "category_id" in item
         print(f"✓ Found {len(items)} menu items")
+    
+    def test_get_menu_items_by_branch(self):
+        """Test branch filtering keeps shared items and the branch's own items only"""
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        branch_id = branches[0]["id"]
+        response = requests.get(f"{BASE_URL}/api/menu/items?branch_id={branch_id}")
+        assert response.status_code == 200
+        items = response.json()
+        for item in items:
+            assert item["branch_ids"] is None or branch_id in item["branch_ids"]
+        print(f"✓ Found {len(items)} menu items for branch {branches[0]['name']}")
 
 
 class TestOrderCreation:
@@ -684,6 +698,73 @@ class TestDeliveryOrderFlow:
         assert updated_partner["status"] == "available"
         print("✓ Delivery partner status changed back to available")
 
+    def test_partner_cannot_be_assigned_twice(self):
+        """Test a busy delivery partner cannot be assigned a second order"""
+        delivery_login = requests.post(f"{BASE_URL}/api/auth/login", json=DELIVERY_CREDS)
+        if delivery_login.status_code != 200:
+            pytest.skip("Delivery partner login failed")
+
+        delivery_headers = {"Authorization": f"Bearer {delivery_login.json()['access_token']}"}
+        partner_response = requests.get(f"{BASE_URL}/api/delivery-partners/me", headers=delivery_headers)
+        if partner_response.status_code != 200:
+            pytest.skip("Could not get delivery partner profile")
+        partner = partner_response.json()
+        if partner["status"] != "available":
+            pytest.skip("Delivery partner is not available")
+
+        menu_items = requests.get(f"{BASE_URL}/api/menu/items").json()
+        if not menu_items:
+            pytest.skip("No menu items available")
+
+        # Two delivery orders ready for pickup at the partner's branch
+        order_ids = []
+        for index in range(2):
+            order_data = {
+                "customer_name": f"TEST_Double Assign {index}",
+                "customer_phone": "+91-9876543216",
+                "branch_id": partner["branch_id"],
+                "order_type": "delivery",
+                "delivery_address": "789 Test Road, Test City, 580003",
+                "items": [{
+                    "menu_item_id": menu_items[0]["id"],
+                    "menu_item_name": menu_items[0]["name"],
+                    "quantity": 1,
+                    "unit_price": menu_items[0]["base_price"],
+                    "total_price": menu_items[0]["base_price"]
+                }],
+                "payment_method": "cod"
+            }
+            response = requests.post(f"{BASE_URL}/api/orders", json=order_data)
+            assert response.status_code == 200
+            order_id = response.json()["id"]
+            for status in ("confirmed", "preparing", "ready"):
+                response = requests.put(f"{BASE_URL}/api/orders/{order_id}/status", json={"status": status})
+                assert response.status_code == 200
+            order_ids.append(order_id)
+        first_id, second_id = order_ids
+
+        response = requests.put(f"{BASE_URL}/api/orders/{first_id}/assign-delivery",
+                               json={"delivery_partner_id": partner["id"]}, headers=delivery_headers)
+        assert response.status_code == 200
+
+        # The partner is now busy, so the second claim must fail
+        response = requests.put(f"{BASE_URL}/api/orders/{second_id}/assign-delivery",
+                               json={"delivery_partner_id": partner["id"]}, headers=delivery_headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Delivery partner is not available"
+
+        second_order = requests.get(f"{BASE_URL}/api/orders/{second_id}").json()
+        assert second_order["status"] == "ready"
+        assert second_order.get("delivery_partner_id") is None
+        partner_response = requests.get(f"{BASE_URL}/api/delivery-partners/me", headers=delivery_headers)
+        assert partner_response.json()["current_order_id"] == first_id
+        print("✓ Second assignment of a busy partner rejected")
+
+        # Deliver the first order (frees the partner) and cancel the second
+        requests.put(f"{BASE_URL}/api/orders/{first_id}/status",
+                    json={"status": "delivered"}, headers=delivery_headers)
+        requests.put(f"{BASE_URL}/api/orders/{second_id}/status", json={"status": "cancelled"})
+
 
 class TestKitchenDashboard:
     """Test kitchen dashboard order visibility"""
@@ -726,6 +807,700 @@ class TestKitchenDashboard:
         print(f"✓ Kitchen dashboard shows {len(orders)} orders")
 
 
+class TestChangeEvents:
+    """Test the realtime change event stream"""
+    
+    def test_order_status_change_is_streamed(self):
+        """Test that an order status change reaches a subscriber filtered by order id"""
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        menu_items = requests.get(f"{BASE_URL}/api/menu/items").json()
+        if not menu_items:
+            pytest.skip("No menu items available")
+        
+        order_data = {
+            "customer_name": "TEST_Events Customer",
+            "customer_phone": "+91-9876543230",
+            "branch_id": branches[0]["id"],
+            "order_type": "takeaway",
+            "items": [{
+                "menu_item_id": menu_items[0]["id"],
+                "menu_item_name": menu_items[0]["name"],
+                "quantity": 1,
+                "unit_price": menu_items[0]["base_price"],
+                "total_price": menu_items[0]["base_price"]
+            }],
+            "payment_method": "cod"
+        }
+        order = requests.post(f"{BASE_URL}/api/orders", json=order_data).json()
+        
+        stream = requests.get(
+            f"{BASE_URL}/api/events/stream?order_id={order['id']}&collections=orders",
+            stream=True,
+            timeout=10
+        )
+        assert stream.status_code == 200
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        
+        requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": "confirmed"})
+        
+        for line in stream.iter_lines(decode_unicode=True):
+            if line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+                assert event["collection"] == "orders"
+                assert event["id"] == order["id"]
+                assert event["document"]["status"] == "confirmed"
+                # Guests following an order don't get the customer's details
+                assert "customer_phone" not in event["document"]
+                break
+        stream.close()
+        print(f"✓ Status change for {order['order_number']} received on the event stream")
+    
+    def test_unknown_collection_rejected(self):
+        """Test that filtering on an unwatched collection is rejected"""
+        response = requests.get(f"{BASE_URL}/api/events/stream?collections=users")
+        assert response.status_code == 400
+        print("✓ Unknown collection filter rejected")
+    
+    def test_unfiltered_stream_requires_staff(self):
+        """Test that guests can't follow every order or a whole branch"""
+        response = requests.get(f"{BASE_URL}/api/events/stream", stream=True, timeout=10)
+        assert response.status_code == 403
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        if branches:
+            response = requests.get(f"{BASE_URL}/api/events/stream?branch_id={branches[0]['id']}", stream=True, timeout=10)
+            assert response.status_code == 403
+        print("✓ Unfiltered event stream refused without a staff account")
+
+
+class TestRequestProfiling:
+    """Test on-demand request profiling"""
+    
+    @pytest.fixture
+    def admin_headers(self):
+        """Get admin authentication headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code == 200:
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+        pytest.skip("Admin login failed")
+    
+    def test_profile_captured_for_admin_request(self, admin_headers):
+        """Test that an admin request with X-Profile is profiled and downloadable"""
+        response = requests.get(
+            f"{BASE_URL}/api/dashboard/stats",
+            headers={**admin_headers, "X-Profile": "1"}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers.get("X-Profile-Id")
+        assert profile_id, "Profiled response should carry X-Profile-Id"
+        
+        # Profiles are stored after the response is sent
+        profile = None
+        for _ in range(10):
+            profile_response = requests.get(f"{BASE_URL}/api/admin/profiles/{profile_id}", headers=admin_headers)
+            if profile_response.status_code == 200:
+                profile = profile_response.json()
+                break
+            time.sleep(0.5)
+        assert profile is not None
+        assert profile["route"] == "/api/dashboard/stats"
+        assert profile["mongo_ms"] >= 0
+        assert "python_ms" in profile
+        print(f"✓ Profile {profile_id}: wall {profile['wall_ms']} ms, mongo {profile['mongo_ms']} ms")
+    
+    def test_profile_header_ignored_without_admin(self):
+        """Test that X-Profile has no effect for anonymous requests"""
+        response = requests.get(f"{BASE_URL}/api/branches", headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        print("✓ Anonymous X-Profile header ignored")
+
+
+class TestSalesRollup:
+    """Test that reports follow order completions through the daily rollup"""
+    
+    @pytest.fixture
+    def admin_headers(self):
+        """Get admin authentication headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code == 200:
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+        pytest.skip("Admin login failed")
+    
+    def test_completion_and_cancellation_update_sales_report(self, admin_headers):
+        """Test completed orders are counted once and removed again on cancellation"""
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        branch_id = branches[0]["id"]
+        menu_items = requests.get(f"{BASE_URL}/api/menu/items").json()
+        if not menu_items:
+            pytest.skip("No menu items available")
+        
+        def report():
+            response = requests.get(f"{BASE_URL}/api/reports/sales?branch_id={branch_id}", headers=admin_headers)
+            assert response.status_code == 200
+            return response.json()
+        
+        before = report()
+        order = requests.post(f"{BASE_URL}/api/orders", json={
+            "customer_name": "TEST_Rollup Customer",
+            "customer_phone": "+91-9876543231",
+            "branch_id": branch_id,
+            "order_type": "takeaway",
+            "items": [{
+                "menu_item_id": menu_items[0]["id"],
+                "menu_item_name": menu_items[0]["name"],
+                "quantity": 2,
+                "unit_price": menu_items[0]["base_price"],
+                "total_price": menu_items[0]["base_price"] * 2
+            }],
+            "payment_method": "cod"
+        }).json()
+        
+        # Completing twice must only count once
+        for status in ["confirmed", "completed", "completed"]:
+            requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": status})
+        after_completion = report()
+        assert after_completion["total_orders"] == before["total_orders"] + 1
+        assert round(after_completion["total_revenue"] - before["total_revenue"], 2) == round(order["total"], 2)
+        print(f"✓ Completed order {order['order_number']} added to sales report")
+        
+        requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": "cancelled"})
+        after_cancellation = report()
+        assert after_cancellation["total_orders"] == before["total_orders"]
+        print("✓ Cancellation reversed the rollup")
+
+
+class TestOrderExport:
+    """Test streaming order exports"""
+    
+    @pytest.fixture
+    def admin_headers(self):
+        """Get admin authentication headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code == 200:
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+        pytest.skip("Admin login failed")
+    
+    def test_export_csv(self, admin_headers):
+        """Test CSV export streams a header and one row per order"""
+        response = requests.get(f"{BASE_URL}/api/exports/orders?format=csv", headers=admin_headers, stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0].startswith("id,order_number,branch_id,created_at")
+        print(f"✓ CSV export returned {len(lines) - 1} orders")
+    
+    def test_export_ndjson_flattened(self, admin_headers):
+        """Test NDJSON export with one line per order item"""
+        response = requests.get(
+            f"{BASE_URL}/api/exports/orders?format=ndjson&flatten_items=true",
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        for row in rows[:20]:
+            assert "item_menu_item_name" in row
+            assert "items" not in row
+        print(f"✓ NDJSON export returned {len(rows)} item rows")
+    
+    def test_export_requires_staff(self):
+        """Test exports are not public"""
+        response = requests.get(f"{BASE_URL}/api/exports/orders")
+        assert response.status_code in [401, 403]
+        print("✓ Export requires authentication")
+
+
+class TestItemAnalytics:
+    """Test item-level sales and the day/hour heatmap"""
+    
+    @pytest.fixture
+    def admin_headers(self):
+        """Get admin authentication headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code == 200:
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+        pytest.skip("Admin login failed")
+    
+    def test_item_report(self, admin_headers):
+        """Test top sellers are ranked by quantity with category totals"""
+        response = requests.get(f"{BASE_URL}/api/reports/items?limit=5", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        quantities = [item["quantity"] for item in data["top_items"]]
+        assert quantities == sorted(quantities, reverse=True)
+        assert len(quantities) <= 5
+        assert round(sum(c["revenue"] for c in data["categories"]), 2) == round(data["total_revenue"], 2)
+        print(f"✓ Item report: {len(data['top_items'])} top items, {len(data['categories'])} categories")
+    
+    def test_heatmap_shape(self, admin_headers):
+        """Test heatmap is a 7 x 24 grid"""
+        response = requests.get(f"{BASE_URL}/api/reports/heatmap", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["orders"]) == 7
+        assert all(len(row) == 24 for row in data["orders"])
+        assert sum(data["orders_by_day"]) == sum(data["orders_by_hour"])
+        print(f"✓ Heatmap busiest slot: {data['busiest']}")
+
+
+class TestMenuPopularity:
+    """Test bestsellers and popularity sorting"""
+    
+    def test_bestsellers(self):
+        """Test bestsellers are ranked by quantity sold"""
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        response = requests.get(f"{BASE_URL}/api/menu/bestsellers?branch_id={branches[0]['id']}&limit=5")
+        assert response.status_code == 200
+        items = response.json()
+        assert len(items) <= 5
+        assert [item["rank"] for item in items] == list(range(1, len(items) + 1))
+        quantities = [item["quantity_sold"] for item in items]
+        assert quantities == sorted(quantities, reverse=True)
+        print(f"✓ Bestsellers: {[item['name'] for item in items]}")
+    
+    def test_menu_sort_popular(self):
+        """Test sort=popular returns the same items as the default order"""
+        default = requests.get(f"{BASE_URL}/api/menu/items").json()
+        response = requests.get(f"{BASE_URL}/api/menu/items?sort=popular&window=30")
+        assert response.status_code == 200
+        assert sorted(item["id"] for item in response.json()) == sorted(item["id"] for item in default)
+        print("✓ Menu sorted by popularity")
+    
+    def test_invalid_window(self):
+        """Test only 7 and 30 day windows are accepted"""
+        response = requests.get(f"{BASE_URL}/api/menu/bestsellers?window=14")
+        assert response.status_code == 400
+        print("✓ Invalid window rejected")
+
+
+class TestMenuSearch:
+    """Test typo-tolerant menu search"""
+    
+    def test_search_by_name(self):
+        """Test an exact dish name is the top result"""
+        menu_items = requests.get(f"{BASE_URL}/api/menu/items").json()
+        if not menu_items:
+            pytest.skip("No menu items available")
+        name = menu_items[0]["name"]
+        response = requests.get(f"{BASE_URL}/api/menu/search", params={"q": name})
+        assert response.status_code == 200
+        results = response.json()
+        assert results and results[0]["name"].lower() == name.lower()
+        print(f"✓ Search for '{name}' returned {len(results)} results")
+    
+    def test_search_tolerates_typos_and_prefixes(self):
+        """Test misspelt and partial queries still match"""
+        for query in ["biriyani", "chiken", "bir"]:
+            response = requests.get(f"{BASE_URL}/api/menu/search", params={"q": query})
+            assert response.status_code == 200
+            print(f"✓ '{query}': {[item['name'] for item in response.json()[:3]]}")
+    
+    def test_search_no_match(self):
+        """Test unrelated queries return nothing"""
+        response = requests.get(f"{BASE_URL}/api/menu/search", params={"q": "qqqxxzz"})
+        assert response.status_code == 200
+        assert response.json() == []
+        print("✓ Unmatched search returned no results")
+
+
+class TestBootstrap:
+    """Test the single-request landing page bootstrap"""
+    
+    def test_bootstrap_default_branch(self):
+        """Test bootstrap returns branches, menu, tables and delivery status"""
+        response = requests.get(f"{BASE_URL}/api/bootstrap")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ["branch_id", "branches", "categories", "menu_items", "tables", "delivery_available"]:
+            assert key in data
+        assert data["branch_id"] == data["branches"][0]["id"]
+        for table in data["tables"]:
+            assert table["branch_id"] == data["branch_id"]
+        print(f"✓ Bootstrap: {len(data['menu_items'])} items, {len(data['tables'])} tables")
+    
+    def test_bootstrap_etag(self):
+        """Test an unchanged bootstrap revalidates with 304"""
+        response = requests.get(f"{BASE_URL}/api/bootstrap")
+        etag = response.headers["ETag"]
+        branch_id = response.json()["branch_id"]
+        response = requests.get(f"{BASE_URL}/api/bootstrap?branch_id={branch_id}", headers={"If-None-Match": etag})
+        assert response.status_code in [200, 304]  # 200 if a table or partner changed in between
+        print(f"✓ Revalidation returned {response.status_code}")
+    
+    def test_bootstrap_unknown_branch(self):
+        """Test unknown branches return 404"""
+        response = requests.get(f"{BASE_URL}/api/bootstrap?branch_id=nonexistent-branch-id")
+        assert response.status_code == 404
+        print("✓ Unknown branch returned 404")
+
+
+class TestCompression:
+    """Test response compression and cached payload revalidation"""
+    
+    def test_menu_gzip(self):
+        """Test the menu is served gzip-compressed when accepted"""
+        response = requests.get(f"{BASE_URL}/api/menu/items", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("Vary", "")
+        assert len(response.json()) > 0
+        print(f"✓ Menu sent gzip-compressed ({response.headers.get('Content-Length')} bytes)")
+    
+    def test_menu_identity(self):
+        """Test clients without compression get the plain body"""
+        response = requests.get(f"{BASE_URL}/api/menu/items", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+        print("✓ Menu sent uncompressed for identity")
+    
+    def test_categories_revalidate(self):
+        """Test an unchanged category list revalidates with 304"""
+        response = requests.get(f"{BASE_URL}/api/menu/categories")
+        etag = response.headers["ETag"]
+        response = requests.get(f"{BASE_URL}/api/menu/categories", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        print("✓ Categories revalidated with 304")
+
+
+class TestConditionalGet:
+    """Test ETag/Last-Modified revalidation on read-mostly endpoints"""
+    
+    @pytest.mark.parametrize("path", ["/api/branches", "/api/menu/categories", "/api/menu/items", "/api/offers"])
+    def test_if_none_match(self, path):
+        """Test a repeated request with the ETag returns 304"""
+        response = requests.get(f"{BASE_URL}{path}")
+        assert response.status_code == 200
+        assert "no-cache" in response.headers["Cache-Control"]
+        response = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+        print(f"✓ {path} revalidated with 304")
+    
+    def test_etag_changes_on_write(self):
+        """Test updating a menu item moves the menu ETag on"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = requests.get(f"{BASE_URL}/api/menu/items")
+        etag = response.headers["ETag"]
+        item = response.json()[0]
+        update = {k: item[k] for k in ["name", "description", "category_id", "base_price", "image_url",
+                                       "is_vegetarian", "is_available", "branch_ids"]}
+        requests.put(f"{BASE_URL}/api/menu/items/{item['id']}", json=update, headers=headers)
+        response = requests.get(f"{BASE_URL}/api/menu/items", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        print("✓ Menu ETag changed after an update")
+
+
+class TestOfferEvaluation:
+    """Test evaluating live offers against a cart"""
+    
+    def test_evaluate_offers(self):
+        """Test applicable offers are returned best first"""
+        branches = requests.get(f"{BASE_URL}/api/branches").json()
+        response = requests.post(f"{BASE_URL}/api/offers/evaluate", json={
+            "order_total": 1000,
+            "branch_id": branches[0]["id"]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        discounts = [offer["calculated_discount"] for offer in data["offers"]]
+        assert discounts == sorted(discounts, reverse=True)
+        if data["offers"]:
+            assert data["best_offer"] == data["offers"][0]
+            assert all(0 <= d <= 1000 for d in discounts)
+        live_ids = {offer["id"] for offer in requests.get(f"{BASE_URL}/api/offers?branch_id={branches[0]['id']}").json()}
+        assert {offer["id"] for offer in data["offers"]} <= live_ids
+        print(f"✓ {len(data['offers'])} offers apply to a ₹1000 cart")
+
+
+class TestCacheInvalidationBus:
+    """Test writes are published to the cache invalidation bus"""
+    
+    def test_write_publishes_invalidation(self):
+        """Test a branch update is counted as a published invalidation"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        update = {k: branch.get(k) for k in ["name", "address", "phone", "email", "latitude", "longitude", "is_active"]}
+        response = requests.put(f"{BASE_URL}/api/branches/{branch['id']}", json=update, headers=headers)
+        assert response.status_code == 200
+        metrics = requests.get(f"{BASE_URL}/metrics").text
+        assert 'cache_invalidations_published_total{collection="branches"}' in metrics
+        print("✓ Branch update published to the invalidation bus")
+
+
+class TestOrderViews:
+    """Test order list views and sparse fieldsets"""
+    
+    def test_summary_view(self):
+        """Test the summary view drops line items and counts them instead"""
+        response = requests.get(f"{BASE_URL}/api/orders?view=summary&limit=5")
+        assert response.status_code == 200
+        for order in response.json():
+            assert "items" not in order and "delivery_address" not in order
+            assert order["item_count"] >= 1
+        print("✓ Summary view returned without line items")
+    
+    def test_kitchen_view(self):
+        """Test the kitchen view keeps item names and quantities only"""
+        response = requests.get(f"{BASE_URL}/api/orders?view=kitchen&limit=5")
+        assert response.status_code == 200
+        for order in response.json():
+            assert "total" not in order and "customer_phone" not in order
+            assert all(set(item) == {"menu_item_name", "quantity"} for item in order["items"])
+        print("✓ Kitchen view returned item names and quantities")
+    
+    def test_fields(self):
+        """Test fields= returns only the requested fields plus id"""
+        response = requests.get(f"{BASE_URL}/api/orders?fields=status,total&limit=5")
+        assert response.status_code == 200
+        assert all(set(order) == {"id", "status", "total"} for order in response.json())
+        response = requests.get(f"{BASE_URL}/api/orders?fields=status,password")
+        assert response.status_code == 400
+        print("✓ fields= selected status and total")
+
+
+class TestOrderEvents:
+    """Test the append-only order event log"""
+    
+    def test_status_transitions_are_logged(self):
+        """Test creating and confirming an order appends two events in sequence"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        item = requests.get(f"{BASE_URL}/api/menu/items?branch_id={branch['id']}").json()[0]
+        after_seq = requests.get(
+            f"{BASE_URL}/api/order-events?branch_id={branch['id']}&limit=1000", headers=headers
+        ).json()["next_seq"]
+        
+        order = requests.post(f"{BASE_URL}/api/orders", json={
+            "customer_name": "TEST_Events Customer",
+            "customer_phone": "+91-9876543230",
+            "branch_id": branch["id"],
+            "order_type": "takeaway",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]}],
+            "payment_method": "cod"
+        }).json()
+        requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": "confirmed"}, headers=headers)
+        
+        time.sleep(3)  # events settle for up to 2s on a standalone mongod
+        response = requests.get(f"{BASE_URL}/api/order-events?branch_id={branch['id']}&after_seq={after_seq}", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        events = [event for event in data["events"] if event["order_id"] == order["id"]]
+        assert [(event["from"], event["to"]) for event in events] == [(None, "pending"), ("pending", "confirmed")]
+        assert events[1]["actor"]["role"] == "admin"
+        assert all(event["seq"] > after_seq for event in data["events"])
+        assert data["next_seq"] == data["events"][-1]["seq"]
+        print(f"✓ Order events logged up to seq {data['next_seq']}")
+
+
+class TestKitchenSLA:
+    """Test stage timestamps and kitchen SLA quantiles"""
+    
+    def test_stage_durations(self):
+        """Test an order moved to ready shows up in the SLA report"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        item = requests.get(f"{BASE_URL}/api/menu/items?branch_id={branch['id']}").json()[0]
+        order = requests.post(f"{BASE_URL}/api/orders", json={
+            "customer_name": "TEST_SLA Customer",
+            "customer_phone": "+91-9876543231",
+            "branch_id": branch["id"],
+            "order_type": "takeaway",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]}],
+            "payment_method": "cod"
+        }).json()
+        for status in ["confirmed", "preparing", "ready"]:
+            requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": status}, headers=headers)
+        
+        order = requests.get(f"{BASE_URL}/api/orders/{order['id']}").json()
+        assert set(order["status_timestamps"]) == {"pending", "confirmed", "preparing", "ready"}
+        
+        response = requests.get(
+            f"{BASE_URL}/api/reports/kitchen-sla?branch_id={branch['id']}&order_type=takeaway&bucket_hours=24",
+            headers=headers
+        )
+        assert response.status_code == 200
+        stage = response.json()["rows"][0]["stages"]["confirmed_to_ready"]
+        assert stage["count"] >= 1
+        assert stage["p50"] <= stage["p90"] <= stage["p95"]
+        assert requests.get(f"{BASE_URL}/api/reports/kitchen-sla?bucket_hours=5", headers=headers).status_code == 400
+        print(f"✓ confirmed → ready p95 {stage['p95']}s over {stage['count']} orders")
+
+
+class TestKitchenQueue:
+    """Test the server-side kitchen ticket queue"""
+    
+    def test_queue_follows_status(self):
+        """Test a new order joins the queue and batch totals, and leaves both when ready"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        item = requests.get(f"{BASE_URL}/api/menu/items?branch_id={branch['id']}").json()[0]
+        order = requests.post(f"{BASE_URL}/api/orders", json={
+            "customer_name": "TEST_Queue Customer",
+            "customer_phone": "+91-9876543232",
+            "branch_id": branch["id"],
+            "order_type": "takeaway",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 3,
+                       "unit_price": item["base_price"], "total_price": item["base_price"] * 3}],
+            "payment_method": "cod"
+        }).json()
+        
+        def queue():
+            response = requests.get(f"{BASE_URL}/api/kitchen/queue?branch_id={branch['id']}", headers=headers)
+            assert response.status_code == 200
+            return response.json()
+        
+        def pending(data):
+            return next((dish["quantity"] for dish in data["batch"] if dish["menu_item_id"] == item["id"]), 0)
+        
+        data = queue()
+        assert order["id"] in [ticket["id"] for ticket in data["tickets"]]
+        promised = [ticket["promised_at"] for ticket in data["tickets"]]
+        assert promised == sorted(promised)
+        before = pending(data)
+        assert before >= 3
+        
+        requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": "ready"}, headers=headers)
+        time.sleep(0.5)
+        data = queue()
+        ticket = next(ticket for ticket in data["tickets"] if ticket["id"] == order["id"])
+        assert ticket["status"] == "ready"
+        assert pending(data) == before - 3
+        
+        requests.put(f"{BASE_URL}/api/orders/{order['id']}/status", json={"status": "completed"}, headers=headers)
+        time.sleep(0.5)
+        assert order["id"] not in [ticket["id"] for ticket in queue()["tickets"]]
+        print(f"✓ Queue tracked {order['order_number']} from pending to completed")
+
+
+class TestFloorMap:
+    """Test table versions, since_version polling and compare-and-set writes"""
+    
+    def test_versioned_table_writes(self):
+        """Test a table write bumps its version and a stale expected_version is refused"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        table = requests.post(f"{BASE_URL}/api/tables", headers=headers, json={
+            "branch_id": branch["id"], "table_number": "TEST_F1", "capacity": 2
+        }).json()
+        
+        tables = requests.get(f"{BASE_URL}/api/tables?branch_id={branch['id']}").json()
+        floor_version = max(t["version"] for t in tables)
+        assert table["version"] <= floor_version
+        # Without transactions a window below since_version is sent again
+        response = requests.get(f"{BASE_URL}/api/tables?branch_id={branch['id']}&since_version={floor_version}")
+        assert response.status_code == 200
+        assert all(t["version"] <= floor_version for t in response.json())
+        
+        response = requests.put(f"{BASE_URL}/api/tables/{table['id']}/status", json={
+            "status": "cleaning", "expected_version": table["version"]
+        })
+        assert response.status_code == 200
+        assert response.json()["version"] > floor_version
+        
+        changed = requests.get(f"{BASE_URL}/api/tables?branch_id={branch['id']}&since_version={floor_version}").json()
+        changed = [t for t in changed if t["version"] > floor_version]
+        assert [t["id"] for t in changed] == [table["id"]]
+        
+        # A second waiter still holding the old version
+        response = requests.put(f"{BASE_URL}/api/tables/{table['id']}/status", json={
+            "status": "vacant", "expected_version": table["version"]
+        })
+        assert response.status_code == 409
+        assert requests.get(f"{BASE_URL}/api/tables?since_version=0").status_code == 400
+        print(f"✓ Table {table['table_number']} moved to version {changed[0]['version']}")
+
+
+class TestIdempotencyKeys:
+    """Test Idempotency-Key handling on order creation"""
+    
+    def test_retry_returns_first_order(self):
+        """Test a retried order with the same key is not placed twice"""
+        branch = requests.get(f"{BASE_URL}/api/branches").json()[0]
+        item = requests.get(f"{BASE_URL}/api/menu/items?branch_id={branch['id']}").json()[0]
+        order_data = {
+            "customer_name": "TEST_Idempotent Customer",
+            "customer_phone": "+91-9876543233",
+            "branch_id": branch["id"],
+            "order_type": "takeaway",
+            "items": [{"menu_item_id": item["id"], "menu_item_name": item["name"], "quantity": 1,
+                       "unit_price": item["base_price"], "total_price": item["base_price"]}],
+            "payment_method": "cod"
+        }
+        headers = {"Idempotency-Key": f"TEST_{uuid.uuid4()}"}
+        
+        first = requests.post(f"{BASE_URL}/api/orders", json=order_data, headers=headers)
+        retry = requests.post(f"{BASE_URL}/api/orders", json=order_data, headers=headers)
+        assert first.status_code == 200
+        assert retry.status_code == 200
+        assert retry.json()["id"] == first.json()["id"]
+        assert retry.headers.get("Idempotent-Replayed") == "true"
+        
+        response = requests.post(f"{BASE_URL}/api/orders", json={**order_data, "customer_phone": "+91-9876543234"}, headers=headers)
+        assert response.status_code == 422
+        print(f"✓ Retry returned order {first.json()['order_number']} again")
+
+
+
+class TestAnalyticsExtracts:
+    """Test incremental Parquet extracts of orders"""
+    
+    @pytest.fixture
+    def admin_headers(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json=ADMIN_CREDS)
+        if response.status_code != 200:
+            pytest.skip("Admin login failed")
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    def run_extract(self, headers):
+        response = requests.post(f"{BASE_URL}/api/analytics/extracts", headers=headers)
+        assert response.status_code == 202
+        for _ in range(60):
+            summary = requests.get(f"{BASE_URL}/api/analytics/extracts", headers=headers).json()
+            if not summary["running"]:
+                return summary
+            time.sleep(0.5)
+        pytest.fail("Extract did not finish")
+    
+    def test_extract_requires_admin(self):
+        """Test that only admins can start or inspect extracts"""
+        assert requests.post(f"{BASE_URL}/api/analytics/extracts").status_code in (401, 403)
+        assert requests.get(f"{BASE_URL}/api/analytics/extracts").status_code in (401, 403)
+        print("✓ Extracts refused without an admin token")
+    
+    def test_rerun_does_not_repeat_orders(self, admin_headers):
+        """Test that a second run only appends orders past the watermark"""
+        first = self.run_extract(admin_headers)
+        second = self.run_extract(admin_headers)
+        
+        if first["watermark"] and second["watermark"]:
+            assert (second["watermark"], second["watermark_id"]) >= (first["watermark"], first["watermark_id"])
+        rows = lambda summary: sum(p["rows"] for p in summary["partitions"] if p["dataset"] == "orders")
+        # Whatever the second run wrote was past the first run's watermark
+        assert rows(second) - rows(first) == second["last_run"]["orders"]
+        if second["watermark"] == first["watermark"] and second["watermark_id"] == first["watermark_id"]:
+            assert second["last_run"]["orders"] == 0
+        print(f"✓ Second extract appended {second['last_run']['orders']} orders")
+
+
 # Cleanup test data
 class TestCleanup:
     """Cleanup test data created during tests"""
@@ -98,7 +98,7 @@ const AdminDashboard = () => {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${API}/orders`, { headers });
+      const response = await axios.get(`${API}/orders?view=summary`, { headers });
       setOrders(response.data);
     } catch (error) {
       console.error('Failed to fetch orders:', error);
@@ -420,7 +420,7 @@ const AdminDashboard = () => {
                       </div>
                       <div className="text-right mr-4">
                         <p className="font-bold text-red-600">₹{order.total.toFixed(2)}</p>
-                        <p className="text-sm text-gray-600">{order.items.length} items</p>
+                        <p className="text-sm text-gray-600">{order.item_count} items</p>
                       </div>
                       <Badge className={getStatusColor(order.status)} data-testid={`order-status-${order.id}`}>
                         {order.status.replace('_', ' ')}
@@ -642,7 +642,7 @@ const AdminDashboard = () => {
                       </div>
                       <div className="flex justify-between items-center mt-3">
                         <div>
-                          <p className="text-sm text-gray-600 capitalize">{order.order_type.replace('_', ' ')} - {order.items.length} items</p>
+                          <p className="text-sm text-gray-600 capitalize">{order.order_type.replace('_', ' ')} - {order.item_count} items</p>
                         </div>
                         <p className="font-bold text-red-600 text-lg">₹{order.total.toFixed(2)}</p>
                       </div>
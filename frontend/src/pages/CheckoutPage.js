@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Button } from '@/components/ui/button';
@@ -8,6 +8,7 @@ import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { RadioGroup, RadioGroupItem } from '@/components/ui/radio-group';
 import { useToast } from '@/hooks/use-toast';
+import { randomId } from '@/lib/utils';
 import { Loader2, ArrowLeft, CreditCard, Banknote, AlertCircle } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
@@ -28,6 +29,8 @@ const CheckoutPage = () => {
   const [paymentMethod, setPaymentMethod] = useState('cod');
   const [loading, setLoading] = useState(false);
   const [errors, setErrors] = useState({});
+  // Reused while a placement fails without reaching the server, so a retry can't create a second order
+  const orderAttemptKey = useRef(null);
   const [razorpayLoaded, setRazorpayLoaded] = useState(false);
 
   // Load Razorpay script
@@ -126,11 +129,12 @@ const CheckoutPage = () => {
 
     try {
       // Create Razorpay order
+      // One Razorpay order per order, however often payment is retried
       const paymentOrderResponse = await axios.post(`${API}/payment/create-order`, {
         amount: Math.round(amount * 100), // Convert to paise
         currency: 'INR',
         order_id: orderId
-      });
+      }, { headers: { 'Idempotency-Key': orderId } });
 
       const options = {
         key: paymentOrderResponse.data.key_id,
@@ -231,7 +235,10 @@ const CheckoutPage = () => {
         payment_method: paymentMethod
       };
 
-      const response = await axios.post(`${API}/orders`, orderData);
+      orderAttemptKey.current = orderAttemptKey.current || randomId();
+      const response = await axios.post(`${API}/orders`, orderData, {
+        headers: { 'Idempotency-Key': orderAttemptKey.current }
+      });
       const order = response.data;
 
       if (paymentMethod === 'online') {
@@ -246,6 +253,10 @@ const CheckoutPage = () => {
         navigate('/order-tracking', { state: { orderId: order.id } });
       }
     } catch (error) {
+      if (error.response) {
+        // The server answered, so the next attempt is a new request
+        orderAttemptKey.current = null;
+      }
       toast({ 
         title: 'Order failed', 
         description: error.response?.data?.detail || 'Please try again', 
@@ -15,6 +15,7 @@ const KitchenDashboard = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
   const [orders, setOrders] = useState([]);
+  const [batch, setBatch] = useState([]);
   const [soundEnabled, setSoundEnabled] = useState(true);
   const [acknowledgedOrders, setAcknowledgedOrders] = useState(new Set());
   const [alertingOrders, setAlertingOrders] = useState(new Set());
@@ -108,19 +109,19 @@ const KitchenDashboard = () => {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${API}/orders?branch_id=${user.branch_id}`, { headers });
-      const activeOrders = response.data.filter(order => 
-        !['completed', 'cancelled'].includes(order.status)
-      );
+      // Active tickets arrive next-due first, with dish totals for batching
+      const response = await axios.get(`${API}/kitchen/queue?branch_id=${user.branch_id}`, { headers });
+      const { tickets, batch: pendingDishes } = response.data;
       
       // Check for new pending orders that haven't been acknowledged
-      activeOrders.forEach(order => {
+      tickets.forEach(order => {
         if (order.status === 'pending' && !acknowledgedOrders.has(order.id)) {
           startAlert(order.id);
         }
       });
 
-      setOrders(activeOrders);
+      setOrders(tickets);
+      setBatch(pendingDishes);
     } catch (error) {
       console.error('Failed to fetch orders:', error);
     }
@@ -352,6 +353,16 @@ const KitchenDashboard = () => {
       </header>
 
       <div className="container mx-auto px-4 py-8">
+        {batch.length > 0 && (
+          <div className="mb-6 flex flex-wrap gap-2" data-testid="batch-cook-summary">
+            {batch.map(dish => (
+              <Badge key={dish.menu_item_id} variant="outline" className="text-sm py-1 px-3 bg-white border-[#c59433]">
+                {dish.quantity} × {dish.menu_item_name}
+                <span className="ml-1 text-gray-500">({dish.orders} {dish.orders === 1 ? 'order' : 'orders'})</span>
+              </Badge>
+            ))}
+          </div>
+        )}
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6">
           {/* Pending Orders */}
           <div data-testid="pending-orders-section">
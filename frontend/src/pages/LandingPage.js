@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
@@ -33,6 +33,7 @@ const LandingPage = () => {
   const [showBackToTop, setShowBackToTop] = useState(false);
   const [activeCategory, setActiveCategory] = useState(null);
   const [openCategories, setOpenCategories] = useState({});
+  const bootstrapBranchId = useRef(null);
   const navigate = useNavigate();
   const { toast } = useToast();
 
@@ -174,8 +175,7 @@ const LandingPage = () => {
   };
 
   useEffect(() => {
-    fetchBranches();
-    fetchCategories();
+    fetchBootstrap();
   }, []);
 
   // Auto-detect location when branches are loaded
@@ -186,58 +186,30 @@ const LandingPage = () => {
   }, [branches]);
 
   useEffect(() => {
-    if (selectedBranch) {
-      fetchMenuItems(selectedBranch.id);
-      fetchTables(selectedBranch.id);
-      checkDeliveryAvailability(selectedBranch.id);
+    if (selectedBranch && selectedBranch.id !== bootstrapBranchId.current) {
+      fetchBootstrap(selectedBranch.id);
     }
   }, [selectedBranch]);
 
-  const fetchBranches = async () => {
+  // Branches, categories and the branch's menu, tables and delivery status in one request
+  const fetchBootstrap = async (branchId) => {
     try {
-      const response = await axios.get(`${API}/branches?is_active=true`);
-      setBranches(response.data);
-      if (response.data.length > 0) {
-        setSelectedBranch(response.data[0]);
+      const response = await axios.get(`${API}/bootstrap`, { params: branchId ? { branch_id: branchId } : {} });
+      const data = response.data;
+      bootstrapBranchId.current = data.branch_id;
+      setCategories(data.categories);
+      setMenuItems(data.menu_items);
+      setTables(data.tables);
+      setDeliveryAvailable(data.delivery_available);
+      if (!branchId) {
+        setBranches(data.branches);
+        const defaultBranch = data.branches.find(branch => branch.id === data.branch_id);
+        if (defaultBranch) {
+          setSelectedBranch(defaultBranch);
+        }
       }
     } catch (error) {
-      console.error('Failed to fetch branches:', error);
-    }
-  };
-
-  const fetchCategories = async () => {
-    try {
-      const response = await axios.get(`${API}/menu/categories`);
-      setCategories(response.data);
-    } catch (error) {
-      console.error('Failed to fetch categories:', error);
-    }
-  };
-
-  const fetchMenuItems = async (branchId) => {
-    try {
-      const response = await axios.get(`${API}/menu/items?branch_id=${branchId}`);
-      setMenuItems(response.data);
-    } catch (error) {
-      console.error('Failed to fetch menu items:', error);
-    }
-  };
-
-  const fetchTables = async (branchId) => {
-    try {
-      const response = await axios.get(`${API}/tables?branch_id=${branchId}`);
-      setTables(response.data);
-    } catch (error) {
-      console.error('Failed to fetch tables:', error);
-    }
-  };
-
-  const checkDeliveryAvailability = async (branchId) => {
-    try {
-      const response = await axios.get(`${API}/delivery-partners/availability/${branchId}`);
-      setDeliveryAvailable(response.data.available);
-    } catch (error) {
-      console.error('Failed to check delivery availability:', error);
+      console.error('Failed to fetch menu:', error);
       setDeliveryAvailable(false);
     }
   };
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useAuth } from '@/contexts/AuthContext';
 import { useNavigate } from 'react-router-dom';
@@ -18,6 +18,7 @@ const WaiterDashboard = () => {
   const [tables, setTables] = useState([]);
   const [orders, setOrders] = useState([]);
   const [selectedTable, setSelectedTable] = useState(null);
+  const floorVersion = useRef(null);
 
   const headers = { Authorization: `Bearer ${token}` };
 
@@ -33,8 +34,20 @@ const WaiterDashboard = () => {
 
   const fetchTables = async () => {
     try {
-      const response = await axios.get(`${API}/tables?branch_id=${user.branch_id}`, { headers });
-      setTables(response.data);
+      // After the first load, only ask for tables changed since the highest version seen
+      const since = floorVersion.current === null ? '' : `&since_version=${floorVersion.current}`;
+      const response = await axios.get(`${API}/tables?branch_id=${user.branch_id}${since}`, { headers });
+      const changed = response.data;
+      if (floorVersion.current === null) {
+        setTables(changed);
+      } else if (changed.length > 0) {
+        setTables(prev => {
+          const byId = new Map(changed.map(table => [table.id, table]));
+          const known = new Set(prev.map(table => table.id));
+          return [...prev.map(table => byId.get(table.id) || table), ...changed.filter(table => !known.has(table.id))];
+        });
+      }
+      floorVersion.current = Math.max(floorVersion.current ?? 0, ...changed.map(table => table.version));
     } catch (error) {
       console.error('Failed to fetch tables:', error);
     }
@@ -42,7 +55,7 @@ const WaiterDashboard = () => {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${API}/orders?branch_id=${user.branch_id}&order_type=dine_in`, { headers });
+      const response = await axios.get(`${API}/orders?branch_id=${user.branch_id}&order_type=dine_in&fields=order_number,customer_name,table_id,items,total,status`, { headers });
       setOrders(response.data);
     } catch (error) {
       console.error('Failed to fetch orders:', error);
@@ -53,12 +66,17 @@ const WaiterDashboard = () => {
     return orders.find(order => order.table_id === tableId && !['completed', 'cancelled'].includes(order.status));
   };
 
-  const handleMarkTableVacant = async (tableId) => {
+  const handleMarkTableVacant = async (table) => {
     try {
-      await axios.put(`${API}/tables/${tableId}/status`, { status: 'vacant' }, { headers });
+      await axios.put(`${API}/tables/${table.id}/status`, { status: 'vacant', expected_version: table.version }, { headers });
       toast({ title: 'Table marked vacant', description: 'Table is now available for new customers' });
       fetchTables();
     } catch (error) {
+      if (error.response?.status === 409) {
+        toast({ title: 'Table already updated', description: 'Someone else changed this table', variant: 'destructive' });
+        fetchTables();
+        return;
+      }
       toast({ title: 'Error', description: 'Failed to update table status', variant: 'destructive' });
     }
   };
@@ -135,7 +153,7 @@ const WaiterDashboard = () => {
                         className="mt-2 bg-green-500 hover:bg-green-600"
                         onClick={(e) => {
                           e.stopPropagation();
-                          handleMarkTableVacant(table.id);
+                          handleMarkTableVacant(table);
                         }}
                         data-testid={`mark-vacant-${table.id}`}
                       >